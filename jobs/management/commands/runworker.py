@@ -0,0 +1,113 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs import queue
+
+# Раз в сколько секунд возвращать зависшие задачи и чистить выполненные
+MAINTENANCE_INTERVAL = 60
+
+
+def _run_in_thread(job_id):
+    try:
+        return queue.run(job_id)
+    finally:
+        # Соединения с БД у каждого потока свои, закрываем свои
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Выполняет задачи фоновой очереди (jobs)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=4,
+                            help="Потоков в процессе; 0 - выполнять задачи "
+                                 "в основном потоке по одной")
+        parser.add_argument("--processes", type=int, default=1,
+                            help="Сколько процессов-воркеров запустить")
+        parser.add_argument("--poll", type=float, default=1.0,
+                            help="Пауза между опросами пустой очереди, с")
+        parser.add_argument("--once", action="store_true",
+                            help="Выполнить готовые задачи и завершиться")
+
+    def handle(self, *args, **options):
+        self.stopping = threading.Event()
+        handlers = {signum: signal.signal(signum, self.stop)
+                    for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            if options["processes"] > 1:
+                self.run_processes(options)
+            else:
+                self.work(options)
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+    def stop(self, signum, frame):
+        # Новые задачи не берём, начатые доделываем
+        self.stopping.set()
+
+    def run_processes(self, options):
+        # Дочерние процессы не должны делить соединения с родителем
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=self.work, args=(options,))
+                     for _ in range(options["processes"])]
+        for process in processes:
+            process.start()
+        try:
+            while any(process.is_alive() for process in processes):
+                if self.stopping.is_set():
+                    for process in processes:
+                        if process.is_alive():
+                            os.kill(process.pid, signal.SIGTERM)
+                for process in processes:
+                    process.join(timeout=0.5)
+        finally:
+            for process in processes:
+                process.join()
+
+    def work(self, options):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        threads = options["threads"]
+        executor = ThreadPoolExecutor(threads) if threads > 0 else None
+        in_flight = set()
+        self.results = Counter()
+        next_maintenance = 0
+        while not self.stopping.is_set():
+            if time.monotonic() >= next_maintenance:
+                queue.requeue_stale()
+                queue.purge()
+                next_maintenance = time.monotonic() + MAINTENANCE_INTERVAL
+            if executor is None:
+                job_ids = queue.claim(worker, 1)
+                self.count(map(queue.run, job_ids))
+            else:
+                job_ids = queue.claim(worker, threads - len(in_flight))
+                in_flight.update(executor.submit(_run_in_thread, job_id)
+                                 for job_id in job_ids)
+            if in_flight:
+                finished, in_flight = wait(in_flight, timeout=options["poll"],
+                                           return_when=FIRST_COMPLETED)
+                self.count(future.result() for future in finished)
+            elif not job_ids:
+                if options["once"]:
+                    break
+                self.stopping.wait(options["poll"])
+        if executor is not None:
+            self.count(future.result() for future in in_flight)
+            executor.shutdown()
+        self.stdout.write(f"Воркер {worker}: выполнено задач "
+                          f"{self.results[True]}, с ошибкой "
+                          f"{self.results[False]}")
+
+    def count(self, results):
+        self.results.update(results)
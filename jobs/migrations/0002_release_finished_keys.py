@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def release_keys(apps, schema_editor):
+    Job = apps.get_model("jobs", "Job")
+    Job.objects.filter(status__in=["done", "failed"]).exclude(
+        key=None).update(key=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(release_keys, migrations.RunPython.noop),
+    ]
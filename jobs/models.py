@@ -0,0 +1,51 @@
+from django.db import models
+
+
+class Job(models.Model):
+    """
+    Задача фоновой очереди. Очередь живёт в той же базе, что и данные:
+    задача, поставленная в транзакции запроса, появляется только вместе
+    с её результатом, а внешний брокер не нужен.
+    """
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = (
+        (QUEUED, "В очереди"),
+        (RUNNING, "Выполняется"),
+        (DONE, "Выполнена"),
+        (FAILED, "Не выполнена"),
+    )
+
+    # Путь к функции, помеченной jobs.queue.task
+    name = models.CharField("Задача", max_length=200)
+    args = models.TextField("Аргументы (JSON)", default="[]")
+    priority = models.SmallIntegerField("Приоритет", default=0,
+                                        help_text="Больше - раньше")
+    status = models.CharField("Состояние", max_length=10, choices=STATUSES,
+                              default=QUEUED)
+    # Повторная постановка задачи с тем же ключом ничего не добавляет,
+    # пока задача не завершена: при завершении ключ очищается
+    key = models.CharField("Ключ идемпотентности", max_length=200,
+                           unique=True, blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField("Попыток", default=0)
+    max_attempts = models.PositiveSmallIntegerField("Попыток не больше")
+    run_at = models.DateTimeField("Выполнить не раньше")
+    locked_by = models.CharField("Воркер", max_length=100, blank=True)
+    locked_at = models.DateTimeField("Взята в работу", blank=True, null=True)
+    last_error = models.TextField("Последняя ошибка", blank=True)
+    created = models.DateTimeField("Создана", auto_now_add=True)
+    finished = models.DateTimeField("Завершена", blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Выбор следующей задачи: очередь по приоритету и времени
+            models.Index(fields=["status", "priority", "run_at"],
+                         name="job_queue_idx"),
+            models.Index(fields=["status", "finished"],
+                         name="job_finished_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name}#{self.pk}"
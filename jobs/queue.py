@@ -0,0 +1,131 @@
+"""
+Очередь фоновых задач в таблице базы данных.
+
+Задача - обычная функция, помеченная декоратором task; в очередь она
+ставится вызовом enqueue(функция, *аргументы). Аргументы сохраняются в
+JSON, поэтому передавать нужно id, а не объекты моделей. Выполняет
+задачи команда runworker. Задача должна быть идемпотентной: если воркер
+упадёт посреди работы, она будет выполнена ещё раз.
+"""
+import json
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+def task(func):
+    """Разрешает ставить функцию в очередь под именем модуль.функция."""
+    func.job_name = f"{func.__module__}.{func.__qualname__}"
+    return func
+
+
+def enqueue(func, *args, priority=0, key=None, delay=0, max_attempts=None):
+    """
+    Ставит задачу в очередь и возвращает Job. Если задача с таким key ждёт
+    в очереди или выполняется, возвращает её. При JOBS_EAGER задача
+    выполняется сразу.
+    """
+    if settings.JOBS_EAGER:
+        func(*args)
+        return None
+    job = Job(name=func.job_name, args=json.dumps(args), priority=priority,
+              key=key, run_at=timezone.now() + timedelta(seconds=delay),
+              max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS)
+    if key is None:
+        job.save()
+        return job
+    while True:
+        try:
+            with transaction.atomic():
+                job.save()
+            return job
+        except IntegrityError:
+            job.pk = None
+            existing = Job.objects.filter(key=key).first()
+            if existing is not None:
+                return existing
+            # Задача с этим ключом успела завершиться и освободить его
+
+
+def claim(worker, limit):
+    """
+    Забирает до limit готовых к выполнению задач и возвращает их id.
+    Задача достаётся тому воркеру, чей условный UPDATE сработал первым.
+    """
+    now = timezone.now()
+    candidates = (Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+                  .order_by("-priority", "run_at", "id")
+                  .values_list("id", flat=True)[:limit * 2])
+    claimed = []
+    for job_id in candidates:
+        taken = Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker, locked_at=now,
+            attempts=F("attempts") + 1)
+        if taken:
+            claimed.append(job_id)
+            if len(claimed) == limit:
+                break
+    return claimed
+
+
+def _retry_delay(attempts):
+    # Экспоненциальная пауза: 10 с, 20 с, 40 с...
+    return timedelta(seconds=settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def run(job_id):
+    """Выполняет взятую задачу и записывает результат."""
+    job = Job.objects.get(id=job_id)
+    mine = Job.objects.filter(id=job_id, status=Job.RUNNING,
+                              locked_by=job.locked_by)
+    try:
+        func = import_string(job.name)
+        if getattr(func, "job_name", None) != job.name:
+            raise ImportError(f"{job.name} не помечена как задача")
+        func(*json.loads(job.args))
+    except Exception:
+        logger.exception("Задача %s завершилась ошибкой", job)
+        now = timezone.now()
+        if job.attempts >= job.max_attempts:
+            mine.update(status=Job.FAILED, finished=now, key=None,
+                        last_error=traceback.format_exc())
+        else:
+            mine.update(status=Job.QUEUED, locked_by="", locked_at=None,
+                        run_at=now + _retry_delay(job.attempts),
+                        last_error=traceback.format_exc())
+        return False
+    # Ключ освобождается: следующая постановка с ним - новая задача
+    mine.update(status=Job.DONE, finished=timezone.now(), key=None)
+    return True
+
+
+def requeue_stale():
+    """
+    Возвращает в очередь задачи, которые воркер взял и не завершил за
+    JOBS_LOCK_TIMEOUT секунд (например, процесс был убит).
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=Job.RUNNING,
+        locked_at__lt=now - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT))
+    stale.filter(attempts__gte=F("max_attempts")).update(
+        status=Job.FAILED, finished=now, key=None,
+        last_error="Воркер не ответил")
+    return stale.update(status=Job.QUEUED, locked_by="", locked_at=None,
+                        run_at=now)
+
+
+def purge():
+    """Удаляет выполненные задачи старше JOBS_KEEP_FINISHED дней."""
+    cutoff = timezone.now() - timedelta(days=settings.JOBS_KEEP_FINISHED)
+    return Job.objects.filter(status=Job.DONE, finished__lt=cutoff).delete()[0]
@@ -0,0 +1,115 @@
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from jobs import queue
+from jobs.models import Job
+
+CALLS = []
+
+
+@queue.task
+def record(value):
+    CALLS.append(value)
+
+
+@queue.task
+def explode():
+    raise RuntimeError("сбой")
+
+
+def not_a_task():
+    CALLS.append("не задача")
+
+
+def run_worker():
+    out = StringIO()
+    call_command("runworker", "--once", "--threads=0", stdout=out)
+    return out.getvalue()
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_worker_runs_jobs_by_priority(self):
+        queue.enqueue(record, "обычная")
+        queue.enqueue(record, "срочная", priority=10)
+        queue.enqueue(record, "отложенная", delay=3600)
+        self.assertIn("выполнено задач 2, с ошибкой 0", run_worker())
+        self.assertEqual(CALLS, ["срочная", "обычная"])
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 2)
+        self.assertEqual(json.loads(Job.objects.get(status=Job.QUEUED).args),
+                         ["отложенная"])
+
+    def test_idempotency_key(self):
+        first = queue.enqueue(record, 1, key="ключ")
+        second = queue.enqueue(record, 2, key="ключ")
+        self.assertEqual(first.pk, second.pk)
+        run_worker()
+        self.assertEqual(CALLS, [1])
+
+    def test_key_is_released_when_job_finishes(self):
+        """Ключ завершённой задачи не мешает поставить её снова"""
+        first = queue.enqueue(record, 1, key="ключ")
+        run_worker()
+        second = queue.enqueue(record, 2, key="ключ")
+        self.assertNotEqual(first.pk, second.pk)
+        run_worker()
+        self.assertEqual(CALLS, [1, 2])
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.key), (Job.DONE, None))
+
+    def test_key_released_during_enqueue(self):
+        """Задача завершилась между неудачной вставкой и её поиском"""
+        first = queue.enqueue(record, 1, key="ключ")
+        lookup = Job.objects.filter
+
+        def finish_first(*args, **kwargs):
+            lookup(pk=first.pk).update(status=Job.DONE, key=None)
+            return lookup(*args, **kwargs)
+
+        with mock.patch.object(Job.objects, "filter",
+                               side_effect=finish_first):
+            second = queue.enqueue(record, 2, key="ключ")
+        self.assertNotEqual(first.pk, second.pk)
+        self.assertEqual(Job.objects.get(key="ключ").pk, second.pk)
+
+    @override_settings(JOBS_MAX_ATTEMPTS=2)
+    def test_failed_job_is_retried_then_given_up(self):
+        job = queue.enqueue(explode)
+        run_worker()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn("RuntimeError: сбой", job.last_error)
+        self.assertGreater(job.run_at, timezone.now())
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        run_worker()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_only_marked_functions_run(self):
+        Job.objects.create(name="jobs.tests.test_queue.not_a_task",
+                           max_attempts=1, run_at=timezone.now())
+        run_worker()
+        self.assertEqual(CALLS, [])
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+
+    def test_stale_running_job_is_requeued(self):
+        job = queue.enqueue(record, "снова")
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.RUNNING, attempts=1,
+            locked_at=timezone.now() - timedelta(hours=1))
+        run_worker()
+        self.assertEqual(CALLS, ["снова"])
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_mode_runs_immediately(self):
+        self.assertIsNone(queue.enqueue(record, "сразу"))
+        self.assertEqual(CALLS, ["сразу"])
+        self.assertFalse(Job.objects.exists())
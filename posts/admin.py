@@ -1,5 +1,7 @@
 from django.contrib import admin
+from django.db.models.expressions import RawSQL
 
+from . import search
 from .models import Group, Post
 
 
@@ -9,6 +11,14 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
 
+    def get_search_results(self, request, queryset, search_term):
+        # Ищем по индексу FTS5 вместо LIKE '%...%' по всей таблице
+        match = search.match_expression(search_term)
+        if not match:
+            return queryset, False
+        return queryset.filter(
+            id__in=RawSQL(*search.matching_ids_sql(match))), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ("pk", "title", "description", "slug")
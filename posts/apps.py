@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = "posts"
+
+    def ready(self):
+        # Подключаем обработчики сигналов: ленты подписок поддерживаются
+        # при любом сохранении постов и подписок, а не только из views
+        from . import signals  # noqa: F401
@@ -0,0 +1,48 @@
+"""
+Архив старых постов.
+
+Почти все чтения приходятся на первые страницы лент, поэтому посты
+старше settings.POST_ARCHIVE_DAYS дней вместе с комментариями и строками
+поискового индекса переносятся из шардов в архив - отдельную базу
+settings.POST_ARCHIVE_DATABASE с теми же таблицами и теми же id. Горячие
+таблицы и их индексы перестают расти со временем.
+
+Ленты читают архив, только когда страница доходит до его границы
+(posts.shards.archive_boundary), страница поста находит пост в архиве
+сама. Архивные посты только читаются: редактировать и комментировать их
+нельзя.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import shards
+
+
+def cutoff(days=None):
+    """Посты, опубликованные раньше этого момента, уходят в архив."""
+    if days is None:
+        days = settings.POST_ARCHIVE_DAYS
+    return timezone.now() - timedelta(days=days)
+
+
+def archive_old_posts(days=None):
+    """
+    Переносит в архив посты старше days (по умолчанию POST_ARCHIVE_DAYS)
+    дней из всех шардов. Возвращает число перенесённых постов.
+    """
+    alias = shards.archive_alias()
+    if alias is None:
+        return 0
+    before = cutoff(days)
+    # Граница архива сдвигается до переноса: пока он идёт, ленты уже
+    # заглядывают в архив за постами старше before
+    boundary = max(shards.archive_boundary() or (), (before, 0))
+    cache.set(shards.ARCHIVE_BOUNDARY_KEY, boundary, None)
+    moved = sum(shards.move_posts(source, alias, pub_date__lt=before)
+                for source in settings.POST_SHARDS)
+    # Точную границу - самый новый пост архива - найдёт следующий читатель
+    cache.delete(shards.ARCHIVE_BOUNDARY_KEY)
+    return moved
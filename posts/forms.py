@@ -1,5 +1,8 @@
+from django import forms
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import ModelForm
 
+from . import uploads
 from .models import Comment, Post
 
 
@@ -8,6 +11,17 @@ class PostForm(ModelForm):
         model = Post
         fields = ["text", "group", "image"]
 
+    def clean_image(self):
+        # ImageField уже прочитал заголовок файла; декодирование и
+        # перекодирование - в пуле процессов с лимитами (posts.uploads)
+        image = self.cleaned_data["image"]
+        if not isinstance(image, UploadedFile):
+            return image
+        try:
+            return uploads.normalize(image)
+        except uploads.ImageRejected as error:
+            raise forms.ValidationError(str(error), code="invalid_image")
+
 
 class CommentForm(ModelForm):
     class Meta:
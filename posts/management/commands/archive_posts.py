@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import archive, shards
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ("Переносит посты старше POST_ARCHIVE_DAYS дней с комментариями "
+            "в архив (settings.POST_ARCHIVE_DATABASE). Запускайте по "
+            "расписанию, например раз в сутки")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int,
+                            help="Архивировать посты старше N дней вместо "
+                                 "POST_ARCHIVE_DAYS")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Только посчитать посты для архива")
+
+    def handle(self, *args, **options):
+        if shards.archive_alias() is None:
+            raise CommandError(
+                "Архив не настроен: POST_ARCHIVE_DATABASE")
+        if options["dry_run"]:
+            before = archive.cutoff(options["days"])
+            total = sum(Post.objects.using(alias).filter(
+                pub_date__lt=before).count()
+                for alias in settings.POST_SHARDS)
+            self.stdout.write(f"Постов для архива: {total}")
+            return
+        moved = archive.archive_old_posts(options["days"])
+        self.stdout.write(f"Перенесено в архив постов: {moved}")
@@ -0,0 +1,86 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from yatube.cache import SQLiteCache
+
+BACKENDS = ("locmem", "filebased", "sqlite")
+
+
+def _make_cache(name, directory):
+    params = {"OPTIONS": {"MAX_ENTRIES": 1000000}}
+    if name == "locmem":
+        return LocMemCache("bench", params)
+    if name == "filebased":
+        return FileBasedCache(os.path.join(directory, "filebased"), params)
+    return SQLiteCache(os.path.join(directory, "cache.sqlite3"), params)
+
+
+def _worker(name, directory, keys, operations, results):
+    """Имитирует воркер: get, а при промахе - «рендер» и set."""
+    cache = _make_cache(name, directory)
+    value = "x" * 2048
+    hits = 0
+    started = time.perf_counter()
+    for i in range(operations):
+        key = f"fragment:{i % keys}"
+        if cache.get(key) is not None:
+            hits += 1
+        else:
+            cache.set(key, value, 300)
+    results.put((hits, operations, time.perf_counter() - started))
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает SQLiteCache с LocMemCache и FileBasedCache: "
+            "скорость и долю попаданий при нескольких процессах")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=4)
+        parser.add_argument("--operations", type=int, default=5000,
+                            help="Операций на процесс")
+        parser.add_argument("--keys", type=int, default=500,
+                            help="Число различных ключей")
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context("fork")
+        self.stdout.write(
+            f"{'backend':<10} {'ops/s':>10} {'hit ratio':>10} "
+            f"{'incr ops/s':>11}")
+        for name in BACKENDS:
+            directory = tempfile.mkdtemp()
+            try:
+                results = context.Queue()
+                processes = [
+                    context.Process(target=_worker, args=(
+                        name, directory, options["keys"],
+                        options["operations"], results))
+                    for _ in range(options["processes"])]
+                for process in processes:
+                    process.start()
+                stats = [results.get() for _ in processes]
+                for process in processes:
+                    process.join()
+                hits = sum(hits for hits, _, _ in stats)
+                operations = sum(total for _, total, _ in stats)
+                elapsed = max(seconds for _, _, seconds in stats)
+                self.stdout.write(
+                    f"{name:<10} {operations / elapsed:>10.0f} "
+                    f"{hits / operations:>10.1%} "
+                    f"{self.bench_incr(name, directory):>11.0f}")
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def bench_incr(self, name, directory):
+        cache = _make_cache(name, directory)
+        cache.set("counter", 0)
+        started = time.perf_counter()
+        for _ in range(2000):
+            cache.incr("counter")
+        return 2000 / (time.perf_counter() - started)
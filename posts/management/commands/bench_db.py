@@ -0,0 +1,133 @@
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.db.models import F
+
+from posts.management.commands.bench_views import percentile
+from posts.models import Comment, Post
+
+# Профили соединения: как было (каждый запрос открывает файл, журнал
+# отката, BEGIN) и настройки из yatube.db
+PROFILES = {
+    "default": {"ENGINE": "django.db.backends.sqlite3", "CONN_MAX_AGE": 0,
+                "journal_mode": "DELETE"},
+    "yatube.db": {"ENGINE": "yatube.db", "CONN_MAX_AGE": None,
+                  "journal_mode": "WAL"},
+}
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает настройки SQLite под одновременным чтением и "
+            "записью: потоки-читатели запрашивают страницу ленты, "
+            "потоки-писатели добавляют комментарии, как add_comment. "
+            "Замер идёт на копии текущей базы")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--writers", type=int, default=2)
+        parser.add_argument("--seconds", type=float, default=5)
+
+    def handle(self, *args, **options):
+        self.post_ids = list(Post.objects.order_by("-id").values_list(
+            "id", "author_id")[:1000])
+        if not self.post_ids:
+            raise CommandError("База пуста: заполните её командой seed")
+        directory = tempfile.mkdtemp()
+        try:
+            self.stdout.write(
+                f"{'profile':<10} {'reads/s':>9} {'read p99, ms':>13} "
+                f"{'writes/s':>9} {'write p99, ms':>14} {'errors':>7}")
+            for name, profile in PROFILES.items():
+                path = os.path.join(directory, f"{name}.sqlite3")
+                self.copy_database(path, profile["journal_mode"])
+                alias = f"bench_{name}"
+                connections.databases[alias] = {
+                    "ENGINE": profile["ENGINE"], "NAME": path,
+                    "CONN_MAX_AGE": profile["CONN_MAX_AGE"]}
+                try:
+                    self.report(name, self.run(alias, options))
+                finally:
+                    del connections.databases[alias]
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def copy_database(self, path, journal_mode):
+        source = connections["default"]
+        source.ensure_connection()
+        target = sqlite3.connect(path)
+        try:
+            source.connection.backup(target)
+            target.execute(f"PRAGMA journal_mode = {journal_mode}")
+        finally:
+            target.close()
+
+    def run(self, alias, options):
+        deadline = time.monotonic() + options["seconds"]
+        results = {"read": [], "write": [], "errors": []}
+        threads = [threading.Thread(target=self.worker,
+                                    args=(alias, kind, deadline, results))
+                   for kind, count in (("read", options["readers"]),
+                                       ("write", options["writers"]))
+                   for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results["seconds"] = options["seconds"]
+        return results
+
+    def read(self, alias):
+        # Первая страница ленты, как во view index
+        list(Post.objects.using(alias).for_feed()[:11])
+
+    def write(self, alias, rng):
+        # Те же записи, что делает add_comment с сигналами
+        post_id, author_id = rng.choice(self.post_ids)
+        with transaction.atomic(using=alias):
+            Comment.objects.using(alias).bulk_create(
+                [Comment(post_id=post_id, author_id=author_id,
+                         text="Комментарий из bench_db")])
+            Post.objects.using(alias).filter(pk=post_id).update(
+                comment_count=F("comment_count") + 1)
+
+    def worker(self, alias, kind, deadline, results):
+        rng = random.Random()
+        timings, errors = [], 0
+        connection = connections[alias]
+        try:
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    if kind == "read":
+                        self.read(alias)
+                    else:
+                        self.write(alias, rng)
+                except OperationalError:
+                    # "database is locked": запрос не выполнен
+                    errors += 1
+                else:
+                    timings.append((time.perf_counter() - started) * 1000)
+                # Конец «запроса»: так соединение закрывает request_finished
+                connection.close_if_unusable_or_obsolete()
+        finally:
+            connection.close()
+        results[kind].extend(timings)
+        results["errors"].append(errors)
+
+    def report(self, name, results):
+        rates, tails = [], []
+        for kind in ("read", "write"):
+            timings = sorted(results[kind])
+            rates.append(len(timings) / results["seconds"])
+            tails.append(percentile(timings, 0.99) if timings else 0)
+        self.stdout.write(
+            f"{name:<10} {rates[0]:>9.0f} {tails[0]:>13.2f} "
+            f"{rates[1]:>9.0f} {tails[1]:>14.2f} "
+            f"{sum(results['errors']):>7}")
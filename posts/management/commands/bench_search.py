@@ -0,0 +1,50 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.paginator import POSTS_PER_PAGE
+from posts.search import SearchPaginator
+
+
+def _timed(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает поиск по индексу FTS5 с поиском LIKE '%...%' "
+            "на текущей базе")
+
+    def add_arguments(self, parser):
+        parser.add_argument("terms", nargs="+", help="Поисковые запросы")
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Постов в базе: {Post.objects.count()}")
+        self.stdout.write(
+            f"{'запрос':<20} {'FTS5, мс':>10} {'LIKE, мс':>10} "
+            f"{'LIKE+COUNT, мс':>15}")
+        for term in options["terms"]:
+            def fts():
+                SearchPaginator(term, POSTS_PER_PAGE).get_page()
+
+            like = Post.objects.filter(text__icontains=term)
+
+            def like_page():
+                list(like[:POSTS_PER_PAGE + 1])
+
+            def like_admin():
+                # Так искала админка: страница плюс COUNT для счётчика
+                like.count()
+                list(like[:POSTS_PER_PAGE + 1])
+
+            self.stdout.write(
+                f"{term:<20} {_timed(fts, options['repeat']):>10.2f} "
+                f"{_timed(like_page, options['repeat']):>10.2f} "
+                f"{_timed(like_admin, options['repeat']):>15.2f}")
@@ -0,0 +1,158 @@
+import io
+import json
+import math
+import sys
+import time
+from urllib.parse import urlencode
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from posts.models import Follow, Group, Post, User, UserStats
+
+
+def percentile(timings, share):
+    """Процентиль методом ближайшего ранга по отсортированному списку."""
+    return timings[max(0, math.ceil(share * len(timings)) - 1)]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = ("Замеряет основные страницы через WSGI-приложение в этом же "
+            "процессе: p50/p95/p99 времени ответа и число SQL-запросов. "
+            "Печатает JSON, который удобно сравнивать между релизами. "
+            "Данные для замеров создаёт команда seed")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200,
+                            help="Замеров на страницу")
+        parser.add_argument("--warmup", type=int, default=20,
+                            help="Запросов перед замерами (кэши, соединения)")
+        parser.add_argument("--anonymous", action="store_true",
+                            help="Запросы анонимного посетителя: страницы "
+                                 "отдаются из кэша страниц")
+        parser.add_argument("--views", nargs="*",
+                            help="Только эти имена URL, например posts:index")
+        parser.add_argument("--output", help="Записать JSON в файл")
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1:
+            raise CommandError("--requests должно быть больше нуля")
+        self.application = get_wsgi_application()
+        targets = self.targets(options["anonymous"])
+        if options["views"]:
+            unknown = set(options["views"]) - set(targets)
+            if unknown:
+                raise CommandError(
+                    "Неизвестные страницы: " + ", ".join(sorted(unknown)))
+            targets = {name: targets[name] for name in options["views"]}
+        self.cookie = "" if options["anonymous"] else self.login()
+        counter = QueryCounter()
+        results = {}
+        with connection.execute_wrapper(counter):
+            for name, url in targets.items():
+                results[name] = self.measure(url, counter, options)
+        report = {
+            "dataset": {"users": User.objects.count(),
+                        "posts": Post.objects.count(),
+                        "follows": Follow.objects.count()},
+            "anonymous": options["anonymous"],
+            "requests": options["requests"],
+            "views": results,
+        }
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+    def targets(self, anonymous):
+        """
+        Адреса замеров: профиль и пост самого популярного автора, лента
+        пользователя с наибольшим числом подписок, самая большая группа.
+        """
+        author = UserStats.objects.order_by("-followers").select_related(
+            "user").first()
+        if author is None or not author.user.posts.exists():
+            raise CommandError("База пуста: заполните её командой seed")
+        post = author.user.posts.order_by("-pub_date").first()
+        word = post.text.split()[0] if post.text.split() else "пост"
+        targets = {
+            "posts:index": reverse("posts:index"),
+            "posts:profile": reverse("posts:profile",
+                                     args=[author.user.username]),
+            "posts:post": reverse("posts:post",
+                                  args=[author.user.username, post.pk]),
+            "posts:search": (reverse("posts:search") + "?"
+                             + urlencode({"q": word})),
+        }
+        group = Group.objects.filter(posts__isnull=False).first()
+        if group is not None:
+            targets["posts:group-detail"] = reverse("posts:group-detail",
+                                                    args=[group.slug])
+        if not anonymous:
+            targets["posts:follow_index"] = reverse("posts:follow_index")
+        return targets
+
+    def login(self):
+        """Cookie сессии пользователя с наибольшим числом подписок."""
+        reader = UserStats.objects.order_by("-followings").first()
+        client = Client()
+        client.force_login(User.objects.get(pk=reader.user_id))
+        session = client.cookies[settings.SESSION_COOKIE_NAME].value
+        return f"{settings.SESSION_COOKIE_NAME}={session}"
+
+    def request(self, url):
+        path, _, query = url.partition("?")
+        environ = {"PATH_INFO": path, "QUERY_STRING": query,
+                   "HTTP_HOST": "localhost", "HTTP_COOKIE": self.cookie,
+                   "REMOTE_ADDR": "127.0.0.1", "wsgi.input": io.BytesIO(),
+                   "wsgi.errors": sys.stderr}
+        setup_testing_defaults(environ)
+        status = []
+
+        def start_response(response_status, headers, exc_info=None):
+            status.append(int(response_status.split()[0]))
+
+        response = self.application(environ, start_response)
+        try:
+            b"".join(response)
+        finally:
+            if hasattr(response, "close"):
+                response.close()
+        return status[0]
+
+    def measure(self, url, counter, options):
+        for _ in range(options["warmup"]):
+            self.request(url)
+        timings, queries, statuses = [], [], set()
+        for _ in range(options["requests"]):
+            counter.count = 0
+            started = time.perf_counter()
+            statuses.add(self.request(url))
+            timings.append((time.perf_counter() - started) * 1000)
+            queries.append(counter.count)
+        timings.sort()
+        return {
+            "url": url,
+            "status": sorted(statuses),
+            "p50_ms": round(percentile(timings, 0.50), 2),
+            "p95_ms": round(percentile(timings, 0.95), 2),
+            "p99_ms": round(percentile(timings, 0.99), 2),
+            "max_ms": round(timings[-1], 2),
+            "queries": max(queries),
+        }
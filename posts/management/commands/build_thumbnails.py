@@ -0,0 +1,52 @@
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post, Thumbnail
+
+
+class Command(BaseCommand):
+    help = ("Строит миниатюры картинок постов, у которых их нет или они "
+            "устарели (например, для постов, загруженных до фоновой сборки)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true",
+                            help="Перестроить миниатюры всех постов")
+        parser.add_argument("--chunk-size", type=int, default=500,
+                            help="Сколько постов проверять за раз")
+
+    def handle(self, *args, **options):
+        built = 0
+        for alias in settings.POST_SHARDS:
+            for images in self.chunks(alias, options["chunk_size"]):
+                for post_id in self.pending(images, options["all"]):
+                    thumbnails.generate(post_id)
+                    built += 1
+        self.stdout.write(f"Миниатюры построены для постов: {built}")
+
+    def chunks(self, alias, chunk_size):
+        """Картинки постов шарда {id: имя файла} порциями по возрастанию id."""
+        posts = (Post.objects.using(alias)
+                 .exclude(image="").exclude(image__isnull=True)
+                 .order_by("pk").values_list("pk", "image"))
+        last_id = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_id)[:chunk_size])
+            if not batch:
+                return
+            last_id = batch[-1][0]
+            yield dict(batch)
+
+    def pending(self, images, rebuild_all):
+        if rebuild_all:
+            return list(images)
+        # Миниатюры лежат в основной базе, а посты - в своём шарде, поэтому
+        # сверяем их в Python, а не соединением таблиц
+        ready = Counter(
+            post_id for post_id, source in Thumbnail.objects.filter(
+                post_id__in=images).values_list("post_id", "source")
+            if source == images[post_id])
+        variants = len(thumbnails.variants())
+        return [pk for pk in images if ready[pk] < variants]
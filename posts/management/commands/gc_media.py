@@ -0,0 +1,203 @@
+import os
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from sorl.thumbnail import default as thumbnail_default
+from sorl.thumbnail.images import ImageFile
+
+from posts import shards
+from posts.models import MediaFile, Post, Thumbnail
+from posts.storage import content_storage
+
+
+class Command(BaseCommand):
+    help = ("Удаляет файлы картинок и миниатюр, на которые больше ничего не "
+            "ссылается: освобождённые оригиналы, устаревшие миниатюры и "
+            "файлы, которых нет в базе. Файлы моложе --grace-hours не "
+            "трогает - на них ещё могут ссылаться закэшированные страницы")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Только показать, что будет удалено")
+        parser.add_argument("--grace-hours", type=float, default=24)
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help="Сколько файлов проверять одним запросом")
+        parser.add_argument("--rate", type=float, default=50,
+                            help="Не больше стольких удалений в секунду")
+
+    def handle(self, *args, **options):
+        self.dry_run = options["dry_run"]
+        self.batch_size = options["batch_size"]
+        self.interval = 1 / options["rate"] if options["rate"] > 0 else 0
+        self.last_delete = 0
+        self.cutoff = timezone.now() - timedelta(
+            hours=options["grace_hours"])
+        stale = self.drop_stale_thumbnails()
+        released = self.delete_released()
+        originals = self.sweep(content_storage, Post.image.field.upload_to,
+                               self.unreferenced_originals,
+                               self.delete_orphan)
+        thumbnails = self.sweep(
+            thumbnail_default.storage,
+            thumbnail_default.settings.THUMBNAIL_PREFIX,
+            self.unreferenced_thumbnails, self.delete_thumbnail)
+        verb = "Будет удалено" if self.dry_run else "Удалено"
+        self.stdout.write(
+            f"{verb}: устаревших миниатюр {stale}, освобождённых "
+            f"оригиналов {released}, файлов без ссылок {originals} "
+            f"в оригиналах и {thumbnails} в миниатюрах")
+
+    def throttle(self):
+        # Ограничиваем скорость удаления, чтобы не забить диск
+        wait = self.last_delete + self.interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self.last_delete = time.monotonic()
+
+    def drop_stale_thumbnails(self):
+        """
+        Строки миниатюр прежних картинок постов и миниатюр постов, которых
+        нет ни в одной базе с постами. Сами файлы удалит sweep(), когда на
+        них перестанут ссылаться. Пост может лежать в любом шарде или в
+        архиве, поэтому, как и build_thumbnails, сверяем в Python порциями.
+        """
+        rows = Thumbnail.objects.order_by("id").values_list(
+            "id", "post_id", "source")
+        dropped = 0
+        last_id = 0
+        while True:
+            batch = list(rows.filter(id__gt=last_id)[:self.batch_size])
+            if not batch:
+                return dropped
+            last_id = batch[-1][0]
+            post_ids = {post_id for _, post_id, _ in batch}
+            images = {}
+            for alias in shards.post_databases():
+                images.update(Post.objects.using(alias).filter(
+                    pk__in=post_ids).values_list("pk", "image"))
+            stale = [pk for pk, post_id, source in batch
+                     if images.get(post_id) != source]
+            if stale and not self.dry_run:
+                Thumbnail.objects.filter(pk__in=stale).delete()
+            dropped += len(stale)
+
+    def delete_released(self):
+        """
+        Оригиналы, на которые дольше grace-периода не ссылается ни один
+        пост.
+        """
+        released = MediaFile.objects.filter(
+            refs=0, released__lt=self.cutoff).order_by("name")
+        deleted = 0
+        last_name = ""
+        while True:
+            names = list(released.filter(name__gt=last_name).values_list(
+                "name", flat=True)[:self.batch_size])
+            if not names:
+                return deleted
+            last_name = names[-1]
+            for name in names:
+                if self.dry_run:
+                    self.stdout.write(name)
+                    deleted += 1
+                    continue
+                # Пауза - до удаления строки: пока ждём, картинку могут
+                # загрузить снова, и условие refs=0 это увидит
+                self.throttle()
+                row = MediaFile.objects.filter(name=name, refs=0,
+                                               released__lt=self.cutoff)
+                if self.delete_original(name, row):
+                    deleted += 1
+
+    def delete_original(self, name, row=None):
+        """
+        Удаляет оригинал (и сначала строку row), если на него ничего не
+        ссылается. Проверка и удаление файла идут в одной транзакции на
+        запись, как и media.hold() при сохранении файла: загрузка той же
+        картинки либо уже отметила файл, и он останется, либо увидит, что
+        файла нет, и запишет его заново.
+        """
+        with transaction.atomic():
+            if row is not None and not row.delete()[0]:
+                return False
+            if MediaFile.objects.filter(name=name).exists():
+                return False
+            refs = sum(Post.objects.using(alias).filter(image=name).count()
+                       for alias in shards.post_databases())
+            if refs:
+                # Счётчик разошёлся с постами: восстанавливаем его
+                MediaFile.objects.create(name=name, refs=refs)
+                return False
+            # Вместе с записью sorl удаляются и его миниатюры оригинала
+            thumbnail_default.kvstore.delete(
+                ImageFile(name, content_storage))
+            content_storage.delete(name)
+            return True
+
+    def walk(self, storage, directory):
+        """Имена файлов каталога хранилища, рекурсивно и по одному."""
+        if not storage.exists(directory):
+            return
+        directories, files = storage.listdir(directory)
+        for name in files:
+            yield os.path.join(directory, name).replace(os.sep, "/")
+        for name in directories:
+            yield from self.walk(storage, os.path.join(directory, name))
+
+    def sweep(self, storage, directory, unreferenced, delete):
+        """
+        Удаляет старые файлы каталога, на которые нет ссылок в базе;
+        delete(storage, name) удаляет файл и возвращает, удалён ли он.
+        """
+        deleted = 0
+        batch = []
+        for name in self.walk(storage, directory.rstrip("/")):
+            batch.append(name)
+            if len(batch) == self.batch_size:
+                deleted += self.delete_files(storage, unreferenced(batch),
+                                             delete)
+                batch = []
+        if batch:
+            deleted += self.delete_files(storage, unreferenced(batch), delete)
+        return deleted
+
+    def unreferenced_originals(self, names):
+        referenced = set()
+        for alias in shards.post_databases():
+            referenced.update(Post.objects.using(alias).filter(
+                image__in=names).values_list("image", flat=True))
+        referenced.update(MediaFile.objects.filter(name__in=names)
+                          .values_list("name", flat=True))
+        return [name for name in names if name not in referenced]
+
+    def unreferenced_thumbnails(self, names):
+        referenced = set(Thumbnail.objects.filter(image__in=names)
+                         .values_list("image", flat=True))
+        return [name for name in names if name not in referenced]
+
+    def delete_orphan(self, storage, name):
+        return self.delete_original(name)
+
+    def delete_thumbnail(self, storage, name):
+        # Иначе sorl считал бы миниатюру существующей и не построил заново
+        thumbnail_default.kvstore.delete(ImageFile(name, storage),
+                                         delete_thumbnails=False)
+        storage.delete(name)
+        return True
+
+    def delete_files(self, storage, names, delete):
+        deleted = 0
+        for name in names:
+            if storage.get_modified_time(name) >= self.cutoff:
+                continue
+            if self.dry_run:
+                self.stdout.write(name)
+                deleted += 1
+                continue
+            self.throttle()
+            if delete(storage, name):
+                deleted += 1
+        return deleted
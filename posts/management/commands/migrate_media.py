@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts import media, page_cache, shards
+from posts.models import Post, Thumbnail
+from posts.storage import content_storage, is_content_addressed
+
+
+class Command(BaseCommand):
+    help = ("Переносит картинки постов из плоского каталога posts/ в "
+            "хранилище с адресацией по содержимому. Сайт можно не "
+            "останавливать: пост переключается на новый файл отдельным "
+            "условным UPDATE, а старый файл остаётся до gc_media")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500,
+                            help="Сколько постов обрабатывать за раз")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Только показать, что будет перенесено")
+
+    def handle(self, *args, **options):
+        moved = missing = 0
+        for alias in shards.post_databases():
+            for posts in self.chunks(alias, options["chunk_size"]):
+                # Одинаковые старые файлы порции копируются один раз;
+                # в другой порции повторное копирование ничего не запишет
+                names = {}
+                for pk, old in posts:
+                    if old not in names:
+                        names[old] = self.store(old, options["dry_run"])
+                    new = names[old]
+                    if new is None:
+                        missing += 1
+                        continue
+                    if options["dry_run"]:
+                        self.stdout.write(f"{old} -> {new}")
+                        moved += 1
+                    elif self.switch(alias, pk, old, new):
+                        moved += 1
+        if moved and not options["dry_run"]:
+            page_cache.invalidate(page_cache.FEED)
+        self.stdout.write(f"Перенесено картинок постов: {moved}, "
+                          f"файлов не найдено: {missing}")
+
+    def chunks(self, alias, chunk_size):
+        """
+        Посты базы alias со старыми именами файлов, порциями по
+        возрастанию id.
+        """
+        posts = (Post.objects.using(alias)
+                 .exclude(image="").exclude(image__isnull=True)
+                 .order_by("id").values_list("id", "image"))
+        last_id = 0
+        while True:
+            batch = list(posts.filter(id__gt=last_id)[:chunk_size])
+            if not batch:
+                return
+            last_id = batch[-1][0]
+            yield [(pk, name) for pk, name in batch
+                   if not is_content_addressed(name)]
+
+    def store(self, old, dry_run):
+        if not content_storage.exists(old):
+            self.stderr.write(f"Файл не найден: {old}")
+            return None
+        with content_storage.open(old) as source:
+            if dry_run:
+                return content_storage.hashed_name(old, source)
+            return content_storage.save(old, source)
+
+    def switch(self, alias, pk, old, new):
+        # Условие image=old: если пост успели отредактировать, не трогаем
+        updated = Post.objects.using(alias).filter(pk=pk, image=old).update(
+            image=new, modified=timezone.now())
+        if not updated:
+            return False
+        Thumbnail.objects.filter(post_id=pk, source=old).update(source=new)
+        media.acquire(new)
+        media.release(old)
+        return True
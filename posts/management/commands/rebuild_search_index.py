@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts import search, shards
+
+
+class Command(BaseCommand):
+    help = "Пересобирает полнотекстовый индекс постов (FTS5)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database",
+                            help="Псевдоним базы данных; по умолчанию - "
+                                 "все шарды постов и архив")
+
+    def handle(self, *args, **options):
+        # Каждый шард хранит индекс своих постов
+        aliases = ([options["database"]] if options["database"]
+                   else shards.post_databases())
+        for alias in aliases:
+            search.rebuild(alias)
+        self.stdout.write("Поисковый индекс пересобран")
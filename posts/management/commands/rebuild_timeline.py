@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import timeline
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = "Пересобирает материализованную ленту подписок пользователей"
+
+    def add_arguments(self, parser):
+        parser.add_argument("usernames", nargs="*",
+                            help="Пользователи, чьи ленты пересобрать")
+        parser.add_argument("--all", action="store_true",
+                            help="Пересобрать ленты всех пользователей")
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            users = User.objects.all()
+        elif options["usernames"]:
+            users = User.objects.filter(username__in=options["usernames"])
+            missing = set(options["usernames"]) - set(
+                users.values_list("username", flat=True))
+            if missing:
+                raise CommandError(
+                    "Пользователи не найдены: " + ", ".join(sorted(missing)))
+        else:
+            raise CommandError("Укажите пользователей или --all")
+        count = 0
+        for user_id in users.values_list("id", flat=True).iterator():
+            timeline.rebuild(user_id)
+            count += 1
+        self.stdout.write(f"Пересобрано лент: {count}")
@@ -0,0 +1,87 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from posts import shards
+from posts.models import Comment, Follow, Post, User, UserStats
+
+
+def _counts(queryset, field, ids):
+    # order_by(): иначе Meta.ordering модели попадёт в GROUP BY
+    return dict(queryset.filter(**{f"{field}__in": ids}).order_by()
+                .values_list(field).annotate(n=Count("id"))
+                .values_list(field, "n"))
+
+
+class Command(BaseCommand):
+    help = ("Пересчитывает денормализованные счётчики пользователей "
+            "и комментариев к постам и исправляет расхождения")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000,
+                            help="Сколько пользователей обрабатывать за раз")
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        fixed = sum(self.recount_users(ids)
+                    for ids in self.chunks(User.objects, chunk_size))
+        self.stdout.write(f"Исправлено счётчиков пользователей: {fixed}")
+        # Комментарии лежат в шарде своего поста
+        fixed = sum(self.recount_posts(alias, ids)
+                    for alias in shards.post_databases()
+                    for ids in self.chunks(Post.objects.using(alias),
+                                           chunk_size))
+        self.stdout.write(f"Исправлено счётчиков комментариев: {fixed}")
+
+    def chunks(self, manager, chunk_size):
+        """Первичные ключи таблицы порциями по возрастанию."""
+        last_id = 0
+        while True:
+            ids = list(manager.filter(id__gt=last_id).order_by("id")
+                       .values_list("id", flat=True)[:chunk_size])
+            if not ids:
+                return
+            last_id = ids[-1]
+            yield ids
+
+    @transaction.atomic
+    def recount_users(self, ids):
+        posts = Counter()
+        for alias in shards.post_databases():
+            posts.update(_counts(Post.objects.using(alias), "author_id", ids))
+        followers = _counts(Follow.objects, "author_id", ids)
+        followings = _counts(Follow.objects, "user_id", ids)
+        existing = UserStats.objects.select_for_update().in_bulk(ids)
+        changed, created = [], []
+        for user_id in ids:
+            actual = {"posts": posts.get(user_id, 0),
+                      "followers": followers.get(user_id, 0),
+                      "followings": followings.get(user_id, 0)}
+            stats = existing.get(user_id)
+            if stats is None:
+                created.append(UserStats(user_id=user_id, **actual))
+            elif any(getattr(stats, field) != value
+                     for field, value in actual.items()):
+                for field, value in actual.items():
+                    setattr(stats, field, value)
+                changed.append(stats)
+        UserStats.objects.bulk_create(created, ignore_conflicts=True)
+        UserStats.objects.bulk_update(changed, ["posts", "followers",
+                                                "followings"])
+        return len(changed) + len(created)
+
+    def recount_posts(self, alias, ids):
+        posts = Post.objects.using(alias)
+        with transaction.atomic(using=alias):
+            comments = _counts(Comment.objects.using(alias), "post_id", ids)
+            changed = []
+            for post in posts.select_for_update().filter(
+                    id__in=ids).only("id", "comment_count"):
+                actual = comments.get(post.id, 0)
+                if post.comment_count != actual:
+                    post.comment_count = actual
+                    changed.append(post)
+            posts.bulk_update(changed, ["comment_count"])
+        return len(changed)
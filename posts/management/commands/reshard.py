@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import shards
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = ("Переносит посты авторов вместе с комментариями в их шард из "
+            "settings.POST_SHARDS. Без аргументов - всех авторов, чей шард "
+            "не совпадает с правилом размещения (например, после "
+            "добавления шарда)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("usernames", nargs="*",
+                            help="Перенести только этих авторов")
+        parser.add_argument("--to", help="Шард, куда перенести авторов")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Только показать, кого нужно перенести")
+
+    def handle(self, *args, **options):
+        target = options["to"]
+        if target is not None:
+            if target not in settings.POST_SHARDS:
+                raise CommandError(f"Нет шарда {target} в POST_SHARDS")
+            if not options["usernames"]:
+                raise CommandError("С --to укажите авторов")
+        if not shards.is_sharded() and target is None:
+            raise CommandError("Шард один: перенести некуда")
+        shards.prepare()
+        users = User.objects.order_by("id")
+        if options["usernames"]:
+            users = users.filter(username__in=options["usernames"])
+        authors = posts = 0
+        for user_id, username in users.values_list("id", "username"):
+            destination = target or shards.home(user_id)
+            if shards.shard_for(user_id) == destination and target is None:
+                continue
+            authors += 1
+            if options["dry_run"]:
+                self.stdout.write(f"{username} -> {destination}")
+                continue
+            posts += shards.move(user_id, destination)
+        self.stdout.write(
+            f"Перенесено авторов: {authors}, постов: {posts}")
@@ -0,0 +1,230 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from posts import page_cache, search, shards
+from posts.models import (Comment, Follow, Group, Post, TimelineEntry, User,
+                          UserStats)
+
+WORDS = ("лента", "подписка", "пост", "автор", "группа", "картинка", "кэш",
+         "индекс", "запрос", "страница", "комментарий", "сервер", "база",
+         "очередь", "поиск", "миниатюра", "профиль", "новости", "город",
+         "погода", "музыка", "книга", "фильм", "путешествие", "код")
+
+
+@contextmanager
+def _explicit_dates(*models):
+    """
+    bulk_create, как и save(), заполняет поля auto_now и auto_now_add
+    текущим временем; на время заполнения базы даты задаём сами.
+    """
+    fields = [field for model in models for field in model._meta.fields
+              if getattr(field, "auto_now", False)
+              or getattr(field, "auto_now_add", False)]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = ("Заполняет базу синтетическими пользователями, постами, "
+            "подписками и комментариями для нагрузочных замеров "
+            "(bench_views). Популярность авторов неравномерна: у немногих "
+            "авторов большая часть подписчиков и постов")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--posts", type=int, default=10000)
+        parser.add_argument("--follows", type=int, default=20000)
+        parser.add_argument("--comments", type=int, default=0)
+        parser.add_argument("--groups", type=int, default=20)
+        parser.add_argument("--days", type=int, default=365,
+                            help="За сколько дней распределить посты")
+        parser.add_argument("--chunk-size", type=int, default=5000,
+                            help="Сколько строк вставлять за раз")
+        parser.add_argument("--seed", type=int, default=0,
+                            help="Зерно генератора: одинаковые параметры "
+                                 "дают одинаковые данные")
+        parser.add_argument("--skip-timelines", action="store_true",
+                            help="Не раскладывать посты по лентам подписок")
+
+    def handle(self, *args, **options):
+        if shards.is_sharded():
+            # bulk_create пишет посты в первый шард в обход карты авторов
+            raise CommandError("Заполните базу до подключения шардов и "
+                               "разнесите авторов командой reshard")
+        self.rng = random.Random(options["seed"])
+        self.chunk_size = options["chunk_size"]
+        self.create_users(options["users"])
+        self.user_ids = list(User.objects.order_by("id")
+                             .values_list("id", flat=True))
+        if len(self.user_ids) < 2:
+            raise CommandError("Нужно хотя бы два пользователя")
+        # Популярные авторы - случайные, а не первые по id
+        self.rng.shuffle(self.user_ids)
+        self.create_groups(options["groups"])
+        with _explicit_dates(Post, Comment):
+            self.create_posts(options["posts"], options["days"])
+            self.create_comments(options["comments"])
+        self.create_follows(options["follows"])
+        # bulk_create не отправляет сигналов: счётчики, ленты и поисковый
+        # индекс пересчитываем целиком
+        call_command("recount", chunk_size=self.chunk_size,
+                     stdout=self.stdout)
+        if not options["skip_timelines"]:
+            self.fill_timelines()
+        search.rebuild()
+        page_cache.invalidate(page_cache.FEED)
+        self.stdout.write(
+            f"В базе: пользователей {User.objects.count()}, постов "
+            f"{Post.objects.count()}, подписок {Follow.objects.count()}, "
+            f"комментариев {Comment.objects.count()}")
+
+    def insert(self, model, objects, **kwargs):
+        """Вставляет объекты порциями, по транзакции на порцию."""
+        chunk = []
+        for obj in objects:
+            chunk.append(obj)
+            if len(chunk) == self.chunk_size:
+                with transaction.atomic():
+                    model.objects.bulk_create(chunk, **kwargs)
+                chunk = []
+        if chunk:
+            with transaction.atomic():
+                model.objects.bulk_create(chunk, **kwargs)
+
+    def popular(self, skew):
+        """Случайный пользователь; чем больше skew, тем чаще первые."""
+        return self.user_ids[int(len(self.user_ids)
+                                 * self.rng.random() ** skew)]
+
+    def create_users(self, count):
+        start = User.objects.count()
+        # Хэш PBKDF2 на каждого пользователя занял бы часы; войти под
+        # такими пользователями по паролю нельзя
+        password = make_password(None)
+        self.insert(User, (User(username=f"user{start + number}",
+                                password=password)
+                           for number in range(count)),
+                    ignore_conflicts=True)
+
+    def create_groups(self, count):
+        start = Group.objects.count()
+        self.insert(Group, (Group(title=f"Группа {start + number}",
+                                  slug=f"group-{start + number}",
+                                  description="Группа для замеров")
+                            for number in range(count)),
+                    ignore_conflicts=True)
+        self.group_ids = list(Group.objects.values_list("id", flat=True))
+
+    def text(self, words):
+        return " ".join(self.rng.choice(WORDS) for _ in range(words))
+
+    def create_posts(self, count, days):
+        now = timezone.now()
+        start = now - timedelta(days=days)
+        step = (now - start) / max(count, 1)
+
+        def posts():
+            for number in range(count):
+                pub_date = start + step * number
+                group_id = None
+                if self.group_ids and self.rng.random() < 0.5:
+                    group_id = self.rng.choice(self.group_ids)
+                yield Post(text=self.text(self.rng.randint(5, 60)),
+                           author_id=self.popular(2), group_id=group_id,
+                           pub_date=pub_date, modified=pub_date)
+
+        self.insert(Post, posts())
+
+    def create_comments(self, count):
+        if not count:
+            return
+        post_ids = list(Post.objects.order_by("-id").values_list(
+            "id", flat=True))
+        if not post_ids:
+            return
+        now = timezone.now()
+
+        def comments():
+            for _ in range(count):
+                # Комментируют в основном свежие посты
+                post_id = post_ids[int(len(post_ids)
+                                       * self.rng.random() ** 3)]
+                yield Comment(post_id=post_id, author_id=self.popular(1),
+                              text=self.text(self.rng.randint(3, 20)),
+                              created=now)
+
+        self.insert(Comment, comments())
+
+    def quotas(self, count):
+        """Число подписок каждого пользователя; в сумме - count."""
+        limit = len(self.user_ids) - 1
+        mean = count / len(self.user_ids)
+        quotas = [min(limit, int(self.rng.expovariate(1 / mean)))
+                  if mean else 0 for _ in self.user_ids]
+        missing = count - sum(quotas)
+        if missing > limit * len(quotas) - sum(quotas):
+            raise CommandError("Подписок больше, чем пар пользователей")
+        while missing:
+            index = self.rng.randrange(len(quotas))
+            delta = 1 if missing > 0 else -1
+            if 0 <= quotas[index] + delta <= limit:
+                quotas[index] += delta
+                missing -= delta
+        return quotas
+
+    def authors(self, user_id, quota):
+        """quota разных авторов для подписок пользователя."""
+        if quota > len(self.user_ids) // 10:
+            # Почти все подряд: выборка с перекосом сходилась бы медленно
+            authors = set(self.rng.sample(self.user_ids, quota + 1))
+        else:
+            authors = set()
+            while len(authors) < quota + 1:
+                authors.add(self.popular(3))
+        authors.discard(user_id)
+        while len(authors) > quota:
+            authors.pop()
+        return authors
+
+    def create_follows(self, count):
+        def follows():
+            for user_id, quota in zip(self.user_ids, self.quotas(count)):
+                for author_id in self.authors(user_id, quota):
+                    yield Follow(user_id=user_id, author_id=author_id)
+
+        self.insert(Follow, follows(), ignore_conflicts=True)
+
+    def fill_timelines(self):
+        """
+        Раскладывает посты по лентам одним INSERT ... SELECT на порцию
+        подписчиков; авторов с большой аудиторией лента подмешивает при
+        чтении, их посты не раскладываются (см. posts.timeline).
+        """
+        sql = (
+            f"INSERT OR IGNORE INTO {TimelineEntry._meta.db_table} "
+            "(user_id, post_id, author_id, pub_date) "
+            "SELECT f.user_id, p.id, p.author_id, p.pub_date "
+            f"FROM {Follow._meta.db_table} f "
+            f"JOIN {Post._meta.db_table} p ON p.author_id = f.author_id "
+            f"JOIN {UserStats._meta.db_table} s ON s.user_id = f.author_id "
+            "WHERE s.followers <= %s AND f.user_id BETWEEN %s AND %s")
+        user_ids = sorted(self.user_ids)
+        for start in range(0, len(user_ids), self.chunk_size):
+            chunk = user_ids[start:start + self.chunk_size]
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql, [settings.FEED_FANOUT_MAX_FOLLOWERS,
+                                     chunk[0], chunk[-1]])
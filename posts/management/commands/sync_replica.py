@@ -0,0 +1,57 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from posts import page_cache
+from yatube import replica
+
+
+class Command(BaseCommand):
+    help = ("Копирует основную базу в реплику (settings.REPLICA_DATABASE). "
+            "С --interval работает постоянно и копирует базу, когда в ней "
+            "что-то изменилось")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float,
+                            help="Проверять изменения каждые N секунд")
+
+    def handle(self, *args, **options):
+        alias = replica.replica_alias()
+        if alias is None:
+            raise CommandError("Реплика не настроена: REPLICA_DATABASE")
+        interval = options["interval"]
+        if interval is None:
+            self.sync(alias)
+            return
+        if interval >= settings.REPLICA_PIN_SECONDS:
+            raise CommandError(
+                "--interval должен быть меньше REPLICA_PIN_SECONDS")
+        version = None
+        while True:
+            checked_at = time.time()
+            current = self.data_version()
+            if current != version:
+                self.sync(alias)
+                version = current
+            else:
+                # С прошлой копии базу не меняли: реплика совпадает с ней
+                # на момент проверки
+                cache.set(replica.SYNCED_KEY, checked_at, None)
+            time.sleep(interval)
+
+    def data_version(self):
+        # Меняется, когда базу изменяет любое другое соединение
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute("PRAGMA data_version")
+            return cursor.fetchone()[0]
+
+    def sync(self, alias):
+        started = time.perf_counter()
+        replica.sync(alias)
+        # Анонимные страницы, собранные с отстававшей реплики, устарели
+        page_cache.invalidate(page_cache.FEED)
+        self.stdout.write(
+            f"Реплика обновлена за {time.perf_counter() - started:.2f} с")
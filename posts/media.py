@@ -0,0 +1,59 @@
+"""
+Счётчики ссылок на файлы картинок постов (модель MediaFile).
+
+Одинаковые картинки хранятся один раз (posts.storage), поэтому удалить
+файл вместе с постом нельзя - на него могут ссылаться другие посты.
+Сигналы увеличивают и уменьшают счётчик, а файлы без ссылок удаляются
+отдельно, после паузы: закэшированные страницы ещё могут на них ссылаться.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import MediaFile
+
+
+def acquire(name):
+    """Добавляет ссылку на файл; файл без ссылок снова становится живым."""
+    if not name:
+        return
+    updated = MediaFile.objects.filter(name=name).update(
+        refs=F("refs") + 1, released=None)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            MediaFile.objects.create(name=name, refs=1)
+    except IntegrityError:
+        # Строку успел создать параллельный запрос
+        MediaFile.objects.filter(name=name).update(
+            refs=F("refs") + 1, released=None)
+
+
+def hold(name):
+    """
+    Отмечает файл, который сейчас сохраняется: строка без ссылок получает
+    свежее время освобождения (или создаётся), и gc_media не тронет файл
+    ещё grace-период - пока на него не сошлётся сохраняемый пост.
+    """
+    now = timezone.now()
+    if MediaFile.objects.filter(name=name, refs=0).update(released=now):
+        return
+    if MediaFile.objects.filter(name=name).exists():
+        return
+    try:
+        with transaction.atomic():
+            MediaFile.objects.create(name=name, refs=0, released=now)
+    except IntegrityError:
+        # Строку успел создать параллельный запрос
+        pass
+
+
+def release(name):
+    """Убирает ссылку на файл и отмечает время, когда ссылок не осталось."""
+    if not name:
+        return
+    MediaFile.objects.filter(name=name, refs__gt=0).update(
+        refs=F("refs") - 1)
+    MediaFile.objects.filter(name=name, refs=0, released=None).update(
+        released=timezone.now())
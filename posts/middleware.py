@@ -0,0 +1,17 @@
+from . import thumbnails
+
+
+class ThumbnailLookupsMiddleware:
+    """
+    Сообщает в заголовке X-Thumbnail-Lookups, сколько раз запрос обращался
+    к таблице миниатюр: для ленты ожидается не больше одного раза.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        thumbnails.reset_lookups()
+        response = self.get_response(request)
+        response["X-Thumbnail-Lookups"] = thumbnails.lookups()
+        return response
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.6 on 2026-10-18 01:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_stats(apps, schema_editor):
+    # Заводим счётчики для уже зарегистрированных пользователей
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+    Follow = apps.get_model("posts", "Follow")
+    Post = apps.get_model("posts", "Post")
+    UserStats = apps.get_model("posts", "UserStats")
+    UserStats.objects.bulk_create(
+        (UserStats(
+            user_id=user_id,
+            posts=Post.objects.filter(author_id=user_id).count(),
+            followers=Follow.objects.filter(author_id=user_id).count(),
+            followings=Follow.objects.filter(user_id=user_id).count())
+         for user_id in User.objects.values_list("id", flat=True)),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0011_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts', models.PositiveIntegerField(default=0, verbose_name='Записей')),
+                ('followers', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+                ('followings', models.PositiveIntegerField(default=0, verbose_name='Подписок')),
+            ],
+        ),
+        migrations.RunPython(create_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.6 on 2026-10-18 01:50
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+def count_comments(apps, schema_editor):
+    Comment = apps.get_model("posts", "Comment")
+    Post = apps.get_model("posts", "Post")
+    comments = (Comment.objects.filter(post_id=OuterRef("pk"))
+                .values("post_id").annotate(n=Count("id")).values("n"))
+    Post.objects.filter(comments__isnull=False).update(
+        comment_count=Subquery(comments))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_userstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментариев'),
+        ),
+        migrations.RunPython(count_comments, migrations.RunPython.noop),
+    ]
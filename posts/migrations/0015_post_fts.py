@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_modified'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                "CREATE VIRTUAL TABLE posts_post_fts USING fts5("
+                "text, tokenize='unicode61 remove_diacritics 2')",
+                "INSERT INTO posts_post_fts (rowid, text) "
+                "SELECT id, text FROM posts_post",
+            ],
+            reverse_sql="DROP TABLE posts_post_fts",
+            # Индекс постов: создаётся и в шардах (posts.shards)
+            hints={"model_name": "post"},
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.6 on 2026-10-18 02:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_post_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Thumbnail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('variant', models.CharField(max_length=32, verbose_name='Вариант')),
+                ('source', models.CharField(max_length=255, verbose_name='Исходный файл')),
+                ('image', models.ImageField(max_length=255, upload_to='', verbose_name='Миниатюра')),
+                ('width', models.PositiveIntegerField(verbose_name='Ширина')),
+                ('height', models.PositiveIntegerField(verbose_name='Высота')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='thumbnails', to='posts.Post')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='thumbnail',
+            constraint=models.UniqueConstraint(fields=('post', 'variant'), name='unique_post_thumbnail'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.6 on 2026-10-18 02:09
+
+from django.db import migrations, models
+from django.db.models import Count
+import posts.storage
+
+
+def count_refs(apps, schema_editor):
+    # Счётчики ссылок для уже загруженных картинок
+    MediaFile = apps.get_model("posts", "MediaFile")
+    Post = apps.get_model("posts", "Post")
+    refs = (Post.objects.exclude(image="").exclude(image__isnull=True)
+            .values("image").annotate(refs=Count("id")).order_by())
+    MediaFile.objects.bulk_create(
+        (MediaFile(name=row["image"], refs=row["refs"]) for row in refs),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_thumbnail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='Файл')),
+                ('refs', models.PositiveIntegerField(default=0, verbose_name='Ссылок')),
+                ('released', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Без ссылок с')),
+            ],
+        ),
+        # Хранилище на схему не влияет, а SQLite при AlterField пересоздал
+        # бы всю таблицу постов - меняем только состояние моделей
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='post',
+                name='image',
+                field=models.ImageField(blank=True, help_text='Загрузить изображение', null=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Изображение'),
+            ),
+        ]),
+        migrations.RunPython(count_refs, migrations.RunPython.noop),
+    ]
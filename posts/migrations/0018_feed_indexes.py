@@ -0,0 +1,91 @@
+# Generated by Django 2.2.6 on 2026-10-18 02:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Внешние ключи, чьи одиночные индексы больше не нужны
+REDUNDANT = [("comment", "post"), ("follow", "author"), ("post", "author"),
+             ("post", "group")]
+
+
+def drop_fk_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    for model_name, field_name in REDUNDANT:
+        model = apps.get_model("posts", model_name)
+        column = model._meta.get_field(field_name).column
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, model._meta.db_table)
+        for name, info in constraints.items():
+            if (info["index"] and not info["unique"]
+                    and info["columns"] == [column]):
+                schema_editor.execute(
+                    schema_editor._delete_index_sql(model, name))
+
+
+def create_fk_indexes(apps, schema_editor):
+    for model_name, field_name in REDUNDANT:
+        model = apps.get_model("posts", model_name)
+        schema_editor.execute(schema_editor._create_index_sql(
+            model, [model._meta.get_field(field_name)]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_mediafile'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created'], name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['author', 'user'], name='follow_author_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', 'pub_date'], name='post_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', 'pub_date'], name='post_group_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['pub_date', 'id'], name='post_pub_date_id_idx'),
+        ),
+        # Составные индексы выше начинаются с тех же столбцов, что и
+        # индексы внешних ключей, и заменяют их. AlterField на SQLite
+        # пересоздал бы таблицы целиком - удаляем только сами индексы
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='comment',
+                    name='post',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='posts.Post'),
+                ),
+                migrations.AlterField(
+                    model_name='follow',
+                    name='author',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='following', to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.AlterField(
+                    model_name='post',
+                    name='author',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='posts', to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.AlterField(
+                    model_name='post',
+                    name='group',
+                    field=models.ForeignKey(blank=True, db_index=False, help_text='Выберите группу', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='posts', to='posts.Group', verbose_name='Группа'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(drop_fk_indexes, create_fk_indexes),
+            ],
+        ),
+    ]
@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .storage import content_storage
+
 User = get_user_model()
 
 
@@ -14,51 +17,239 @@ class Group(models.Model):
         return self.title
 
 
+def _in_remote_shard(queryset):
+    """
+    Запрос идёт в шард или архив, где нет таблиц пользователей и групп
+    (первый шард из POST_SHARDS - сама основная база).
+    """
+    return queryset.db in (*settings.POST_SHARDS[1:],
+                           settings.POST_ARCHIVE_DATABASE)
+
+
+class ShardedCreateMixin:
+    def create(self, **kwargs):
+        """
+        Как QuerySet.create, но шард для нового объекта без явного using()
+        выбирает роутер по самому объекту (posts.shards.ShardRouter).
+        """
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True, using=self._db)
+        return obj
+
+
+class PostQuerySet(ShardedCreateMixin, models.QuerySet):
+    def for_feed(self):
+        """
+        Посты для лент: автор и группа загружаются тем же запросом, число
+        комментариев хранится в самом посте. Для постов из другого шарда и
+        архива автор и группа приходят отдельными запросами к основной
+        базе.
+        """
+        if _in_remote_shard(self):
+            return self.prefetch_related("author", "group")
+        return self.select_related("author", "group")
+
+
 class Post(models.Model):
     text = models.TextField("Текст", help_text="Текст статьи")
     pub_date = models.DateTimeField("Дата публикации", auto_now_add=True)
+    # Версия карточки поста: меняется при каждом сохранении и входит
+    # в ключ кэша фрагмента post_item.html
+    modified = models.DateTimeField("Дата изменения", auto_now=True)
+    # Отдельные индексы внешних ключей не нужны: их заменяют составные
+    # индексы из Meta.indexes, которые начинаются с тех же столбцов.
+    # Пользователи и группы живут только в основной базе, а пост - в шарде
+    # автора (posts.shards), поэтому ограничений внешнего ключа в базе нет
     author = models.ForeignKey(User, on_delete=models.CASCADE,
-                               related_name="posts")
+                               related_name="posts", db_index=False,
+                               db_constraint=False)
     group = models.ForeignKey(Group, verbose_name="Группа",
                               on_delete=models.SET_NULL,
                               blank=True, null=True, related_name="posts",
-                              help_text="Выберите группу")
+                              help_text="Выберите группу", db_index=False,
+                              db_constraint=False)
     image = models.ImageField(verbose_name="Изображение",
                               help_text="Загрузить изображение",
                               upload_to="posts/",
+                              storage=content_storage,
                               blank=True,
                               null=True)
+    # Денормализованное число комментариев: ленты выводят его без
+    # отдельного запроса на каждый пост
+    comment_count = models.PositiveIntegerField("Комментариев", default=0,
+                                                editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def is_archived(self):
+        """Пост перенесён в архив (posts.archive): он только читается."""
+        return self._state.db == settings.POST_ARCHIVE_DATABASE
+
     class Meta:
         ordering = ("-pub_date",)
+        # Ленты автора, группы и общая лента читаются по ключу
+        # (pub_date, id) по убыванию - без сортировки во временном B-дереве
+        indexes = [
+            models.Index(fields=["author", "pub_date"],
+                         name="post_author_pub_date_idx"),
+            models.Index(fields=["group", "pub_date"],
+                         name="post_group_pub_date_idx"),
+            models.Index(fields=["pub_date", "id"],
+                         name="post_pub_date_id_idx"),
+        ]
+
+
+class CommentManager(ShardedCreateMixin, models.Manager):
+    pass
 
 
 class Comment(models.Model):
+    # Комментарий хранится в шарде поста
     post = models.ForeignKey(Post, on_delete=models.CASCADE,
-                             related_name="comments")
+                             related_name="comments", db_index=False)
     author = models.ForeignKey(User, on_delete=models.CASCADE,
-                               related_name="comments")
+                               related_name="comments", db_constraint=False)
     text = models.TextField("Комментарий", help_text="Текст комментария")
     created = models.DateTimeField("Дата и время комментария",
                                    auto_now_add=True)
 
+    objects = CommentManager()
+
     def __str__(self):
         return self.text[:15]
 
     class Meta:
         ordering = ("-created",)
+        indexes = [
+            models.Index(fields=["post", "created"],
+                         name="comment_post_created_idx"),
+        ]
 
 
 class Follow(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE,
                              related_name="follower")
     author = models.ForeignKey(User, on_delete=models.CASCADE,
-                               related_name="following")
+                               related_name="following", db_index=False)
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=["user", "author"],
                                     name="unique_following"), ]
+        # Обратный индекс: подписчики автора
+        indexes = [
+            models.Index(fields=["author", "user"],
+                         name="follow_author_user_idx"),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """
+    Материализованная лента подписок: пост автора, на которого подписан
+    user. Заполняется при публикации поста (fan-out on write), поэтому
+    follow_index читает один диапазон индекса (user, pub_date) вместо
+    соединения постов с подписками.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name="timeline")
+    # Пост может лежать в другом шарде: записи удаляет сигнал удаления
+    # поста, а не каскад ORM
+    post = models.ForeignKey(Post, on_delete=models.DO_NOTHING,
+                             related_name="timeline_entries",
+                             db_constraint=False)
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name="+")
+    # Копия Post.pub_date: лента сортируется без обращения к постам
+    pub_date = models.DateTimeField("Дата публикации")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "post"],
+                                    name="unique_timeline_entry"), ]
+        indexes = [
+            models.Index(fields=["user", "pub_date", "post"],
+                         name="timeline_user_pub_date_idx"),
+            models.Index(fields=["user", "author"],
+                         name="timeline_user_author_idx"),
+        ]
+
+
+class UserStats(models.Model):
+    """
+    Счётчики пользователя для профиля и страницы поста. Поддерживаются
+    атомарными F()-обновлениями при создании и удалении постов и подписок,
+    поэтому страницы читают их одним запросом вместо трёх COUNT.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                primary_key=True, related_name="stats")
+    posts = models.PositiveIntegerField("Записей", default=0)
+    followers = models.PositiveIntegerField("Подписчиков", default=0)
+    followings = models.PositiveIntegerField("Подписок", default=0)
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+class Thumbnail(models.Model):
+    """
+    Готовая миниатюра картинки поста. Строится в фоне после сохранения
+    формы (posts.thumbnails), шаблоны только читают её и ничего не
+    генерируют во время запроса.
+    """
+    # Как и у TimelineEntry: пост может лежать в другом шарде
+    post = models.ForeignKey(Post, on_delete=models.DO_NOTHING,
+                             related_name="thumbnails", db_constraint=False)
+    # Имя варианта из posts.thumbnails.variants(), например "640.webp"
+    variant = models.CharField("Вариант", max_length=32)
+    # Картинка поста, из которой построена миниатюра
+    source = models.CharField("Исходный файл", max_length=255)
+    image = models.ImageField("Миниатюра", max_length=255)
+    width = models.PositiveIntegerField("Ширина")
+    height = models.PositiveIntegerField("Высота")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["post", "variant"],
+                                    name="unique_post_thumbnail"), ]
+
+    def __str__(self):
+        return f"{self.post_id}:{self.variant}"
+
+
+class MediaFile(models.Model):
+    """
+    Счётчик ссылок на файл картинки: одинаковые картинки хранятся один
+    раз (posts.storage), и файл можно удалить, только когда на него не
+    ссылается ни один пост. released - когда пропала последняя ссылка.
+    """
+    name = models.CharField("Файл", max_length=255, primary_key=True)
+    refs = models.PositiveIntegerField("Ссылок", default=0)
+    released = models.DateTimeField("Без ссылок с", blank=True, null=True,
+                                    db_index=True)
+
+    def __str__(self):
+        return self.name
+
+
+class AuthorShard(models.Model):
+    """
+    Карта шардов: в какой базе из POST_SHARDS лежат посты автора и
+    комментарии к ним. Автор без записи живёт в первом шарде.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                primary_key=True, related_name="shard")
+    shard = models.CharField("Шард", max_length=100)
+
+    def __str__(self):
+        return f"{self.user_id}:{self.shard}"
+
+
+class IdTicket(models.Model):
+    """
+    Выдача id постам и комментариям, когда шардов несколько: счётчик
+    AUTOINCREMENT этой таблицы общий для всех шардов, строки не хранятся.
+    """
@@ -0,0 +1,100 @@
+"""
+Кэш целых страниц для анонимных посетителей.
+
+Страница хранится под ключом из пути с query string и текущих версий
+тегов, от которых она зависит. Изменение поста, комментария или подписки
+выдаёт тегу новую версию - и все зависящие от него страницы перестают
+находиться в кэше. Ответы несут ETag и Last-Modified, поэтому повторный
+визит получает 304 Not Modified прямо из кэша, без вызова view.
+"""
+import hashlib
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                quote_etag)
+from django.utils.http import http_date
+from django.utils.timezone import now
+
+# Любой пост, комментарий или группа: от него зависят все ленты
+FEED = "feed"
+
+
+def user_tag(username, **kwargs):
+    """
+    Тег страниц пользователя: профиля и постов со счётчиками подписок.
+    Принимает аргументы view, поэтому годится в cache_anonymous_page.
+    """
+    return f"user:{username}"
+
+
+def _tag_key(tag):
+    return "page:tag:" + hashlib.md5(tag.encode()).hexdigest()
+
+
+def invalidate(*tags):
+    """Выдаёт тегам новые версии; зависящие страницы устаревают."""
+    cache.set_many({_tag_key(tag): uuid.uuid4().hex for tag in tags}, None)
+
+
+def _versions(tags):
+    keys = [_tag_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def _page_key(request, tags):
+    raw = "|".join([request.get_full_path(), *_versions(tags)])
+    return "page:" + hashlib.md5(raw.encode()).hexdigest()
+
+
+def _respond(request, entry):
+    response = HttpResponse(entry["content"],
+                            content_type=entry["content_type"])
+    response["ETag"] = entry["etag"]
+    response["Last-Modified"] = http_date(entry["last_modified"])
+    # Браузер каждый раз перепроверяет страницу по ETag и получает 304
+    patch_cache_control(response, max_age=0)
+    return get_conditional_response(
+        request, etag=entry["etag"], last_modified=entry["last_modified"],
+        response=response)
+
+
+def cache_anonymous_page(*tags):
+    """
+    Кэширует ответ view для анонимных GET/HEAD-запросов. Теги - строки
+    или функции от аргументов view, возвращающие строку.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (request.method not in ("GET", "HEAD")
+                    or request.user.is_authenticated):
+                return view(request, *args, **kwargs)
+            page_tags = [tag(**kwargs) if callable(tag) else tag
+                         for tag in tags]
+            key = _page_key(request, page_tags)
+            entry = cache.get(key)
+            if entry is None:
+                response = view(request, *args, **kwargs)
+                # Страницы с cookie (например, CSRF) общими быть не могут
+                if response.status_code != 200 or response.cookies:
+                    return response
+                entry = {
+                    "content": response.content,
+                    "content_type": response["Content-Type"],
+                    "etag": quote_etag(
+                        hashlib.md5(response.content).hexdigest()),
+                    "last_modified": int(now().timestamp()),
+                }
+                cache.set(key, entry, settings.PAGE_CACHE_TIMEOUT)
+            return _respond(request, entry)
+        return wrapper
+    return decorator
@@ -0,0 +1,135 @@
+import base64
+import binascii
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+POSTS_PER_PAGE = 10
+
+
+def encode_cursor(pub_date, pk):
+    """Упаковывает ключ записи (pub_date, id) в непрозрачный токен для URL."""
+    raw = f"{pub_date.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Распаковывает токен курсора; для испорченного токена вернёт None."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        pub_date, pk = raw.decode().split("|")
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+def keyset(queryset, keys, cursor, older):
+    """
+    Ограничивает queryset записями строго старше (older=True) или новее
+    курсора и сортирует их в направлении обхода.
+    """
+    first, second = keys
+    if cursor is not None:
+        op = "lt" if older else "gt"
+        # Первое условие - диапазон по ведущему полю индекса,
+        # второе отсекает совпадения внутри одной pub_date.
+        queryset = queryset.filter(
+            Q(**{f"{first}__{op}e": cursor[0]}),
+            Q(**{f"{first}__{op}": cursor[0]})
+            | Q(**{f"{second}__{op}": cursor[1]}),
+        )
+    prefix = "-" if older else ""
+    return queryset.order_by(f"{prefix}{first}", f"{prefix}{second}")
+
+
+class CursorPaginator(Paginator):
+    """
+    Постраничная навигация по ключу (pub_date, id) вместо OFFSET.
+
+    Каждая страница - это один запрос по индексу "от курсора" с LIMIT
+    per_page + 1, без COUNT(*), поэтому стоимость страницы не зависит от
+    того, насколько глубоко пролистана лента. Номеров страниц нет: шаблон
+    получает только курсоры next_cursor и previous_cursor.
+    """
+
+    def _check_object_list_is_ordered(self):
+        # Порядок задаёт keyset() по ключам курсора при каждой выборке,
+        # поэтому сортировка самого object_list не нужна
+        pass
+
+    def __init__(self, object_list, per_page, keys=("pub_date", "id")):
+        super().__init__(object_list, per_page)
+        self.keys = keys
+        self.next_cursor = None
+        self.previous_cursor = None
+        self._number = 1
+
+    @property
+    def num_pages(self):
+        # Page.has_next() и has_previous() сравнивают номер страницы
+        # с num_pages, поэтому номер и "число страниц" здесь условные:
+        # текущая страница вторая, если есть предыдущая, и не последняя,
+        # если есть следующая.
+        return self._number + 1 if self.next_cursor else self._number
+
+    def get_page(self, after=None, before=None):
+        """Страница после курсора after или перед курсором before."""
+        after, before = self._decode(after), self._decode(before)
+        if before is not None:
+            rows = self._fetch(before, older=False)
+            if len(rows) < self.per_page:
+                # Дошли до начала ленты - показываем первую страницу
+                return self.get_page()
+            has_more_newer = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return self._build_page(rows, has_previous=has_more_newer,
+                                    has_next=True)
+        rows = self._fetch(after, older=True)
+        return self._build_page(rows[:self.per_page],
+                                has_previous=after is not None,
+                                has_next=len(rows) > self.per_page)
+
+    def _fetch(self, cursor, older):
+        """
+        Выбирает до per_page + 1 записей от курсора: более старые при
+        older=True (по убыванию ключа) или более новые (по возрастанию).
+        """
+        queryset = keyset(self.object_list, self.keys, cursor, older)
+        return list(queryset[:self.per_page + 1])
+
+    def _key(self, row):
+        return tuple(getattr(row, key) for key in self.keys)
+
+    def _encode(self, key):
+        return encode_cursor(*key)
+
+    def _decode(self, token):
+        return decode_cursor(token)
+
+    def _load(self, rows):
+        """Превращает выбранные строки в объекты страницы."""
+        return rows
+
+    def _build_page(self, rows, has_previous, has_next):
+        self.previous_cursor = (
+            self._encode(self._key(rows[0]))
+            if rows and has_previous else None)
+        self.next_cursor = (
+            self._encode(self._key(rows[-1]))
+            if rows and has_next else None)
+        self._number = 2 if self.previous_cursor else 1
+        return Page(self._load(rows), self._number, self)
+
+
+def paginate(request, object_list, per_page=POSTS_PER_PAGE):
+    """Страница ленты по курсорам ?after= / ?before= из запроса."""
+    paginator = CursorPaginator(object_list, per_page)
+    return paginator.get_page(request.GET.get("after"),
+                              request.GET.get("before"))
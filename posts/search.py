@@ -0,0 +1,149 @@
+"""
+Полнотекстовый поиск по постам на SQLite FTS5.
+
+Индекс - отдельная таблица posts_post_fts с собственной копией текста,
+rowid в ней совпадает с id поста. Таблица не связана с posts_post
+триггерами: SQLite-бэкенд Django пересоздаёт posts_post при изменении
+полей в миграциях, и триггеры пропали бы вместе со старой таблицей.
+Поэтому индекс обновляют сигналы, а команда rebuild_search_index
+пересобирает его целиком.
+
+У каждого шарда (posts.shards) и архива свой индекс его постов; поиск
+опрашивает все эти базы и сливает результаты по рангу.
+"""
+import base64
+import heapq
+import re
+from itertools import islice
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from . import shards
+from .models import Post
+from .paginator import CursorPaginator
+
+TABLE = "posts_post_fts"
+BATCH_SIZE = 1000
+
+
+def match_expression(query):
+    """
+    Превращает пользовательский ввод в безопасное выражение MATCH: каждое
+    слово - отдельная фраза с поиском по префиксу, все слова обязательны.
+    """
+    words = re.findall(r"\w+", query)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def index_post(post, using="default"):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [post.pk])
+        cursor.execute(f"INSERT INTO {TABLE} (rowid, text) VALUES (%s, %s)",
+                       [post.pk, post.text])
+
+
+def unindex_post(post, using="default"):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [post.pk])
+
+
+def rebuild(using="default"):
+    """Пересобирает индекс по всем постам порциями по BATCH_SIZE."""
+    posts = Post.objects.using(using).order_by("id").values_list("id", "text")
+    # Одна транзакция: иначе каждая вставленная строка - отдельный коммит
+    with transaction.atomic(using), connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+        last_id = 0
+        while True:
+            batch = list(posts.filter(id__gt=last_id)[:BATCH_SIZE])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (rowid, text) VALUES (%s, %s)", batch)
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+
+
+def matching_ids_sql(match):
+    """Подзапрос id подходящих постов - для фильтра id__in в админке."""
+    return f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s", [match]
+
+
+class SearchPaginator(CursorPaginator):
+    """
+    Результаты поиска по релевантности (bm25, чем меньше - тем лучше) с
+    навигацией по ключу (rank, id), фильтры по группе и автору.
+    """
+
+    def __init__(self, query, per_page, group=None, author=None):
+        super().__init__((), per_page, keys=("rank", "id"))
+        self.match = match_expression(query)
+        self.group = group
+        self.author = author
+
+    def _fetch(self, cursor, older):
+        # Прямой обход (older=True) - по возрастанию ранга
+        if not self.match:
+            return []
+        # Архив ищется вместе с шардами: порядок по рангу не знает границы
+        # архива
+        aliases = shards.post_databases()
+        if self.author is not None:
+            aliases = [shards.shard_for(self.author.pk),
+                       *aliases[len(settings.POST_SHARDS):]]
+        streams = [self._fetch_shard(alias, cursor, older)
+                   for alias in aliases]
+        # Ранги bm25 разных шардов считаются по своей статистике слов, но
+        # для слияния их достаточно
+        return list(islice(heapq.merge(*streams, reverse=not older),
+                           self.per_page + 1))
+
+    def _fetch_shard(self, alias, cursor, older):
+        conditions, params = [], [self.match]
+        if self.group is not None:
+            conditions.append("p.group_id = %s")
+            params.append(self.group.pk)
+        if self.author is not None:
+            conditions.append("p.author_id = %s")
+            params.append(self.author.pk)
+        if cursor is not None:
+            op = ">" if older else "<"
+            conditions.append(
+                f"(f.rank {op} %s OR (f.rank = %s AND f.id {op} %s))")
+            params.extend([cursor[0], cursor[0], cursor[1]])
+        order = "" if older else " DESC"
+        where = " AND ".join(conditions) or "1"
+        sql = (
+            f"SELECT f.rank, f.id FROM ("
+            f"SELECT rowid AS id, bm25({TABLE}) AS rank FROM {TABLE} "
+            f"WHERE {TABLE} MATCH %s) AS f "
+            f"JOIN posts_post AS p ON p.id = f.id "
+            f"WHERE {where} ORDER BY f.rank{order}, f.id{order} LIMIT %s"
+        )
+        params.append(self.per_page + 1)
+        with connections[alias].cursor() as db_cursor:
+            db_cursor.execute(sql, params)
+            return db_cursor.fetchall()
+
+    def _key(self, row):
+        return row
+
+    def _encode(self, key):
+        raw = f"{key[0]!r}|{key[1]}".encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def _decode(self, token):
+        if not token:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+            rank, pk = raw.decode().split("|")
+            return float(rank), int(pk)
+        except ValueError:
+            # binascii.Error и UnicodeDecodeError - тоже ValueError
+            return None
+
+    def _load(self, rows):
+        posts = shards.load_posts([pk for _, pk in rows])
+        return [posts[pk] for _, pk in rows if pk in posts]
@@ -0,0 +1,489 @@
+"""
+Шардирование постов и комментариев по автору.
+
+Посты автора и комментарии к ним лежат в одной базе-шарде из
+settings.POST_SHARDS. Первый шард - основная база default: только в ней
+живут пользователи, группы, подписки, ленты, счётчики и очередь задач, а
+посты и комментарии хранились там же до шардирования. Карта "автор ->
+шард" - таблица AuthorShard в основной базе; автор без записи в карте
+живёт в первом шарде. Новому пользователю шард назначается по остатку от
+деления id на число шардов (home), а команда reshard переносит авторов
+между шардами.
+
+Профиль и страница поста читают один шард автора: ShardRouter направляет
+туда author.posts, post.comments и сохранение новых объектов. Общая
+лента и лента группы собирают страницу со всех шардов (ShardedPaginator),
+лента подписок и поиск загружают посты по id из всех шардов (load_posts).
+
+Когда шардов несколько, id новых постов и комментариев выдаёт общий
+счётчик IdTicket в основной базе: id уникальны во всех шардах, поэтому
+ленты, миниатюры и поисковый индекс ссылаются на посты по id, а пост
+переезжает в другой шард с тем же id.
+
+Архив старых постов (posts.archive) - ещё одна база постов с теми же
+таблицами, settings.POST_ARCHIVE_DATABASE. Ленты читают архив, только
+когда страница доходит до границы архива (archive_boundary), поиск и
+лента подписок находят архивные посты по id, страница поста ищет пост в
+архиве, если его нет в шарде автора.
+"""
+import heapq
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+
+from yatube.db import separate_alias
+
+from . import page_cache, search
+from .models import AuthorShard, Comment, IdTicket, Post, User
+from .paginator import POSTS_PER_PAGE, CursorPaginator, keyset
+
+SHARDED = ("posts.Post", "posts.Comment")
+# Сколько постов переносить за раз
+BATCH_SIZE = 500
+# Ключ (pub_date, id) самого нового поста в архиве; () - архив пуст
+ARCHIVE_BOUNDARY_KEY = "archive:boundary"
+
+
+def is_sharded():
+    return len(settings.POST_SHARDS) > 1
+
+
+def remote_shards():
+    """Шарды, кроме основной базы."""
+    return settings.POST_SHARDS[1:]
+
+
+def archive_alias():
+    """Алиас архива старых постов или None, если архив не настроен."""
+    return separate_alias(settings.POST_ARCHIVE_DATABASE)
+
+
+def post_databases():
+    """Все базы с постами: шарды и архив."""
+    alias = archive_alias()
+    return settings.POST_SHARDS if alias is None else (
+        *settings.POST_SHARDS, alias)
+
+
+def remote_databases():
+    """Базы с постами, кроме основной."""
+    return post_databases()[1:]
+
+
+def home(author_id):
+    """Шард, который автору отводит правило размещения."""
+    return settings.POST_SHARDS[author_id % len(settings.POST_SHARDS)]
+
+
+def shard_for(author_id):
+    """Шард, где сейчас лежат посты автора."""
+    if not is_sharded():
+        return settings.POST_SHARDS[0]
+    # Карту читаем из основной базы, не с реплики: после reshard реплика
+    # ещё указывала бы на старый шард
+    shard = AuthorShard.objects.using(DEFAULT_DB_ALIAS).filter(
+        user_id=author_id).values_list("shard", flat=True).first()
+    return shard or settings.POST_SHARDS[0]
+
+
+def assign(user):
+    """Назначает шард новому пользователю."""
+    if is_sharded():
+        AuthorShard.objects.using(DEFAULT_DB_ALIAS).get_or_create(
+            user_id=user.pk, defaults={"shard": home(user.pk)})
+
+
+def _queryset(model, alias):
+    queryset = model.objects.all()
+    # Чтения из основной базы направляют роутеры (например, на реплику)
+    return queryset if alias == DEFAULT_DB_ALIAS else queryset.using(alias)
+
+
+def posts(author_id):
+    """Посты автора из его шарда."""
+    return _queryset(Post, shard_for(author_id)).filter(author_id=author_id)
+
+
+def archived(**filters):
+    """Посты архива (filters - условия на них); без архива - пустой запрос."""
+    alias = archive_alias()
+    if alias is None:
+        return Post.objects.none()
+    return Post.objects.using(alias).filter(**filters)
+
+
+def archive_boundary():
+    """
+    Ключ (pub_date, id) самого нового поста в архиве или None, если
+    архива нет или он пуст. Все посты новее границы - в шардах.
+    """
+    alias = archive_alias()
+    if alias is None:
+        return None
+    boundary = cache.get(ARCHIVE_BOUNDARY_KEY)
+    if boundary is None:
+        boundary = tuple(
+            Post.objects.using(alias).order_by("-pub_date", "-id")
+            .values_list("pub_date", "id").first() or ())
+        cache.set(ARCHIVE_BOUNDARY_KEY, boundary, None)
+    return boundary or None
+
+
+def reaches_archive(keys, cursor, older, limit):
+    """
+    Может ли страница от курсора дойти до архива: keys - до limit ключей
+    (pub_date, id), выбранных от курсора из шардов.
+    """
+    boundary = archive_boundary()
+    if boundary is None:
+        return False
+    if older:
+        # Полная страница из шардов, которая кончается новее границы,
+        # архивных постов не содержит
+        return len(keys) < limit or keys[-1] < boundary
+    return cursor < boundary
+
+
+def find_post(post_id):
+    """Пост по id из любого шарда или None; архив только читается."""
+    for alias in settings.POST_SHARDS:
+        post = Post.objects.using(alias).filter(pk=post_id).first()
+        if post is not None:
+            return post
+    return None
+
+
+def get_post_or_404(post_id):
+    post = find_post(post_id)
+    if post is None:
+        raise Http404("Пост не найден")
+    return post
+
+
+def get_author_post_or_404(username, post_id):
+    """
+    Пост автора для его страницы вместе с автором и его счётчиками: из
+    шарда автора, а если пост уже перенесён - из архива.
+    """
+    author = None
+    try:
+        if is_sharded():
+            author = get_object_or_404(
+                User.objects.select_related("stats"), username=username)
+            post = author.posts.for_feed().get(id=post_id)
+        else:
+            post = Post.objects.select_related("author__stats", "group").get(
+                id=post_id, author__username=username)
+            author = post.author
+    except Post.DoesNotExist:
+        if author is None:
+            author = get_object_or_404(
+                User.objects.select_related("stats"), username=username)
+        post = get_object_or_404(archived(author=author).for_feed(),
+                                 id=post_id)
+    post.author = author
+    return post
+
+
+def load_posts(ids):
+    """Посты для лент по id из всех шардов и архива: {id: пост}."""
+    found = {}
+    for alias in post_databases():
+        missing = [pk for pk in ids if pk not in found]
+        if not missing:
+            break
+        found.update(_queryset(Post, alias).for_feed().in_bulk(missing))
+    return found
+
+
+def next_id():
+    """
+    Id для нового поста или комментария, уникальный во всех шардах; с
+    одним шардом id выдаёт сама таблица (None).
+    """
+    if not is_sharded():
+        return None
+    table = IdTicket._meta.db_table
+    with transaction.atomic(using=DEFAULT_DB_ALIAS), \
+            connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute(f"INSERT INTO {table} DEFAULT VALUES")
+        ticket = cursor.lastrowid
+        cursor.execute(f"DELETE FROM {table} WHERE id < %s", [ticket])
+    return ticket
+
+
+def prepare():
+    """
+    Поднимает счётчик IdTicket выше всех id постов и комментариев в
+    шардах: до шардирования id выдавала каждая таблица сама.
+    """
+    if not is_sharded():
+        return
+    floor = 0
+    for alias in post_databases():
+        tables = connections[alias].introspection.table_names()
+        for model in (Post, Comment):
+            if model._meta.db_table in tables:
+                top = model.objects.using(alias).aggregate(top=Max("id"))
+                floor = max(floor, top["top"] or 0)
+    table = IdTicket._meta.db_table
+    with transaction.atomic(using=DEFAULT_DB_ALIAS), \
+            connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s",
+                       [table])
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute(
+                "INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)",
+                [table, floor])
+        elif row[0] < floor:
+            cursor.execute(
+                "UPDATE sqlite_sequence SET seq = %s WHERE name = %s",
+                [floor, table])
+
+
+def _copy_rows(source, target, table, columns, where, params):
+    """Копирует строки таблицы между шардами как есть, без ORM."""
+    columns = ", ".join(columns)
+    source.execute(f"SELECT {columns} FROM {table} WHERE {where}", params)
+    rows = source.fetchall()
+    if rows:
+        marks = ", ".join(["%s"] * len(rows[0]))
+        target.executemany(
+            f"INSERT INTO {table} ({columns}) VALUES ({marks})", rows)
+
+
+def _columns(model):
+    return [field.column for field in model._meta.concrete_fields]
+
+
+def _move_batch(source, target, filters):
+    tables = [(Post._meta.db_table, _columns(Post), "id"),
+              (Comment._meta.db_table, _columns(Comment), "post_id"),
+              (search.TABLE, ["rowid", "text"], "rowid")]
+    # Внешняя транзакция - исходной базы: копия в target фиксируется
+    # раньше удаления, и посты на мгновение видны дважды, но не пропадают
+    with transaction.atomic(using=source), \
+            transaction.atomic(using=target), \
+            connections[source].cursor() as source_cursor, \
+            connections[target].cursor() as target_cursor:
+        ids = list(Post.objects.using(source).filter(**filters)
+                   .order_by("id").values_list("id", flat=True)[:BATCH_SIZE])
+        marks = ", ".join(["%s"] * len(ids))
+        if ids:
+            for table, columns, column in tables:
+                _copy_rows(source_cursor, target_cursor, table, columns,
+                           f"{column} IN ({marks})", ids)
+            # Комментарии удаляются раньше своих постов
+            for table, _, column in reversed(tables):
+                source_cursor.execute(
+                    f"DELETE FROM {table} WHERE {column} IN ({marks})", ids)
+    return len(ids)
+
+
+def move_posts(source, target, **filters):
+    """
+    Переносит посты (filters - условия на них) из базы source в target
+    вместе с комментариями и строками поискового индекса, с теми же id.
+    Каждые BATCH_SIZE постов - своя транзакция, чтобы не держать запись в
+    базах надолго. Возвращает число перенесённых постов.
+    """
+    moved = 0
+    while True:
+        batch = _move_batch(source, target, filters)
+        moved += batch
+        if batch < BATCH_SIZE:
+            return moved
+
+
+def move(author_id, target):
+    """
+    Собирает в шарде target посты автора из всех остальных шардов вместе с
+    комментариями и поисковым индексом и переключает карту. Пост, который
+    автор публиковал в момент переноса, может записаться в прежний шард:
+    повторный перенос в тот же шард его подберёт. Возвращает число
+    перенесённых постов.
+    """
+    moved = sum(move_posts(source, target, author_id=author_id)
+                for source in settings.POST_SHARDS if source != target)
+    AuthorShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        user_id=author_id, defaults={"shard": target})
+    username = User.objects.filter(pk=author_id).values_list(
+        "username", flat=True).first()
+    page_cache.invalidate(page_cache.FEED, page_cache.user_tag(username))
+    return moved
+
+
+class ArchiveMixin:
+    """
+    Лента, которая читает архив (archive - queryset архивных постов),
+    только когда страница доходит до границы архива.
+    """
+
+    def __init__(self, object_list, per_page, archive=None):
+        super().__init__(object_list, per_page)
+        self.archive = archive
+
+    def _fetch(self, cursor, older):
+        limit = self.per_page + 1
+        rows = super()._fetch(cursor, older)
+        if self.archive is None or not reaches_archive(
+                [self._key(row) for row in rows], cursor, older, limit):
+            return rows
+        archived_rows = self._fetch_archive(cursor, older)
+        return list(islice(heapq.merge(rows, archived_rows, key=self._key,
+                                       reverse=older), limit))
+
+
+class FeedPaginator(ArchiveMixin, CursorPaginator):
+    """Лента из одного шарда с архивом."""
+
+    def _fetch_archive(self, cursor, older):
+        queryset = keyset(self.archive.for_feed(), self.keys, cursor, older)
+        return list(queryset[:self.per_page + 1])
+
+
+class ShardedPaginator(ArchiveMixin, CursorPaginator):
+    """
+    Лента по всем шардам (scatter-gather): каждый шард отдаёт до
+    per_page + 1 ключей (pub_date, id) от курсора по своему индексу, ключи
+    сливаются heapq.merge, а посты страницы загружаются из своих шардов.
+    object_list - пары (шард, queryset).
+    """
+
+    def _fetch_keys(self, alias, queryset, cursor, older):
+        rows = keyset(queryset, self.keys, cursor, older).values_list(
+            *self.keys)[:self.per_page + 1]
+        return [(*row, alias) for row in rows]
+
+    def _fetch(self, cursor, older):
+        streams = [self._fetch_keys(alias, queryset, cursor, older)
+                   for alias, queryset in self.object_list]
+        return list(islice(heapq.merge(*streams, reverse=older),
+                           self.per_page + 1))
+
+    def _fetch_archive(self, cursor, older):
+        return self._fetch_keys(self.archive.db, self.archive, cursor, older)
+
+    def _key(self, row):
+        return row[:2]
+
+    def _load(self, rows):
+        ids = defaultdict(list)
+        for _, pk, alias in rows:
+            ids[alias].append(pk)
+        # Без архива archived() - пустой запрос к основной базе: его
+        # заменяет запрос шарда
+        querysets = {self.archive.db: self.archive, **dict(self.object_list)}
+        found = {}
+        for alias, pks in ids.items():
+            found.update(querysets[alias].for_feed().in_bulk(pks))
+        return [found[pk] for _, pk, _ in rows if pk in found]
+
+
+def feed_page(request, author=None, **filters):
+    """
+    Страница общей ленты, ленты группы или профиля автора (filters -
+    условия на посты) по курсорам ?after= / ?before= из запроса.
+    """
+    if author is not None:
+        # Посты автора лежат в одном шарде: author.posts
+        # (posts.shards.ShardRouter)
+        paginator = FeedPaginator(
+            author.posts.filter(**filters).for_feed(), POSTS_PER_PAGE,
+            archive=archived(author=author, **filters))
+    elif not is_sharded():
+        paginator = FeedPaginator(
+            Post.objects.filter(**filters).for_feed(), POSTS_PER_PAGE,
+            archive=archived(**filters))
+    else:
+        paginator = ShardedPaginator(
+            [(alias, _queryset(Post, alias).filter(**filters))
+             for alias in settings.POST_SHARDS], POSTS_PER_PAGE,
+            archive=archived(**filters))
+    return paginator.get_page(request.GET.get("after"),
+                              request.GET.get("before"))
+
+
+def author_keys(author_id, cursor, older, limit):
+    """
+    До limit ключей (pub_date, id) постов автора от курсора: из его шарда,
+    а за границей архива - и из архива.
+    """
+    keys = ("pub_date", "id")
+    rows = list(keyset(posts(author_id), keys, cursor, older)
+                .values_list(*keys)[:limit])
+    if reaches_archive(rows, cursor, older, limit):
+        archived_rows = keyset(archived(author_id=author_id), keys, cursor,
+                               older).values_list(*keys)[:limit]
+        rows = list(islice(heapq.merge(rows, archived_rows, reverse=older),
+                           limit))
+    return rows
+
+
+class ShardRouter:
+    """
+    Направляет в шард связанные запросы постов и комментариев: посты
+    автора (author.posts), комментарии поста (post.comments), сохранение
+    нового поста или комментария; комментарии архивного поста - в архив.
+    Пользователи, группы и остальные таблицы для объектов из шардов и
+    архива читаются из основной базы. Решения об
+    основной базе и реплике остаются yatube.replica.ReplicaRouter.
+    """
+
+    def _shard(self, model, instance):
+        if instance is None or not remote_databases():
+            return None
+        if model._meta.label not in SHARDED:
+            # post.author, comment.author, post.group, post.thumbnails
+            if instance._state.db in remote_databases():
+                return DEFAULT_DB_ALIAS
+            return None
+        if isinstance(instance, User):
+            return (shard_for(instance.pk)
+                    if model._meta.label == "posts.Post" else None)
+        if instance._state.db is not None:
+            return instance._state.db
+        if not is_sharded():
+            # Новые посты и комментарии в архив не попадают
+            return None
+        if isinstance(instance, Post):
+            return shard_for(instance.author_id)
+        if isinstance(instance, Comment):
+            if Comment.post.is_cached(instance):
+                return instance.post._state.db
+            post = find_post(instance.post_id)
+            return post._state.db if post is not None else None
+        return None
+
+    def _route(self, model, instance):
+        alias = self._shard(model, instance)
+        # Основная база или реплика - решение ReplicaRouter
+        if model._meta.label in SHARDED and alias not in remote_databases():
+            return None
+        return alias
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints.get("instance"))
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints.get("instance"))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {*post_databases(), settings.REPLICA_DATABASE}
+        if {obj1._state.db, obj2._state.db} <= aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db not in remote_databases():
+            return None
+        # В шардах и архиве только таблицы постов и комментариев с
+        # поисковым индексом
+        return app_label == "posts" and model_name in ("post", "comment")
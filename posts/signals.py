@@ -0,0 +1,126 @@
+from django.db.models import F
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import media, page_cache, search, shards, stats, timeline
+from .models import (Comment, Follow, Group, Post, Thumbnail, TimelineEntry,
+                     User)
+
+
+def _invalidate_follow_pages(follow):
+    usernames = User.objects.filter(
+        pk__in=[follow.user_id, follow.author_id]).values_list(
+        "username", flat=True)
+    page_cache.invalidate(*map(page_cache.user_tag, usernames))
+
+
+@receiver(post_save, sender=User)
+def on_user_saved(sender, instance, created, **kwargs):
+    if created:
+        shards.assign(instance)
+        stats.get(instance)
+
+
+@receiver(pre_delete, sender=User)
+def on_user_deleting(sender, instance, **kwargs):
+    # Каскад ORM удаляет посты и комментарии только в основной базе
+    for alias in shards.remote_databases():
+        Comment.objects.using(alias).filter(author_id=instance.pk).delete()
+        Post.objects.using(alias).filter(author_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def on_group_changed(sender, instance, **kwargs):
+    page_cache.invalidate(page_cache.FEED)
+
+
+@receiver(pre_delete, sender=Group)
+def on_group_deleting(sender, instance, **kwargs):
+    # SET_NULL для постов из других шардов и архива
+    for alias in shards.remote_databases():
+        Post.objects.using(alias).filter(group_id=instance.pk).update(
+            group=None)
+
+
+@receiver(pre_save, sender=Post)
+def on_post_saving(sender, instance, using, **kwargs):
+    # Запоминаем прежнюю картинку, чтобы после сохранения перенести ссылку
+    instance._saved_image = None
+    if instance.pk is None:
+        instance.pk = shards.next_id()
+    else:
+        instance._saved_image = Post.objects.using(using).filter(
+            pk=instance.pk).values_list("image", flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def on_post_saved(sender, instance, created, **kwargs):
+    if created:
+        stats.add(instance.author_id, "posts", 1)
+        timeline.fan_out(instance)
+    saved_image = getattr(instance, "_saved_image", None) or ""
+    if (instance.image.name or "") != saved_image:
+        media.acquire(instance.image.name)
+        media.release(saved_image)
+    search.index_post(instance, kwargs["using"])
+    page_cache.invalidate(page_cache.FEED)
+
+
+@receiver(post_delete, sender=Post)
+def on_post_deleted(sender, instance, **kwargs):
+    stats.add(instance.author_id, "posts", -1)
+    timeline.forget(instance)
+    # Ленты и миниатюры в основной базе, пост - возможно, в другом шарде
+    TimelineEntry.objects.filter(post_id=instance.pk).delete()
+    Thumbnail.objects.filter(post_id=instance.pk).delete()
+    media.release(instance.image.name)
+    search.unindex_post(instance, kwargs["using"])
+    page_cache.invalidate(page_cache.FEED)
+
+
+@receiver(pre_save, sender=Comment)
+def on_comment_saving(sender, instance, **kwargs):
+    if instance.pk is None:
+        instance.pk = shards.next_id()
+
+
+@receiver(post_save, sender=Comment)
+def on_comment_saved(sender, instance, created, using, **kwargs):
+    if created:
+        Post.objects.using(using).filter(pk=instance.post_id).update(
+            comment_count=F("comment_count") + 1)
+    page_cache.invalidate(page_cache.FEED)
+
+
+@receiver(post_delete, sender=Comment)
+def on_comment_deleted(sender, instance, using, **kwargs):
+    Post.objects.using(using).filter(
+        pk=instance.post_id, comment_count__gt=0).update(
+        comment_count=F("comment_count") - 1)
+    page_cache.invalidate(page_cache.FEED)
+
+
+@receiver(post_save, sender=Follow)
+def on_follow_saved(sender, instance, created, **kwargs):
+    if created:
+        stats.add(instance.author_id, "followers", 1)
+        stats.add(instance.user_id, "followings", 1)
+        timeline.backfill(instance.user_id, instance.author_id)
+        _invalidate_follow_pages(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def on_follow_deleted(sender, instance, **kwargs):
+    stats.add(instance.author_id, "followers", -1)
+    stats.add(instance.user_id, "followings", -1)
+    timeline.prune(instance.user_id, instance.author_id)
+    _invalidate_follow_pages(instance)
+
+
+@receiver(post_migrate)
+def on_migrated(sender, using, **kwargs):
+    # Новый шард: общий счётчик id должен обогнать id его таблиц
+    if sender.name == "posts" and using in shards.remote_databases():
+        shards.prepare()
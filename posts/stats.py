@@ -0,0 +1,32 @@
+from django.db.models import F
+
+from . import shards
+from .models import Follow, UserStats
+
+
+def count(user_id):
+    """Точные значения счётчиков пользователя по исходным таблицам."""
+    return {
+        "posts": (shards.posts(user_id).count()
+                  + shards.archived(author_id=user_id).count()),
+        "followers": Follow.objects.filter(author_id=user_id).count(),
+        "followings": Follow.objects.filter(user_id=user_id).count(),
+    }
+
+
+def get(user):
+    """Счётчики пользователя; строка создаётся при первом обращении."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return UserStats.objects.get_or_create(
+            user_id=user.pk, defaults=count(user.pk))[0]
+
+
+def add(user_id, field, delta):
+    """Атомарно изменяет счётчик пользователя на delta."""
+    stats = UserStats.objects.filter(user_id=user_id)
+    if delta < 0:
+        # Разошедшийся счётчик не уводим ниже нуля - его исправит recount
+        stats = stats.filter(**{f"{field}__gte": -delta})
+    stats.update(**{field: F(field) + delta})
@@ -0,0 +1,80 @@
+"""
+Хранилище картинок постов с адресацией по содержимому.
+
+Имя файла - SHA-256 его содержимого, файлы разложены по вложенным
+каталогам по первым символам хэша: posts/ab/cd/abcd...ef.jpg. Так в одном
+каталоге не скапливаются сотни тысяч файлов, а одинаковые картинки,
+загруженные разными пользователями, хранятся на диске один раз. Сколько
+постов ссылается на файл, считает модель MediaFile (posts.media).
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils.deconstruct import deconstructible
+
+NAME_RE = re.compile(r"(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$")
+
+
+def content_name(directory, digest, extension):
+    return "/".join(filter(None, [
+        directory, digest[:2], digest[2:4], digest + extension.lower()]))
+
+
+def is_content_addressed(name):
+    return bool(NAME_RE.search(name or ""))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # Итоговое имя определяется содержимым в _save(), коллизий нет
+        return name
+
+    def hashed_name(self, name, content):
+        """Имя, под которым будет сохранено содержимое content."""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        directory, filename = os.path.split(name)
+        return content_name(directory, digest.hexdigest(),
+                            os.path.splitext(filename)[1])
+
+    def _save(self, name, content):
+        from . import media
+
+        name = self.hashed_name(name, content)
+        # Отметка и проверка - в одной транзакции на запись, как и удаление
+        # файла в gc_media: файл либо уже отмечен и не будет удалён, либо
+        # уже удалён, и мы запишем его заново
+        with transaction.atomic():
+            media.hold(name)
+            exists = self.exists(name)
+        if exists:
+            # Такой файл уже есть: второй раз не записываем
+            return name
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # Пишем во временный файл рядом и переименовываем: читатели
+        # никогда не видят недописанный файл, а одновременная загрузка
+        # той же картинки просто заменит его тем же содержимым
+        descriptor, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(full_path), suffix=".part")
+        try:
+            with os.fdopen(descriptor, "wb") as temp_file:
+                for chunk in content.chunks():
+                    temp_file.write(chunk)
+            # mkstemp создаёт файл с правами 0600 - веб-сервер его не прочтёт
+            os.chmod(temp_path, self.file_permissions_mode or 0o644)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
+
+
+content_storage = ContentAddressedStorage()
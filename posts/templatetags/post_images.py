@@ -0,0 +1,11 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.filter
+def responsive_image(post):
+    """Готовые варианты картинки поста; сам ничего не генерирует."""
+    return thumbnails.responsive(post)
@@ -0,0 +1,102 @@
+# posts/tests/test_archive.py
+import datetime as dt
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from posts import shards
+from posts.models import Comment, Post, UserStats
+from yatube.testing import temp_database
+
+User = get_user_model()
+
+
+@override_settings(POST_ARCHIVE_DATABASE="archive_test")
+class ArchiveTests(TransactionTestCase):
+    """Архив - отдельный файл SQLite с таблицами постов и комментариев."""
+
+    def setUp(self):
+        temp_database(self, "archive_test", migrate=True)
+        # flush между тестами не трогает поисковый индекс
+        call_command("rebuild_search_index", stdout=StringIO())
+        cache.clear()
+        self.author = User.objects.create_user(username="author")
+        self.reader = User.objects.create_user(username="reader")
+        self.client.force_login(self.reader)
+        self.client.get(reverse("posts:profile_follow", args=["author"]))
+        old = dt.datetime(2000, 1, 1, tzinfo=dt.timezone.utc)
+        self.old = []
+        for number in range(5):
+            post = Post.objects.create(text=f"Старые котики {number}",
+                                       author=self.author)
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=old + dt.timedelta(days=number))
+            self.old.append(post)
+        Comment.objects.create(post=self.old[0], author=self.reader,
+                               text="Старый комментарий")
+        self.new = [Post.objects.create(text=f"Новый пост {number}",
+                                        author=self.author)
+                    for number in range(12)]
+        out = StringIO()
+        call_command("archive_posts", stdout=out)
+        self.assertIn("постов: 5", out.getvalue())
+        self.expected = [*reversed(self.new), *reversed(self.old)]
+
+    def pages(self, url):
+        first = self.client.get(url).context["page"]
+        second = self.client.get(
+            url, {"after": first.paginator.next_cursor}).context["page"]
+        back = self.client.get(
+            url, {"before": second.paginator.previous_cursor}
+        ).context["page"]
+        self.assertEqual(list(back), list(first))
+        return list(first) + list(second)
+
+    def test_old_posts_move_to_archive(self):
+        self.assertEqual(
+            set(Post.objects.values_list("id", flat=True)),
+            {post.pk for post in self.new})
+        self.assertEqual(
+            set(Post.objects.using("archive_test").values_list(
+                "id", flat=True)),
+            {post.pk for post in self.old})
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(
+            Comment.objects.using("archive_test").get().post_id,
+            self.old[0].pk)
+
+    def test_feeds_read_archive_past_boundary(self):
+        shards.archive_boundary()
+        with self.assertNumQueries(0, using="archive_test"):
+            self.client.get(reverse("posts:index"))
+        for url in (reverse("posts:index"),
+                    reverse("posts:profile", args=["author"]),
+                    reverse("posts:follow_index")):
+            with self.subTest(url=url):
+                self.assertEqual(self.pages(url), self.expected)
+
+    def test_post_view_falls_back_to_archive(self):
+        post = self.old[0]
+        response = self.client.get(reverse("posts:post",
+                                           args=["author", post.pk]))
+        self.assertEqual(response.context["post"], post)
+        self.assertContains(response, "Старый комментарий")
+        # Архивный пост только читается
+        self.assertNotContains(response, "Добавить комментарий:")
+        response = self.client.post(
+            reverse("posts:add-comment", args=["author", post.pk]),
+            {"text": "Поздно"})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse("posts:post",
+                                           args=["reader", post.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_search_and_counters_include_archive(self):
+        response = self.client.get(reverse("posts:search"),
+                                   {"q": "котики"})
+        self.assertCountEqual(response.context["page"], self.old)
+        call_command("recount", stdout=StringIO())
+        self.assertEqual(UserStats.objects.get(user=self.author).posts, 17)
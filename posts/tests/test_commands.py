@@ -0,0 +1,69 @@
+# posts/tests/test_commands.py
+import datetime as dt
+import json
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from posts.models import Comment, Follow, Post, TimelineEntry, UserStats
+
+User = get_user_model()
+
+
+class SeedBenchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        call_command("seed", users=30, posts=300, follows=200, comments=50,
+                     groups=3, chunk_size=40, stdout=StringIO())
+
+    def test_seed_keeps_derived_data_consistent(self):
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(Follow.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 50)
+        stats = UserStats.objects.order_by("-posts").first()
+        self.assertEqual(stats.posts,
+                         Post.objects.filter(author_id=stats.user_id).count())
+        self.assertGreater(stats.posts, 10)
+        follow = Follow.objects.first()
+        self.assertEqual(
+            TimelineEntry.objects.filter(user_id=follow.user_id,
+                                         author_id=follow.author_id).count(),
+            Post.objects.filter(author_id=follow.author_id).count())
+        dates = list(Post.objects.values_list("pub_date", flat=True)[:2])
+        self.assertGreater(dates[0] - dates[1], dt.timedelta(minutes=1))
+
+    def test_bench_views_reports_every_view(self):
+        with tempfile.NamedTemporaryFile("r", suffix=".json") as output:
+            call_command("bench_views", requests=3, warmup=0,
+                         output=output.name)
+            report = json.load(output)
+        self.assertEqual(report["dataset"]["posts"], 300)
+        self.assertEqual(set(report["views"]), {
+            "posts:index", "posts:follow_index", "posts:profile",
+            "posts:post", "posts:group-detail", "posts:search"})
+        for result in report["views"].values():
+            self.assertEqual(result["status"], [200])
+            self.assertGreater(result["queries"], 0)
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+
+
+class BenchDbTests(TransactionTestCase):
+    """Копия базы для замера снимается вне транзакции TestCase."""
+
+    def test_bench_db_compares_profiles(self):
+        author = User.objects.create_user(username="author")
+        for number in range(5):
+            Post.objects.create(text=f"Пост {number}", author=author)
+        out = StringIO()
+        call_command("bench_db", readers=2, writers=1, seconds=0.2,
+                     stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines[1:]],
+                         ["default", "yatube.db"])
+        self.assertTrue(all(line.split()[-1] == "0" for line in lines[1:]))
+        # Замер идёт на копии: комментарии в базу не попали
+        self.assertFalse(Comment.objects.exists())
@@ -1,12 +1,14 @@
 # posts/tests/tests_forms.py
 import shutil
 import tempfile
+from io import BytesIO
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 from posts.forms import PostForm
 from posts.models import Post
 
@@ -66,7 +68,9 @@ class PostFormTests(TestCase):
         # Проверяем, увеличилось ли число постов
         self.assertEqual(Post.objects.count(), posts_count + 1)
         # Проверяем, что создалась запись с нашей картинкой
-        self.assertTrue(Post.objects.filter(image="posts/small.gif").exists())
+        self.assertTrue(Post.objects.filter(
+            image__regex=r"^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.gif$"
+        ).exists())
 
     def test_edit_post(self):
         """Валидная форма изменяет запись в Post."""
@@ -101,3 +105,53 @@ class PostFormTests(TestCase):
         self.assertRedirects(response, reverse(
             'posts:post',
             kwargs={'username': self.user, 'post_id': 1}))
+
+    def test_large_image_is_downscaled_without_exif(self):
+        """Оригинал уменьшается, EXIF не сохраняется."""
+        exif = Image.Exif()
+        exif[0x010F] = "Камера"
+        buffer = BytesIO()
+        Image.new("RGB", (4000, 1000), "red").save(
+            buffer, "JPEG", exif=exif.tobytes())
+        upload = SimpleUploadedFile("photo.jpeg", buffer.getvalue(),
+                                    content_type="image/jpeg")
+        self.authorized_client.post(reverse('posts:new-post'),
+                                    {'text': 'Фото', 'image': upload})
+        post = Post.objects.get()
+        self.assertRegex(post.image.name, r"^posts/.+\.jpg$")
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (2560, 640))
+            self.assertEqual(len(image.getexif()), 0)
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=100, POST_IMAGE_MAX_BYTES=1000)
+    def test_rejected_image_is_reported_in_form(self):
+        """Слишком большая или битая картинка - ошибка формы, а не 500."""
+        buffer = BytesIO()
+        Image.new("RGB", (20, 20)).save(buffer, "PNG")
+        # Заголовок целый, данные обрезаны: проверку ImageField файл
+        # проходит, а декодирование пикселей падает
+        truncated = BytesIO()
+        Image.new("RGB", (10, 10), "red").save(truncated, "JPEG")
+        uploads = [
+            # Картинка маленькая, но файл дополнен мусором сверх лимита
+            (SimpleUploadedFile("heavy.png", buffer.getvalue() + bytes(2000),
+                                content_type="image/png"),
+             "Файл слишком большой: не больше 1000\xa0байт."),
+            (SimpleUploadedFile("big.png", buffer.getvalue(),
+                                content_type="image/png"),
+             "Изображение слишком большое: 20x20."),
+            (SimpleUploadedFile("fake.gif", b"not an image",
+                                content_type="image/gif"),
+             "Загрузите правильное изображение."),
+            (SimpleUploadedFile("cut.jpg", truncated.getvalue()[:-10],
+                                content_type="image/jpeg"),
+             "Загрузите правильное изображение."),
+        ]
+        for upload, message in uploads:
+            with self.subTest(name=upload.name):
+                response = self.authorized_client.post(
+                    reverse('posts:new-post'),
+                    {'text': 'Текст', 'image': upload})
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, message)
+        self.assertFalse(Post.objects.exists())
@@ -1,6 +1,19 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
 
-from posts.models import Group, Post, User
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from posts import thumbnails
+from posts.models import Group, MediaFile, Post, Thumbnail, User
+from posts.storage import content_storage, is_content_addressed
 
 
 class PostModelTest(TestCase):
@@ -75,3 +88,134 @@ class PostModelTest(TestCase):
         group = PostModelTest.group
         group__str__ = str(group)
         self.assertEquals(group__str__, 'Тестовая группа')
+
+
+class MediaStorageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create(username="leo")
+
+    def create_post(self, name, content=b"GIF89a-picture"):
+        return Post.objects.create(text="Текст", author=self.user,
+                                   image=ContentFile(content, name=name))
+
+    def test_identical_uploads_are_stored_once(self):
+        first = self.create_post("one.gif")
+        second = self.create_post("two.GIF")
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(is_content_addressed(first.image.name))
+        directory = os.path.dirname(first.image.path)
+        self.assertEqual(os.listdir(directory),
+                         [os.path.basename(first.image.name)])
+        self.assertEqual(MediaFile.objects.get(name=first.image.name).refs, 2)
+
+    def test_refs_follow_edits_and_deletes(self):
+        post = self.create_post("one.gif")
+        old = post.image.name
+        post.image = ContentFile(b"GIF89a-other", name="other.gif")
+        post.save()
+        released = MediaFile.objects.get(name=old)
+        self.assertEqual(released.refs, 0)
+        self.assertIsNotNone(released.released)
+        post.delete()
+        self.assertEqual(MediaFile.objects.get(name=post.image.name).refs, 0)
+
+    def test_migrate_media_moves_legacy_files(self):
+        os.makedirs(os.path.join(self.media_root, "posts"))
+        for name in ("a.gif", "b.gif"):
+            with open(os.path.join(self.media_root, "posts", name),
+                      "wb") as legacy:
+                legacy.write(b"GIF89a-legacy")
+            Post.objects.create(text="Старый", author=self.user,
+                                image=f"posts/{name}")
+        call_command("migrate_media", stdout=StringIO())
+        names = set(Post.objects.values_list("image", flat=True))
+        self.assertEqual(len(names), 1)
+        new = names.pop()
+        self.assertTrue(is_content_addressed(new))
+        self.assertTrue(content_storage.exists(new))
+        self.assertEqual(MediaFile.objects.get(name=new).refs, 2)
+        # Старые файлы остаются до gc_media, но ссылок на них больше нет
+        self.assertTrue(content_storage.exists("posts/a.gif"))
+        self.assertEqual(MediaFile.objects.get(name="posts/a.gif").refs, 0)
+
+    def test_gc_media_deletes_unreferenced_files(self):
+        buffer = BytesIO()
+        Image.new("RGB", (40, 20), "red").save(buffer, "PNG")
+        post = self.create_post("red.png", buffer.getvalue())
+        thumbnails.generate(post.pk)
+        old_image = post.image.name
+        old_thumbnail = Thumbnail.objects.filter(post=post).first().image
+        orphan = content_storage.save("posts/orphan.gif",
+                                      ContentFile(b"GIF89a-orphan"))
+        kept = self.create_post("kept.gif")
+        post.image = ContentFile(b"GIF89a-new", name="new.gif")
+        post.save()
+
+        out = StringIO()
+        call_command("gc_media", "--dry-run", "--grace-hours=0", stdout=out)
+        self.assertIn(old_image, out.getvalue())
+        self.assertTrue(content_storage.exists(old_image))
+
+        call_command("gc_media", "--grace-hours=0", "--rate=0",
+                     stdout=StringIO())
+        for name in (old_image, orphan):
+            self.assertFalse(content_storage.exists(name))
+        self.assertFalse(old_thumbnail.storage.exists(old_thumbnail.name))
+        self.assertFalse(Thumbnail.objects.exists())
+        self.assertFalse(MediaFile.objects.filter(name=old_image).exists())
+        for name in (post.image.name, kept.image.name):
+            self.assertTrue(content_storage.exists(name))
+
+    def test_gc_media_keeps_files_uploaded_again(self):
+        """Файл не удаляется, если на него снова сослались во время паузы"""
+        post = self.create_post("one.gif")
+        post.delete()
+        with mock.patch(
+                "posts.management.commands.gc_media.Command.throttle",
+                side_effect=lambda: self.create_post("again.gif")):
+            call_command("gc_media", "--grace-hours=0", stdout=StringIO())
+        self.assertTrue(content_storage.exists(post.image.name))
+        self.assertEqual(MediaFile.objects.get(name=post.image.name).refs, 1)
+
+    def test_gc_media_keeps_files_referenced_by_posts(self):
+        post = self.create_post("one.gif")
+        # Счётчик разошёлся с постами: последняя проверка - по самим постам
+        MediaFile.objects.filter(name=post.image.name).update(
+            refs=0, released=timezone.now())
+        call_command("gc_media", "--grace-hours=0", "--rate=0",
+                     stdout=StringIO())
+        self.assertTrue(content_storage.exists(post.image.name))
+        # Строка счётчика восстановлена по числу постов
+        self.assertEqual(MediaFile.objects.get(name=post.image.name).refs, 1)
+
+    def test_upload_after_gc_writes_file_again(self):
+        post = self.create_post("one.gif")
+        post.delete()
+        call_command("gc_media", "--grace-hours=0", "--rate=0",
+                     stdout=StringIO())
+        self.assertFalse(content_storage.exists(post.image.name))
+        again = self.create_post("again.gif")
+        self.assertEqual(again.image.name, post.image.name)
+        self.assertTrue(content_storage.exists(again.image.name))
+        self.assertEqual(MediaFile.objects.get(name=again.image.name).refs, 1)
+
+    def test_saving_file_holds_it_for_grace_period(self):
+        """Сохранённый, но ещё не привязанный к посту файл gc не удаляет"""
+        name = content_storage.save("posts/one.gif",
+                                    ContentFile(b"GIF89a-picture"))
+        held = MediaFile.objects.get(name=name)
+        self.assertEqual(held.refs, 0)
+        self.assertIsNotNone(held.released)
+        call_command("gc_media", "--rate=0", stdout=StringIO())
+        self.assertTrue(content_storage.exists(name))
+
+    def test_gc_media_keeps_files_within_grace_period(self):
+        post = self.create_post("one.gif")
+        post.delete()
+        call_command("gc_media", stdout=StringIO())
+        self.assertTrue(content_storage.exists(post.image.name))
@@ -0,0 +1,83 @@
+# posts/tests/test_query_plans.py
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+@override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+class QueryPlanTests(TestCase):
+    """
+    Запросы страниц должны идти по индексам: EXPLAIN QUERY PLAN без
+    полного просмотра таблицы (SCAN без индекса) и без сортировки во
+    временном B-дереве.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="author")
+        cls.reader = User.objects.create_user(username="reader")
+        cls.fan = User.objects.create_user(username="fan")
+        cls.group = Group.objects.create(title="Группа", slug="group",
+                                         description="Описание")
+        for number in range(15):
+            Post.objects.create(text=f"Пост номер {number}",
+                                author=cls.author, group=cls.group)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        # Два подписчика: посты автора подмешиваются в ленту при чтении
+        Follow.objects.create(user=cls.fan, author=cls.author)
+        cls.post = Post.objects.first()
+        Comment.objects.create(post=cls.post, author=cls.reader,
+                               text="Комментарий")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def assertIndexedQueries(self, url, ranked=False):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        cursor = connection.cursor()
+        for query in queries:
+            sql = query["sql"]
+            if not sql.startswith("SELECT"):
+                continue
+            plan = [row[-1] for row in cursor.execute(
+                "EXPLAIN QUERY PLAN " + sql).fetchall()]
+            for step in plan:
+                full_scan = (step.startswith("SCAN")
+                             and "INDEX" not in step
+                             and "VIRTUAL TABLE" not in step)
+                # Результаты поиска упорядочены по релевантности, которая
+                # считается на лету: их сортировка неизбежна
+                sort = "TEMP B-TREE" in step and not ranked
+                with self.subTest(url=url, sql=sql, step=step):
+                    self.assertFalse(full_scan or sort)
+
+    def test_feeds_use_indexes(self):
+        post = self.post
+        index = reverse("posts:index")
+        cursor = self.client.get(index).context["page"].paginator.next_cursor
+        for url in (index,
+                    f"{index}?after={cursor}",
+                    reverse("posts:group-detail", args=["group"]),
+                    reverse("posts:profile", args=["author"]),
+                    reverse("posts:follow_index"),
+                    reverse("posts:post", args=["author", post.pk]),
+                    reverse("posts:add-comment", args=["author", post.pk])):
+            self.assertIndexedQueries(url)
+        self.assertIndexedQueries(reverse("posts:search") + "?q=пост",
+                                  ranked=True)
+
+    def test_follower_count_uses_author_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            Follow.objects.filter(author=self.author).count()
+        plan = connection.cursor().execute(
+            "EXPLAIN QUERY PLAN " + queries[0]["sql"]).fetchall()
+        self.assertIn("follow_author_user_idx", plan[0][-1])
@@ -0,0 +1,161 @@
+# posts/tests/test_shards.py
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from posts import shards
+from posts.models import Comment, Group, Post, Thumbnail
+from posts.storage import is_content_addressed
+from yatube.testing import temp_database
+
+User = get_user_model()
+
+
+@override_settings(POST_SHARDS=("default", "shard_test"))
+class ShardingTests(TransactionTestCase):
+    """
+    Второй шард - отдельный файл SQLite: посты автора right лежат в нём,
+    посты left - в основной базе.
+    """
+
+    def setUp(self):
+        temp_database(self, "shard_test", migrate=True)
+        # flush между тестами не трогает поисковый индекс
+        call_command("rebuild_search_index", stdout=StringIO())
+        cache.clear()
+        self.group = Group.objects.create(title="Группа", slug="group",
+                                          description="Описание")
+        self.left = User.objects.create_user(username="left")
+        self.right = User.objects.create_user(username="right")
+        self.reader = User.objects.create_user(username="reader")
+        call_command("reshard", "left", to="default", stdout=StringIO())
+        call_command("reshard", "right", to="shard_test", stdout=StringIO())
+        self.posts = []
+        for number in range(6):
+            for author in (self.left, self.right):
+                self.posts.append(Post.objects.create(
+                    text=f"Котики {author.username} {number}",
+                    author=author, group=self.group))
+        self.client.force_login(self.reader)
+
+    def right_post(self):
+        return next(post for post in reversed(self.posts)
+                    if post.author_id == self.right.pk)
+
+    def test_posts_are_stored_in_author_shard(self):
+        self.assertEqual(
+            Post.objects.using("shard_test").filter(
+                author=self.right).count(), 6)
+        self.assertFalse(Post.objects.using("shard_test").filter(
+            author=self.left).exists())
+        self.assertFalse(Post.objects.filter(author=self.right).exists())
+        # Id уникальны во всех шардах
+        self.assertEqual(len({post.pk for post in self.posts}), 12)
+
+    def test_feeds_gather_posts_from_all_shards(self):
+        expected = sorted(self.posts, key=lambda post: (post.pub_date,
+                                                        post.pk),
+                          reverse=True)
+        for url in (reverse("posts:index"),
+                    reverse("posts:group-detail", args=["group"])):
+            first = self.client.get(url).context["page"]
+            second = self.client.get(
+                url, {"after": first.paginator.next_cursor}
+            ).context["page"]
+            self.assertEqual(list(first) + list(second), expected)
+            self.assertEqual([post.author for post in first],
+                             [post.author for post in expected[:10]])
+
+    def test_profile_and_post_read_author_shard(self):
+        post = self.right_post()
+        response = self.client.get(reverse("posts:profile",
+                                           args=["right"]))
+        self.assertEqual(len(response.context["page"]), 6)
+        self.assertEqual(response.context["post_count"], 6)
+        response = self.client.post(
+            reverse("posts:add-comment", args=["right", post.pk]),
+            {"text": "Комментарий в шарде"})
+        comment = Comment.objects.using("shard_test").get(post_id=post.pk)
+        self.assertEqual(comment.author, self.reader)
+        response = self.client.get(reverse("posts:post",
+                                           args=["right", post.pk]))
+        self.assertEqual(response.context["post"], post)
+        self.assertEqual(list(response.context["comments"]), [comment])
+        self.assertContains(response, "Комментарий в шарде")
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+
+    def test_follow_feed_and_search_load_posts_from_shards(self):
+        for author in ("left", "right"):
+            self.client.get(reverse("posts:profile_follow",
+                                    args=[author]))
+        page = self.client.get(reverse("posts:follow_index")).context["page"]
+        self.assertEqual({post.author for post in page},
+                         {self.left, self.right})
+        response = self.client.get(reverse("posts:search"),
+                                   {"q": "котики right"})
+        self.assertEqual(len(response.context["page"]), 6)
+        response = self.client.get(reverse("posts:search"), {"q": "котики"})
+        self.assertEqual(len(response.context["page"]), 10)
+
+    def test_reshard_moves_posts_with_comments(self):
+        post = self.right_post()
+        Comment.objects.create(post=post, author=self.left, text="Привет")
+        out = StringIO()
+        call_command("reshard", "right", to="default", stdout=out)
+        self.assertIn("постов: 6", out.getvalue())
+        self.assertFalse(Post.objects.using("shard_test").exists())
+        self.assertFalse(Comment.objects.using("shard_test").exists())
+        moved = Post.objects.get(pk=post.pk)
+        self.assertEqual(moved.comments.get().text, "Привет")
+        self.assertEqual(shards.shard_for(self.right.pk), "default")
+        response = self.client.get(reverse("posts:search"),
+                                   {"q": "котики right"})
+        self.assertEqual(len(response.context["page"]), 6)
+
+    def test_migrate_media_covers_every_shard(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        os.makedirs(os.path.join(media_root, "posts"))
+        with open(os.path.join(media_root, "posts", "legacy.gif"),
+                  "wb") as legacy:
+            legacy.write(b"GIF89a-legacy")
+        post = self.right_post()
+        Post.objects.using("shard_test").filter(pk=post.pk).update(
+            image="posts/legacy.gif")
+        with override_settings(MEDIA_ROOT=media_root):
+            out = StringIO()
+            call_command("migrate_media", chunk_size=2, stdout=out)
+        self.assertIn("Перенесено картинок постов: 1", out.getvalue())
+        post.refresh_from_db()
+        self.assertTrue(is_content_addressed(post.image.name))
+
+    def test_gc_media_checks_thumbnails_of_every_shard(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        post = self.right_post()
+        Post.objects.using("shard_test").filter(pk=post.pk).update(
+            image="posts/current.gif")
+
+        def thumbnail(post_id, variant, source):
+            return Thumbnail.objects.create(
+                post_id=post_id, variant=variant, source=source,
+                image=f"cache/{post_id}/{variant}", width=1, height=1)
+
+        current = thumbnail(post.pk, "320.webp", "posts/current.gif")
+        thumbnail(post.pk, "640.webp", "posts/previous.gif")
+        # Пост, которого нет ни в одной базе
+        thumbnail(10 ** 6, "320.webp", "posts/lost.gif")
+        with override_settings(MEDIA_ROOT=media_root):
+            call_command("gc_media", "--batch-size=2", stdout=StringIO())
+        self.assertEqual(list(Thumbnail.objects.all()), [current])
+
+    def test_deleting_author_removes_posts_from_shard(self):
+        self.right.delete()
+        self.assertFalse(Post.objects.using("shard_test").exists())
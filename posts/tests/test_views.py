@@ -1,20 +1,43 @@
 # posts/tests/test_views.py
 import datetime as dt
+import hashlib
 import shutil
 import tempfile
-import time
+import warnings
+from io import BytesIO, StringIO
+from unittest import mock
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.paginator import UnorderedObjectListWarning
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
-from posts.models import Follow, Group, Post
+from jobs.models import Job
+from PIL import Image
+from posts import thumbnails, timeline
+from posts.forms import PostForm
+from posts.models import (Comment, Follow, Group, Post, Thumbnail,
+                          TimelineEntry, UserStats)
+from posts.storage import content_name
 
 User = get_user_model()
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b"\x47\x49\x46\x38\x39\x61\x02\x00"
+    b"\x01\x00\x80\x00\x00\x00\x00\x00"
+    b"\xFF\xFF\xFF\x21\xF9\x04\x00\x00"
+    b"\x00\x00\x00\x2C\x00\x00\x00\x00"
+    b"\x02\x00\x01\x00\x00\x02\x02\x0C"
+    b"\x0A\x00\x3B"
+)
+# Имя файла в хранилище определяется содержимым (posts.storage)
+SMALL_GIF_NAME = content_name("posts", hashlib.sha256(SMALL_GIF).hexdigest(),
+                              ".gif")
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -24,18 +47,10 @@ class PostPagesTests(TestCase):
         super().setUpClass()
         # Создаем временную папку для медиа-файлов;
         # на момент теста медиа папка будет переопределена
-        # создаем файл с картинкой
-        small_gif = (
-            b"\x47\x49\x46\x38\x39\x61\x02\x00"
-            b"\x01\x00\x80\x00\x00\x00\x00\x00"
-            b"\xFF\xFF\xFF\x21\xF9\x04\x00\x00"
-            b"\x00\x00\x00\x2C\x00\x00\x00\x00"
-            b"\x02\x00\x01\x00\x00\x02\x02\x0C"
-            b"\x0A\x00\x3B"
-        )
+        # создаем файл с картинкой из SMALL_GIF
         uploaded = SimpleUploadedFile(
             name="small.gif",
-            content=small_gif,
+            content=SMALL_GIF,
             content_type="image/gif"
         )
         # Создадим запись в БД
@@ -84,7 +99,7 @@ class PostPagesTests(TestCase):
         self.assertEqual(first_post.text, "Текст")
         self.assertEqual(type(first_post.pub_date), type(dt.datetime.now()))
         self.assertEqual(first_post.author.get_full_name(), "Stas Basov")
-        self.assertEqual(first_post.image, "posts/small.gif")
+        self.assertEqual(first_post.image, SMALL_GIF_NAME)
 
     # Проверка паджинатора на количество постов на одну страницу
     def test_paginator_returns_needed_count_posts(self):
@@ -94,6 +109,41 @@ class PostPagesTests(TestCase):
         paginator = response.context["page"]
         self.assertEqual(len(paginator), 10)
 
+    # Проверка навигации по курсорам: вперёд и обратно без пропусков
+    def test_cursor_paginator_walks_feed_both_ways(self):
+        posts_list = [Post(text=f"Текст{i}", author_id=1) for i in range(24)]
+        Post.objects.bulk_create(posts_list)
+        url = reverse("posts:index")
+        seen = []
+        pages = []
+        params = {}
+        while True:
+            page = self.authorized_client.get(url, params).context["page"]
+            pages.append(list(page))
+            seen.extend(page)
+            if not page.has_next():
+                break
+            params = {"after": page.paginator.next_cursor}
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(len(seen), Post.objects.count())
+        self.assertEqual(seen, list(Post.objects.order_by("-pub_date", "-id")))
+        # Возвращаемся со второй страницы на первую
+        first = self.authorized_client.get(url).context["page"]
+        second = self.authorized_client.get(
+            url, {"after": first.paginator.next_cursor}).context["page"]
+        self.assertEqual(list(second), pages[1])
+        back = self.authorized_client.get(
+            url, {"before": second.paginator.previous_cursor}
+        ).context["page"]
+        self.assertEqual(list(back), pages[0])
+        self.assertFalse(back.has_previous())
+
+    def test_cursor_paginator_ignores_broken_cursor(self):
+        response = self.authorized_client.get(reverse("posts:index"),
+                                              {"after": "не-курсор"})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context["page"].has_previous())
+
     # Проверка словаря контекста страницы создания поста (в нём передаётся
     # форма)
     def test_new_post_shows_correct_context(self):
@@ -130,7 +180,7 @@ class PostPagesTests(TestCase):
         self.assertEqual(first_post.author.get_full_name(),
                          "Stas Basov")
         self.assertEqual(first_post.group.title, "Тестовая группа")
-        self.assertEqual(first_post.image.name, "posts/small.gif")
+        self.assertEqual(first_post.image.name, SMALL_GIF_NAME)
         self.assertEqual(type(first_post.pub_date), type(dt.datetime.now()))
 
     def test_post_not_in_other_group_detail_page_context(self):
@@ -139,6 +189,43 @@ class PostPagesTests(TestCase):
             reverse("posts:group-detail", kwargs={"slug": "test-slug-2"}))
         self.assertEqual(len(response.context["page"]), 0)
 
+    # Миниатюры строятся вне запроса: шаблон только читает готовые
+    def test_card_shows_prebuilt_thumbnail(self):
+        url = reverse("posts:index")
+        response = self.authorized_client.get(url)
+        self.assertContains(response, f'src="/media/{SMALL_GIF_NAME}"')
+        self.assertFalse(Thumbnail.objects.exists())
+        thumbnails.generate(1)
+        self.assertEqual(Thumbnail.objects.filter(post_id=1).count(), 8)
+        image = thumbnails.responsive(Post.objects.get(pk=1))
+        # Картинку 2x1 не растягиваем до ширины варианта
+        self.assertEqual((image["src"].width, image["src"].height), (2, 1))
+        response = self.authorized_client.get(url)
+        self.assertContains(response, f'src="{image["src"].image.url}"')
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertNotContains(response, f'src="/media/{SMALL_GIF_NAME}"')
+
+    def test_post_edit_schedules_thumbnails_for_new_image(self):
+        url = reverse("posts:post-edit",
+                      kwargs={"username": self.user.username, "post_id": 1})
+        with mock.patch("posts.thumbnails.schedule") as schedule:
+            self.authorized_client.post(url, {"text": "Без новой картинки"})
+            schedule.assert_not_called()
+            uploaded = SimpleUploadedFile(
+                "other.gif", Post.objects.get(pk=1).image.read(),
+                content_type="image/gif")
+            self.authorized_client.post(
+                url, {"text": "С картинкой", "image": uploaded})
+            schedule.assert_called_once()
+
+    def test_build_thumbnails_command_skips_ready_posts(self):
+        out = StringIO()
+        call_command("build_thumbnails", stdout=out)
+        call_command("build_thumbnails", stdout=out)
+        self.assertEqual(out.getvalue().split(),
+                         "Миниатюры построены для постов: 1 "
+                         "Миниатюры построены для постов: 0".split())
+
 # Проверка словаря контекста страницы редактирования поста (в нём передаётся
     # форма)
     def test_post_edit_shows_correct_context(self):
@@ -175,7 +262,7 @@ class PostPagesTests(TestCase):
         self.assertEqual(first_post.author.get_full_name(),
                          "Stas Basov")
         self.assertEqual(first_post.group.title, "Тестовая группа")
-        self.assertEqual(first_post.image.name, "posts/small.gif")
+        self.assertEqual(first_post.image.name, SMALL_GIF_NAME)
         self.assertEqual(type(first_post.pub_date), type(dt.datetime.now()))
 
     # Проверяем, что словарь context страницы /<username>/<post_id>/
@@ -191,19 +278,71 @@ class PostPagesTests(TestCase):
                          "Stas Basov")
         self.assertEqual(response.context["post_count"], 1)
 
-    def test_cache_index_page(self):
-        """Главная страница кэшируется каждые 20 секунд"""
-        first_response = self.authorized_client.get(reverse("posts:index"))
-        Post.objects.create(
-            text="Текст проверка кэша",
-            group_id=1,
-            author_id=1,
-        )
-        second_response = self.authorized_client.get(reverse("posts:index"))
-        time.sleep(21)
-        third_response = self.authorized_client.get(reverse("posts:index"))
-        self.assertEqual(first_response.content, second_response.content)
-        self.assertNotEqual(second_response.content, third_response.content)
+    def test_post_cards_are_cached_until_edited(self):
+        """Карточки постов кэшируются до редактирования поста"""
+        cache.clear()
+        post = Post.objects.create(text="Текст проверка кэша", author_id=1)
+        self.authorized_client.get(reverse("posts:index"))
+        # Изменение в обход save() не меняет версию - карточка из кэша
+        Post.objects.filter(id=post.id).update(text="Текст мимо кэша")
+        response = self.authorized_client.get(reverse("posts:index"))
+        self.assertContains(response, "Текст проверка кэша")
+        # Редактирование меняет версию и сразу видно на всех лентах
+        self.authorized_client.post(
+            reverse("posts:post-edit", kwargs={"username": "StasBasov",
+                                               "post_id": post.id}),
+            {"text": "Отредактированный текст"})
+        for url in (reverse("posts:index"),
+                    reverse("posts:profile",
+                            kwargs={"username": "StasBasov"})):
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertContains(response, "Отредактированный текст")
+
+    def test_cached_cards_follow_group_changes(self):
+        """Переименование и удаление группы видно в карточках из кэша"""
+        cache.clear()
+        post = Post.objects.create(text="Пост в группе", author_id=1,
+                                   group_id=2)
+        url = reverse("posts:index")
+        self.authorized_client.get(url)
+        group = Group.objects.get(pk=2)
+        group.title = "Переименованная группа"
+        group.save()
+        response = self.authorized_client.get(url)
+        self.assertContains(response, "#Переименованная группа")
+        group.delete()
+        response = self.authorized_client.get(url)
+        self.assertNotContains(response, "#Переименованная группа")
+        self.assertContains(response, post.text)
+
+    def test_post_edit_keeps_comments_added_meanwhile(self):
+        """Комментарий, добавленный во время правки, остаётся в счётчике"""
+        post = Post.objects.create(text="Текст", author=self.user)
+        validate = PostForm.is_valid
+
+        def comment_then_validate(form):
+            Comment.objects.create(post=post, author=self.user_2,
+                                   text="Пока правили")
+            return validate(form)
+
+        with mock.patch.object(PostForm, "is_valid", comment_then_validate):
+            self.authorized_client.post(
+                reverse("posts:post-edit",
+                        kwargs={"username": "StasBasov", "post_id": post.id}),
+                {"text": "Исправленный текст"})
+        post.refresh_from_db()
+        self.assertEqual(post.text, "Исправленный текст")
+        self.assertEqual(post.comment_count, 1)
+
+    def test_edit_button_is_not_cached_for_other_users(self):
+        """Кнопка редактирования видна только автору, даже из кэша"""
+        edit_url = reverse("posts:post-edit",
+                           kwargs={"username": "StasBasov", "post_id": 1})
+        response = self.authorized_client.get(reverse("posts:index"))
+        self.assertContains(response, edit_url)
+        response = self.authorized_client_2.get(reverse("posts:index"))
+        self.assertNotContains(response, edit_url)
 
     def test_follow_view_working(self):
         """Проверим возможность подписки на другого
@@ -280,3 +419,402 @@ class PostPagesTests(TestCase):
             reverse("posts:add-comment",
                     kwargs={"username": "StasBasov", "post_id": 1}))
         self.assertEqual(response.status_code, 200)
+
+    def test_unfollow_removes_author_posts_from_follow_index(self):
+        """После отписки посты автора пропадают из ленты подписок"""
+        post = Post.objects.create(text="Проверка ленты", author_id=1)
+        self.authorized_client_2.get(
+            reverse("posts:profile_follow",
+                    kwargs={"username": "StasBasov"}))
+        response = self.authorized_client_2.get(
+            reverse("posts:follow_index"))
+        self.assertIn(post, response.context["page"])
+        self.authorized_client_2.get(
+            reverse("posts:profile_unfollow",
+                    kwargs={"username": "StasBasov"}))
+        response = self.authorized_client_2.get(
+            reverse("posts:follow_index"))
+        self.assertNotIn(post, response.context["page"])
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user_2))
+
+    def test_rebuild_timeline_command_restores_feed(self):
+        """Команда rebuild_timeline пересобирает ленту с нуля"""
+        Follow.objects.create(user=self.user_2, author=self.user)
+        TimelineEntry.objects.all().delete()
+        call_command("rebuild_timeline", self.user_2.username,
+                     stdout=StringIO())
+        response = self.authorized_client_2.get(
+            reverse("posts:follow_index"))
+        self.assertEqual(list(response.context["page"]),
+                         list(Post.objects.filter(author=self.user)))
+
+    def test_user_stats_follow_posts_and_subscriptions(self):
+        """Счётчики профиля меняются вместе с постами и подписками"""
+        Follow.objects.create(user=self.user_2, author=self.user)
+        post = Post.objects.create(text="Ещё пост", author=self.user)
+        response = self.authorized_client.get(
+            reverse("posts:profile", kwargs={"username": "StasBasov"}))
+        self.assertEqual(response.context["post_count"], 2)
+        self.assertEqual(response.context["followers"], 1)
+        self.assertEqual(response.context["followings"], 0)
+        post.delete()
+        Follow.objects.filter(user=self.user_2).delete()
+        self.assertEqual(UserStats.objects.values_list(
+            "posts", "followers").get(user=self.user), (1, 0))
+        self.assertEqual(UserStats.objects.get(user=self.user_2).followings,
+                         0)
+
+    def test_recount_command_fixes_drift(self):
+        """Команда recount исправляет разошедшиеся счётчики"""
+        Follow.objects.create(user=self.user_2, author=self.user)
+        UserStats.objects.update(posts=100, followers=0, followings=7)
+        call_command("recount", chunk_size=1, stdout=StringIO())
+        self.assertEqual(
+            list(UserStats.objects.order_by("user_id").values_list(
+                "posts", "followers", "followings")),
+            [(1, 1, 0), (0, 0, 1)])
+
+    def test_comment_count_follows_comments(self):
+        """Число комментариев хранится в посте и выводится в ленте"""
+        self.authorized_client.post(
+            reverse("posts:add-comment",
+                    kwargs={"username": "StasBasov", "post_id": 1}),
+            {"text": "Комментарий"})
+        self.assertEqual(Post.objects.get(id=1).comment_count, 1)
+        response = self.authorized_client.get(
+            reverse("posts:group-detail", kwargs={"slug": "test-slug"}))
+        self.assertContains(response, "Комментариев: 1")
+        Comment.objects.all().delete()
+        self.assertEqual(Post.objects.get(id=1).comment_count, 0)
+        Post.objects.filter(id=1).update(comment_count=5)
+        call_command("recount", stdout=StringIO())
+        self.assertEqual(Post.objects.get(id=1).comment_count, 0)
+
+
+@override_settings(FEED_FANOUT_MAX_FOLLOWERS=1, FEED_RECENT_POSTS=3)
+class HybridFollowFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username="reader")
+        self.fan = User.objects.create_user(username="fan")
+        # У celebrity два подписчика - больше порога, её посты
+        # подмешиваются при чтении; у regular один - раскладываются
+        self.celebrity = User.objects.create_user(username="celebrity")
+        self.regular = User.objects.create_user(username="regular")
+        Follow.objects.create(user=self.reader, author=self.celebrity)
+        Follow.objects.create(user=self.fan, author=self.celebrity)
+        Follow.objects.create(user=self.reader, author=self.regular)
+        for i in range(6):
+            Post.objects.create(text=f"celebrity {i}", author=self.celebrity)
+            Post.objects.create(text=f"regular {i}", author=self.regular)
+        self.client.force_login(self.reader)
+
+    def test_pulled_author_posts_are_not_fanned_out(self):
+        self.assertFalse(
+            TimelineEntry.objects.filter(author=self.celebrity).exists())
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 6)
+
+    def test_author_dropping_below_threshold_is_fanned_out_again(self):
+        """Посты, пропущенные раскладкой, возвращаются в ленты"""
+        Follow.objects.get(user=self.fan, author=self.celebrity).delete()
+        self.assertFalse(timeline.is_pulled(self.celebrity.pk))
+        call_command("runworker", "--once", "--threads=0", stdout=StringIO())
+        self.assertEqual(TimelineEntry.objects.filter(
+            user=self.reader, author=self.celebrity).count(), 6)
+        cache.clear()
+        response = self.client.get(reverse("posts:follow_index"))
+        self.assertEqual(
+            list(response.context["page"]),
+            list(Post.objects.order_by("-pub_date", "-id")[:10]))
+
+    def test_author_crossing_threshold_is_pulled_for_all_followers(self):
+        """Старые подписчики сразу видят посты автора, ушедшего за порог"""
+        url = reverse("posts:follow_index")
+        self.client.get(url)
+        # Список подмешиваемых авторов у reader закэширован без regular
+        self.assertNotIn(self.regular.pk,
+                         timeline.pulled_authors(self.reader.pk))
+        Follow.objects.create(user=self.fan, author=self.regular)
+        self.assertTrue(timeline.is_pulled(self.regular.pk))
+        post = Post.objects.create(text="после порога", author=self.regular)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        response = self.client.get(url)
+        self.assertEqual(response.context["page"][0], post)
+
+    def test_follow_feed_needs_no_ordered_queryset(self):
+        """Порядок ленты задают курсоры, а не сортировка queryset"""
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            timeline.FollowFeedPaginator(self.reader, 10).get_page()
+        self.assertFalse([warning for warning in caught if issubclass(
+            warning.category, UnorderedObjectListWarning)])
+
+    def test_follow_index_merges_pushed_and_pulled_posts(self):
+        """Лента подписок сливает оба источника в порядке публикации"""
+        url = reverse("posts:follow_index")
+        first = self.client.get(url).context["page"]
+        second = self.client.get(
+            url, {"after": first.paginator.next_cursor}).context["page"]
+        expected = list(Post.objects.order_by("-pub_date", "-id"))
+        self.assertEqual(list(first), expected[:10])
+        self.assertEqual(list(second), expected[10:])
+        self.assertFalse(second.has_next())
+        back = self.client.get(
+            url, {"before": second.paginator.previous_cursor}
+        ).context["page"]
+        self.assertEqual(list(back), expected[:10])
+
+
+@override_settings(FEED_FANOUT_INLINE_FOLLOWERS=0,
+                   FEED_BACKFILL_INLINE_POSTS=2)
+class QueuedTimelineTests(TestCase):
+    """Большие раскладки постов по лентам уходят в фоновую очередь"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author")
+        self.reader = User.objects.create_user(username="reader")
+
+    def run_worker(self):
+        call_command("runworker", "--once", "--threads=0", stdout=StringIO())
+
+    def test_fan_out_runs_in_worker(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text="Пост", author=self.author)
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertTrue(Job.objects.filter(key=f"fan_out:{post.pk}").exists())
+        self.run_worker()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+
+    def test_follow_backfills_recent_posts_at_once(self):
+        posts = [Post.objects.create(text=f"Пост {i}", author=self.author)
+                 for i in range(5)]
+        self.client.force_login(self.reader)
+        self.client.get(reverse("posts:profile_follow",
+                                kwargs={"username": "author"}))
+        timeline = TimelineEntry.objects.filter(user=self.reader)
+        self.assertEqual(set(timeline.values_list("post_id", flat=True)),
+                         {posts[-1].pk, posts[-2].pk})
+        self.run_worker()
+        self.assertEqual(timeline.count(), 5)
+
+
+class FeedQueryBudgetTests(TestCase):
+    """Число запросов страниц не зависит от числа постов на странице"""
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username="reader")
+        groups = [Group.objects.create(title=f"Группа {i}", slug=f"group-{i}",
+                                       description="Описание")
+                  for i in range(2)]
+        authors = [User.objects.create_user(username=f"author{i}")
+                   for i in range(3)]
+        for author in authors:
+            Follow.objects.create(user=self.reader, author=author)
+        for i in range(15):
+            Post.objects.create(text=f"Пост {i}", author=authors[i % 3],
+                                group=groups[i % 2])
+        self.post = Post.objects.filter(author=authors[0]).first()
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text="Комментарий")
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def test_feed_views_query_budget(self):
+        budgets = {
+            reverse("posts:index"): 1,
+            reverse("posts:group-detail", kwargs={"slug": "group-0"}): 2,
+            reverse("posts:profile", kwargs={"username": "author0"}): 2,
+            reverse("posts:post", kwargs={"username": "author0",
+                                          "post_id": self.post.id}): 2,
+        }
+        for url, queries in budgets.items():
+            with self.subTest(url=url):
+                with self.assertNumQueries(queries):
+                    self.client.get(url)
+        # Сессия, пользователь, авторы для подмешивания, лента и посты
+        with self.assertNumQueries(5):
+            self.authorized_client.get(reverse("posts:follow_index"))
+
+
+class AnonymousPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author")
+        self.reader = User.objects.create_user(username="reader")
+        self.post = Post.objects.create(text="Первый пост", author=self.author)
+        self.urls = [
+            reverse("posts:index"),
+            reverse("posts:profile", kwargs={"username": "author"}),
+            reverse("posts:post", kwargs={"username": "author",
+                                          "post_id": self.post.id}),
+        ]
+
+    def test_repeat_visit_is_served_from_cache(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.client.get(url)
+                with self.assertNumQueries(0):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.has_header("ETag"))
+                self.assertTrue(response.has_header("Last-Modified"))
+
+    def test_conditional_get_returns_not_modified(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)["ETag"]
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b"")
+
+    def test_changes_invalidate_cached_pages(self):
+        for url in self.urls:
+            self.client.get(url)
+        Post.objects.create(text="Второй пост", author=self.author)
+        self.assertContains(self.client.get(self.urls[0]), "Второй пост")
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.client.get(self.urls[1])
+        self.assertEqual(response.context["followers"], 1)
+
+    def test_pages_are_not_cached_for_authorized_users(self):
+        self.client.force_login(self.reader)
+        self.client.get(self.urls[0])
+        response = self.client.get(self.urls[0])
+        self.assertIsNotNone(response.context)
+        self.assertFalse(response.has_header("ETag"))
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author")
+        self.other = User.objects.create_user(username="other")
+        self.group = Group.objects.create(title="Группа", slug="group",
+                                          description="Описание")
+        self.first = Post.objects.create(
+            text="Сегодня видели котиков на крыше", author=self.author,
+            group=self.group)
+        self.second = Post.objects.create(
+            text="Котики, котики и ещё раз котики", author=self.other)
+        Post.objects.create(text="Про собак", author=self.author)
+
+    def search(self, **params):
+        response = self.client.get(reverse("posts:search"), params)
+        return list(response.context["page"])
+
+    def test_search_ranks_results(self):
+        self.assertEqual(self.search(q="котик"), [self.second, self.first])
+        self.assertEqual(self.search(q="крыше котиков"), [self.first])
+        self.assertEqual(self.search(q=""), [])
+        self.assertEqual(self.search(q='"; DROP'), [])
+
+    def test_search_filters_by_group_and_author(self):
+        self.assertEqual(self.search(q="котик", group="group"), [self.first])
+        self.assertEqual(self.search(q="котик", author="other"),
+                         [self.second])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.second.text = "Теперь про попугаев"
+        self.second.save()
+        self.assertEqual(self.search(q="попугаев"), [self.second])
+        self.assertEqual(self.search(q="котик"), [self.first])
+        self.first.delete()
+        self.assertEqual(self.search(q="котик"), [])
+
+    def test_search_results_are_paginated_by_cursor(self):
+        Post.objects.bulk_create(
+            [Post(text=f"Попугай номер {i}", author=self.author)
+             for i in range(12)])
+        call_command("rebuild_search_index", stdout=StringIO())
+        url = reverse("posts:search")
+        first = self.client.get(url, {"q": "попугай"}).context["page"]
+        self.assertEqual(len(first), 10)
+        response = self.client.get(
+            url, {"q": "попугай", "after": first.paginator.next_cursor})
+        self.assertEqual(len(response.context["page"]), 2)
+        self.assertContains(response, "q=%D0%BF%D0%BE%D0%BF%D1%83%D0%B3"
+                                      "%D0%B0%D0%B9&amp;before=")
+        seen = set(first) | set(response.context["page"])
+        self.assertEqual(len(seen), 12)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailBatchTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user(username="author")
+        for i in range(5):
+            post = Post.objects.create(
+                text=f"Пост {i}", author=author,
+                image=SimpleUploadedFile(
+                    f"batch{i}.gif", SMALL_GIF,
+                    content_type="image/gif"))
+            thumbnails.generate(post.pk)
+        Post.objects.create(text="Без картинки", author=author)
+        cache.clear()
+
+    def test_feed_page_loads_thumbnails_in_one_query(self):
+        url = reverse("posts:index")
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response["X-Thumbnail-Lookups"], "1")
+        self.assertEqual(response.content.decode().count("<picture>"), 5)
+
+    def test_cached_cards_need_no_lookups(self):
+        client = Client()
+        client.force_login(User.objects.create_user(username="reader"))
+        url = reverse("posts:index")
+        client.get(url)
+        response = client.get(url)
+        self.assertEqual(response["X-Thumbnail-Lookups"], "0")
+
+    def test_build_thumbnails_walks_posts_in_chunks(self):
+        posts = list(Post.objects.exclude(image="").order_by("pk"))
+        Thumbnail.objects.filter(
+            post__in=[posts[0], posts[2], posts[4]]).delete()
+        out = StringIO()
+        call_command("build_thumbnails", chunk_size=2, stdout=out)
+        self.assertIn("построены для постов: 3", out.getvalue())
+        for post in posts:
+            self.assertEqual(Thumbnail.objects.filter(post=post).count(),
+                             len(thumbnails.variants()))
+
+    def test_rebuild_is_scheduled_again_after_job_finished(self):
+        """Выполненная сборка не мешает поставить её повторно"""
+        post = Post.objects.exclude(image="").first()
+        Thumbnail.objects.filter(post=post).delete()
+        thumbnails.schedule(post)
+        thumbnails.schedule(post)
+        self.assertEqual(Job.objects.filter(status=Job.QUEUED).count(), 1)
+        call_command("runworker", "--once", "--threads=0", stdout=StringIO())
+        self.assertTrue(Thumbnail.objects.filter(post=post).exists())
+        thumbnails.schedule(post)
+        self.assertEqual(Job.objects.filter(status=Job.QUEUED).count(), 1)
+
+    def test_variants_cover_configured_widths(self):
+        buffer = BytesIO()
+        Image.new("RGB", (1200, 424), "teal").save(buffer, "JPEG")
+        post = Post.objects.create(
+            text="Большая картинка", author_id=1,
+            image=SimpleUploadedFile("big.jpg", buffer.getvalue(),
+                                     content_type="image/jpeg"))
+        thumbnails.generate(post.pk)
+        image = thumbnails.responsive(Post.objects.get(pk=post.pk))
+        widths = [int(item.split()[1][:-1])
+                  for item in image["webp"].split(", ")]
+        # 1920 упирается в ширину оригинала: растягивать не нужно
+        self.assertEqual(widths, [320, 640, 960, 1200])
+        self.assertEqual(image["jpeg"].count(", "), 3)
+        self.assertEqual((image["src"].width, image["src"].height),
+                         (960, 339))
+        smallest = Thumbnail.objects.get(post=post, variant="320.webp")
+        self.assertLess(smallest.image.size, post.image.size)
@@ -0,0 +1,165 @@
+"""
+Миниатюры картинок постов, построенные заранее.
+
+Раньше шаблоны вызывали {% thumbnail %} из sorl-thumbnail, и первый
+запрос к новому посту декодировал, обрезал и кодировал картинку прямо
+в веб-воркере. Теперь views после сохранения формы ставят сборку в
+фоновую очередь (jobs), готовые варианты записываются в модель Thumbnail,
+а шаблоны только читают их (фильтр post_images.responsive_image).
+"""
+import threading
+
+from django.conf import settings
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+from sorl.thumbnail import get_thumbnail
+
+from jobs.queue import enqueue, task
+
+from . import page_cache, shards
+from .models import Post, Thumbnail
+
+# Пропорции карточки поста (960x339) и форматы вариантов: WebP для
+# браузеров, которые его понимают, JPEG - для остальных
+ASPECT = 339 / 960
+FORMATS = ("webp", "jpeg")
+# Ширина варианта в src у <img> для клиентов без поддержки srcset
+DEFAULT_WIDTH = 960
+
+# Число обращений к таблице миниатюр за текущий запрос (по потокам)
+_lookups = threading.local()
+
+
+def variants():
+    """
+    Варианты миниатюр: имя вида "640.webp" -> геометрия и опции
+    sorl-thumbnail. Ширины задаёт settings.POST_IMAGE_WIDTHS; маленькие
+    картинки не растягиваются, чтобы не раздувать трафик.
+    """
+    return {
+        f"{width}.{image_format}": (
+            f"{width}x{round(width * ASPECT)}",
+            {"crop": "center", "upscale": False,
+             "format": image_format.upper()})
+        for width in settings.POST_IMAGE_WIDTHS
+        for image_format in FORMATS
+    }
+
+
+@task
+def generate(post_id):
+    """
+    Строит все варианты миниатюр поста и удаляет устаревшие. Меняет
+    post.modified, чтобы закэшированные карточки перестроились.
+    """
+    post = shards.find_post(post_id)
+    if post is None:
+        return
+    if not post.image:
+        Thumbnail.objects.filter(post_id=post_id).delete()
+    else:
+        post_variants = variants()
+        for variant, (geometry, options) in post_variants.items():
+            thumbnail = get_thumbnail(post.image, geometry, **options)
+            Thumbnail.objects.update_or_create(
+                post_id=post_id, variant=variant,
+                defaults={"source": post.image.name,
+                          "image": thumbnail.name,
+                          "width": thumbnail.width,
+                          "height": thumbnail.height})
+        Thumbnail.objects.filter(post_id=post_id).exclude(
+            variant__in=post_variants).delete()
+    Post.objects.using(post._state.db).filter(pk=post_id).update(
+        modified=timezone.now())
+    page_cache.invalidate(page_cache.FEED)
+
+
+def schedule(post):
+    """
+    Ставит сборку миниатюр в фоновую очередь. Ключ включает имя файла:
+    повторное сохранение той же картинки, пока сборка ждёт в очереди,
+    новую задачу не добавит.
+    """
+    enqueue(generate, post.pk, priority=5,
+            key=f"thumbnails:{post.pk}:{post.image.name}")
+
+
+def reset_lookups():
+    _lookups.count = 0
+
+
+def lookups():
+    return getattr(_lookups, "count", 0)
+
+
+def _count_lookup():
+    _lookups.count = lookups() + 1
+
+
+class _PageBatch:
+    """Миниатюры постов страницы; загружаются разом при первом обращении."""
+
+    def __init__(self, posts):
+        self.posts = posts
+        self.loaded = False
+
+    def load(self):
+        if not self.loaded:
+            self.loaded = True
+            _count_lookup()
+            prefetch_related_objects(self.posts, "thumbnails")
+
+
+def attach(posts):
+    """
+    Связывает посты страницы: первая карточка, которой понадобится
+    миниатюра, загрузит миниатюры всех постов одним запросом. Если все
+    карточки взяты из кэша фрагментов, запроса не будет вовсе.
+    """
+    with_images = [post for post in posts if post.image]
+    batch = _PageBatch(with_images)
+    for post in with_images:
+        post._thumbnail_batch = batch
+    return posts
+
+
+def ready(post):
+    """Готовые миниатюры текущей картинки поста."""
+    batch = getattr(post, "_thumbnail_batch", None)
+    if batch is not None:
+        batch.load()
+    elif "thumbnails" not in getattr(post, "_prefetched_objects_cache", {}):
+        # Пост вне страницы (например, на странице поста): загружаем один
+        # раз, повторные вызовы читают уже загруженное
+        _count_lookup()
+        prefetch_related_objects([post], "thumbnails")
+    return [thumbnail for thumbnail in post.thumbnails.all()
+            if thumbnail.source == post.image.name]
+
+
+def _srcset(thumbnails):
+    widths = {}
+    for thumbnail in sorted(thumbnails, key=lambda item: item.width):
+        # Маленький оригинал даёт несколько вариантов одной ширины
+        widths.setdefault(thumbnail.width, thumbnail)
+    return ", ".join(f"{thumbnail.image.url} {width}w"
+                     for width, thumbnail in widths.items())
+
+
+def responsive(post):
+    """
+    Данные для <picture>: srcset в WebP и JPEG и вариант для src.
+    None, пока миниатюры не построены.
+    """
+    by_format = {image_format: [] for image_format in FORMATS}
+    for thumbnail in ready(post):
+        image_format = thumbnail.variant.rpartition(".")[2]
+        if image_format in by_format:
+            by_format[image_format].append(thumbnail)
+    if not by_format["jpeg"]:
+        return None
+    src = min(by_format["jpeg"],
+              key=lambda item: abs(item.width - DEFAULT_WIDTH))
+    return {"src": src,
+            "webp": _srcset(by_format["webp"]),
+            "jpeg": _srcset(by_format["jpeg"])}
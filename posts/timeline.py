@@ -0,0 +1,264 @@
+import heapq
+
+from django.conf import settings
+from django.core.cache import cache
+
+from jobs.queue import enqueue, task
+
+from . import shards
+from .models import Follow, TimelineEntry, UserStats
+from .paginator import CursorPaginator
+
+BATCH_SIZE = 500
+# Сколько секунд помнить, каких авторов подмешивать в ленту пользователя
+PULLED_AUTHORS_TIMEOUT = 60
+
+
+def _recent_key(author_id):
+    return f"timeline:recent:{author_id}"
+
+
+def _pulled_key(user_id):
+    return f"timeline:pulled:{user_id}"
+
+
+def _insert(entries):
+    TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE,
+                                      ignore_conflicts=True)
+
+
+def is_pulled(author_id):
+    """
+    Посты авторов с большой аудиторией не раскладываются по лентам при
+    публикации, а подмешиваются при чтении.
+    """
+    return UserStats.objects.filter(
+        user_id=author_id,
+        followers__gt=settings.FEED_FANOUT_MAX_FOLLOWERS).exists()
+
+
+def _followers(author_id):
+    return UserStats.objects.filter(user_id=author_id).values_list(
+        "followers", flat=True).first() or 0
+
+
+def fan_out(post):
+    """
+    Раскладывает новый пост по лентам всех подписчиков автора. Если их
+    больше FEED_FANOUT_INLINE_FOLLOWERS, это делает фоновая очередь.
+    """
+    cache.delete(_recent_key(post.author_id))
+    followers = _followers(post.author_id)
+    if followers > settings.FEED_FANOUT_MAX_FOLLOWERS:
+        return
+    if followers > settings.FEED_FANOUT_INLINE_FOLLOWERS:
+        enqueue(fan_out_post, post.pk, priority=10, key=f"fan_out:{post.pk}")
+        return
+    fan_out_post(post.pk)
+
+
+@task
+def fan_out_post(post_id):
+    post = shards.find_post(post_id)
+    if post is None:
+        return
+    author_id, pub_date = post.author_id, post.pub_date
+    followers = Follow.objects.filter(
+        author_id=author_id).values_list("user_id", flat=True)
+    entries = []
+    for user_id in followers.iterator():
+        entries.append(TimelineEntry(user_id=user_id, post_id=post_id,
+                                     author_id=author_id, pub_date=pub_date))
+        if len(entries) >= BATCH_SIZE:
+            _insert(entries)
+            entries = []
+    _insert(entries)
+
+
+def forget(post):
+    """Сбрасывает кэш последних постов автора удалённого поста."""
+    cache.delete(_recent_key(post.author_id))
+
+
+def _entries(user_id, author_id, posts):
+    return [TimelineEntry(user_id=user_id, post_id=post_id,
+                          author_id=author_id, pub_date=pub_date)
+            for post_id, pub_date in posts]
+
+
+def backfill(user_id, author_id):
+    """
+    Добавляет в ленту пользователя посты нового автора: последние
+    FEED_BACKFILL_INLINE_POSTS сразу, остальные - фоновой задачей.
+    """
+    followers = _followers(author_id)
+    if followers == settings.FEED_FANOUT_MAX_FOLLOWERS + 1:
+        # Эта подписка перевела автора за порог: его новые посты больше не
+        # раскладываются, и подписчики должны увидеть его среди
+        # подмешиваемых авторов сразу, а не когда истечёт их кэш
+        _forget_pulled(author_id)
+    else:
+        cache.delete(_pulled_key(user_id))
+    if followers > settings.FEED_FANOUT_MAX_FOLLOWERS:
+        return
+    limit = settings.FEED_BACKFILL_INLINE_POSTS
+    recent = list(shards.posts(author_id)
+                  .order_by("-pub_date", "-id")
+                  .values_list("id", "pub_date")[:limit + 1])
+    _insert(_entries(user_id, author_id, recent[:limit]))
+    if len(recent) > limit:
+        enqueue(backfill_all, user_id, author_id, priority=10)
+
+
+def _forget_pulled(author_id):
+    """Сбрасывает кэш подмешиваемых авторов у всех подписчиков автора."""
+    followers = Follow.objects.filter(
+        author_id=author_id).values_list("user_id", flat=True)
+    keys = []
+    for user_id in followers.iterator():
+        keys.append(_pulled_key(user_id))
+        if len(keys) >= BATCH_SIZE:
+            cache.delete_many(keys)
+            keys = []
+    cache.delete_many(keys)
+
+
+@task
+def backfill_all(user_id, author_id):
+    """Добавляет в ленту пользователя все посты автора."""
+    if not Follow.objects.filter(user_id=user_id,
+                                 author_id=author_id).exists():
+        # Пока задача ждала в очереди, пользователь отписался
+        return
+    batch = []
+    for posts in (shards.posts(author_id),
+                  shards.archived(author_id=author_id)):
+        for row in posts.values_list("id", "pub_date").iterator():
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                _insert(_entries(user_id, author_id, batch))
+                batch = []
+    _insert(_entries(user_id, author_id, batch))
+
+
+@task
+def backfill_followers(author_id):
+    """
+    Добавляет посты автора в ленты всех его подписчиков: пока подписчиков
+    было больше порога, новые посты по лентам не раскладывались.
+    """
+    followers = Follow.objects.filter(
+        author_id=author_id).values_list("user_id", flat=True)
+    for user_id in followers.iterator():
+        backfill_all(user_id, author_id)
+
+
+def prune(user_id, author_id):
+    """
+    Убирает из ленты пользователя посты автора после отписки. Вызывается
+    после уменьшения счётчика подписчиков в транзакции удаления Follow,
+    поэтому переход автора обратно через порог видит ровно одна отписка.
+    """
+    cache.delete(_pulled_key(user_id))
+    TimelineEntry.objects.filter(user_id=user_id,
+                                 author_id=author_id).delete()
+    if _followers(author_id) == settings.FEED_FANOUT_MAX_FOLLOWERS:
+        # Посты автора больше не подмешиваются при чтении: то, что он
+        # опубликовал за порогом, раскладываем по лентам задним числом
+        enqueue(backfill_followers, author_id, priority=10,
+                key=f"backfill_followers:{author_id}")
+
+
+def rebuild(user_id):
+    """Пересобирает ленту пользователя с нуля по его подпискам."""
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    authors = Follow.objects.filter(user_id=user_id).values_list(
+        "author_id", flat=True)
+    cache.delete(_pulled_key(user_id))
+    for author_id in authors:
+        if not is_pulled(author_id):
+            backfill_all(user_id, author_id)
+
+
+def pulled_authors(user_id):
+    """Авторы из подписок пользователя, чьи посты подмешиваются при чтении."""
+    authors = cache.get(_pulled_key(user_id))
+    if authors is None:
+        authors = list(Follow.objects.filter(
+            user_id=user_id,
+            author__stats__followers__gt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+        ).values_list("author_id", flat=True))
+        cache.set(_pulled_key(user_id), authors, PULLED_AUTHORS_TIMEOUT)
+    return authors
+
+
+def recent_posts(author_ids):
+    """
+    Ключи (pub_date, id) последних FEED_RECENT_POSTS постов каждого автора,
+    по убыванию. Кэш сбрасывается при публикации и удалении поста.
+    """
+    keys = {_recent_key(author_id): author_id for author_id in author_ids}
+    cached = cache.get_many(list(keys))
+    recent = {keys[key]: rows for key, rows in cached.items()}
+    missing = {}
+    for author_id in author_ids:
+        if author_id not in recent:
+            recent[author_id] = shards.author_keys(
+                author_id, None, True, settings.FEED_RECENT_POSTS)
+            missing[_recent_key(author_id)] = recent[author_id]
+    if missing:
+        cache.set_many(missing, None)
+    return recent
+
+
+def _author_rows(author_id, recent, cursor, older, limit):
+    """
+    Посты автора от курсора: из кэша последних постов, а если курсор
+    ушёл глубже закэшированного окна - запросом по индексу автора (и
+    архиву за его границей).
+    """
+    complete = len(recent) < settings.FEED_RECENT_POSTS
+    if older:
+        rows = [row for row in recent if cursor is None or row < cursor]
+        if complete or len(rows) >= limit:
+            return rows[:limit]
+    elif complete or (recent and recent[-1] <= cursor):
+        return [row for row in reversed(recent) if row > cursor][:limit]
+    return shards.author_keys(author_id, cursor, older, limit)
+
+
+class FollowFeedPaginator(CursorPaginator):
+    """
+    Лента подписок: материализованная лента пользователя, слитая
+    (heapq.merge) с постами авторов с большой аудиторией.
+    """
+
+    def __init__(self, user, per_page):
+        super().__init__(user.timeline.values_list("pub_date", "post_id"),
+                         per_page, keys=("pub_date", "post_id"))
+        self.user = user
+
+    def _fetch(self, cursor, older):
+        limit = self.per_page + 1
+        streams = [super()._fetch(cursor, older)]
+        authors = pulled_authors(self.user.pk)
+        for author_id, recent in recent_posts(authors).items():
+            streams.append(
+                _author_rows(author_id, recent, cursor, older, limit))
+        rows, seen = [], set()
+        # Пост автора, перешедшего порог, может быть и в материализованной
+        # ленте, и в кэше его последних постов
+        for row in heapq.merge(*streams, reverse=older):
+            if row[1] not in seen:
+                seen.add(row[1])
+                rows.append(row)
+                if len(rows) == limit:
+                    break
+        return rows
+
+    def _key(self, row):
+        return row
+
+    def _load(self, rows):
+        posts = shards.load_posts([post_id for _, post_id in rows])
+        return [posts[post_id] for _, post_id in rows if post_id in posts]
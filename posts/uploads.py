@@ -0,0 +1,164 @@
+"""
+Проверка и нормализация загруженных картинок в пуле процессов.
+
+Pillow разбирает файл целиком, и одна «декомпрессионная бомба» (PNG на
+сотни мегапикселей) способна занять процессор и память веб-воркера.
+Поэтому картинка обрабатывается в отдельном процессе пула: с лимитом
+пикселей, ограничением памяти процесса и временем на задачу. Там же
+слишком большие оригиналы уменьшаются, а метаданные (EXIF с координатами
+съёмки и т.п.) отбрасываются при перекодировании.
+"""
+import io
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.template.defaultfilters import filesizeformat
+
+# Форматы, которые принимаются и сохраняются как есть
+FORMATS = {"JPEG": "jpg", "PNG": "png", "GIF": "gif", "WEBP": "webp"}
+
+INVALID_IMAGE = ("Загрузите правильное изображение. Файл, который вы "
+                 "загрузили, поврежден или не является изображением.")
+
+
+class ImageRejected(Exception):
+    """Картинку нельзя принять; сообщение показывается пользователю."""
+
+
+class _JobTimeout(Exception):
+    pass
+
+
+def _init_worker(memory_limit):
+    # Лимит адресного пространства действует на весь процесс пула, но
+    # память освобождается после каждой задачи, так что по сути - на задачу
+    if memory_limit:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+def _on_alarm(signum, frame):
+    raise _JobTimeout
+
+
+def _open(data, max_pixels):
+    from PIL import Image
+
+    # Сами проверяем размер до декодирования пикселей
+    Image.MAX_IMAGE_PIXELS = None
+    try:
+        image = Image.open(io.BytesIO(data))
+    except Exception:
+        raise ImageRejected(INVALID_IMAGE)
+    if image.format not in FORMATS:
+        raise ImageRejected("Поддерживаются форматы JPEG, PNG, GIF и WebP.")
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ImageRejected(f"Изображение слишком большое: {width}x{height}.")
+    return image
+
+
+def _reencode(image, max_side):
+    from PIL import ImageOps
+
+    image_format = image.format
+    output = io.BytesIO()
+    if getattr(image, "n_frames", 1) > 1:
+        # Анимацию перекодируем целиком, но не масштабируем
+        if max(image.size) > max_side:
+            raise ImageRejected(
+                f"Анимированное изображение больше {max_side}px по стороне.")
+        image.save(output, image_format, save_all=True)
+    else:
+        image.load()
+        # Поворот из EXIF применяем к пикселям: сам EXIF не сохраняется
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side))
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(output, image_format, quality=90, optimize=True)
+    return output.getvalue(), image_format
+
+
+def _process(data, max_pixels, max_side, timeout):
+    """
+    Выполняется в процессе пула: проверяет картинку и перекодирует её.
+    Возвращает (данные, формат) или бросает ImageRejected.
+    """
+    from PIL import Image
+
+    signal.signal(signal.SIGALRM, _on_alarm)
+    signal.alarm(timeout)
+    try:
+        return _reencode(_open(data, max_pixels), max_side)
+    except _JobTimeout:
+        raise ImageRejected("Изображение обрабатывалось слишком долго.")
+    except MemoryError:
+        raise ImageRejected("Для обработки изображения не хватило памяти.")
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        # Заголовок прочитан, а пиксели - нет: файл обрезан или повреждён
+        raise ImageRejected(INVALID_IMAGE)
+    finally:
+        signal.alarm(0)
+
+
+_pool = None
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn: веб-процесс многопоточный, fork унаследовал бы его потоки
+        # и открытые соединения
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.POST_IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(settings.POST_IMAGE_MEMORY_LIMIT,))
+    return _pool
+
+
+def _reset_pool():
+    global _pool
+    if _pool is not None:
+        # Публичного способа остановить зависший процесс у пула нет
+        for process in list((_pool._processes or {}).values()):
+            process.terminate()
+        _pool.shutdown(wait=False)
+        _pool = None
+
+
+def normalize(upload):
+    """
+    Проверяет загруженный файл в пуле процессов и возвращает ContentFile
+    с перекодированной картинкой под прежним именем (расширение - по
+    фактическому формату). Бросает ImageRejected.
+    """
+    # Файл целиком читается в память воркера: размер проверяется до этого
+    if upload.size > settings.POST_IMAGE_MAX_BYTES:
+        raise ImageRejected(
+            "Файл слишком большой: не больше "
+            f"{filesizeformat(settings.POST_IMAGE_MAX_BYTES)}.")
+    timeout = settings.POST_IMAGE_TIMEOUT
+    future = _get_pool().submit(
+        _process, upload.read(), settings.POST_IMAGE_MAX_PIXELS,
+        settings.POST_IMAGE_MAX_SIDE, timeout)
+    try:
+        # Основной лимит - SIGALRM в самом процессе; здесь - запас на
+        # случай, если задача застряла в коде, который сигнал не прерывает
+        data, image_format = future.result(timeout=timeout + 5)
+    except FutureTimeoutError:
+        _reset_pool()
+        raise ImageRejected("Изображение обрабатывалось слишком долго.")
+    except BrokenProcessPool:
+        # Процесс пула убит (например, OOM killer): пул пересоздаётся
+        _reset_pool()
+        raise ImageRejected("Не удалось обработать изображение.")
+    root = os.path.splitext(os.path.basename(upload.name))[0]
+    return ContentFile(data, name=f"{root}.{FORMATS[image_format]}")
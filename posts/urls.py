@@ -9,6 +9,7 @@ urlpatterns = [
     path("follow/", views.follow_index, name="follow_index"),
     path("group/<slug:slug>/", views.group_posts, name="group-detail"),
     path("new/", views.new_post, name="new-post"),
+    path("search/", views.search, name="search"),
     path("<str:username>/", views.profile, name="profile"),
     path("<str:username>/<int:post_id>/", views.post_view, name="post"),
     path("<str:username>/<int:post_id>/edit/",
@@ -1,30 +1,56 @@
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, redirect, render
 
+from . import page_cache, shards, stats, thumbnails
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .models import Follow, Group, User
+from .paginator import POSTS_PER_PAGE
+from .search import SearchPaginator
+from .timeline import FollowFeedPaginator
 
 
+@page_cache.cache_anonymous_page(page_cache.FEED)
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, 10)
-    # Из URL извлекаем номер запрошенной страницы - это значение параметра page
-    page_number = request.GET.get("page")
-    # Получаем набор записей для страницы с запрошенным номером
-    page = paginator.get_page(page_number)
+    # Страница ленты определяется курсором ?after= / ?before= из URL и
+    # собирается со всех шардов
+    page = shards.feed_page(request)
+    thumbnails.attach(page)
     return render(request, "posts/index.html", {"page": page, })
 
 
+@page_cache.cache_anonymous_page(page_cache.FEED)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    page = shards.feed_page(request, group=group)
+    thumbnails.attach(page)
     return render(request, "posts/group.html", {"group": group, "page": page})
 
 
+def search(request):
+    # Полнотекстовый поиск: ?q= и необязательные фильтры ?group= и ?author=
+    query = request.GET.get("q", "").strip()
+    group = author = None
+    if request.GET.get("group"):
+        group = get_object_or_404(Group, slug=request.GET["group"])
+    if request.GET.get("author"):
+        author = get_object_or_404(User, username=request.GET["author"])
+    paginator = SearchPaginator(query, POSTS_PER_PAGE, group=group,
+                                author=author)
+    page = paginator.get_page(request.GET.get("after"),
+                              request.GET.get("before"))
+    thumbnails.attach(page)
+    # Параметры поиска сохраняются в ссылках навигации
+    params = request.GET.copy()
+    params.pop("after", None)
+    params.pop("before", None)
+    return render(request, "posts/search.html",
+                  {"query": query,
+                   "group": group,
+                   "author": author,
+                   "page": page,
+                   "params": params.urlencode()})
+
+
 @login_required
 def new_post(request):
     form = PostForm(request.POST or None)
@@ -36,63 +62,68 @@ def new_post(request):
     return render(request, "posts/new_post.html", {"form": form})
 
 
+@page_cache.cache_anonymous_page(page_cache.FEED, page_cache.user_tag)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    post_count = post_list.count()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    author = get_object_or_404(User.objects.select_related("stats"),
+                               username=username)
+    # Счётчики берём из денормализованной строки вместо трёх COUNT
+    author_stats = stats.get(author)
+    # Посты из шарда автора, а за границей архива - и из архива
+    page = shards.feed_page(request, author=author)
+    thumbnails.attach(page)
     if request.user.username:
         following = Follow.objects.filter(user=request.user,
                                           author=author).exists()
     else:
         following = False
-    followers = author.following.all().count()
-    followings = author.follower.all().count()
     return render(
         request,
         "posts/profile.html",
         {"author": author,
          "page": page,
-         "post_count": post_count,
+         "post_count": author_stats.posts,
          "following": following,
-         "followers": followers,
-         "followings": followings}
+         "followers": author_stats.followers,
+         "followings": author_stats.followings}
     )
 
 
+@page_cache.cache_anonymous_page(page_cache.FEED, page_cache.user_tag)
 def post_view(request, username, post_id):
-    post = get_object_or_404(Post, id=post_id, author__username=username)
+    # Автор - из основной базы, пост - из шарда автора или из архива
+    post = shards.get_author_post_or_404(username, post_id)
     form = CommentForm()
     author = post.author
+    author_stats = stats.get(author)
     comments = post.comments.all()
-    post_list = author.posts.all()
-    post_count = post_list.count()
+    if post._state.db in shards.remote_databases():
+        # Авторы комментариев из шарда или архива - отдельным запросом к
+        # основной базе
+        comments = comments.prefetch_related("author")
+    else:
+        comments = comments.select_related("author")
     if request.user.username:
         following = Follow.objects.filter(user=request.user,
                                           author=author).exists()
     else:
         following = False
-    followers = author.following.all().count()
-    followings = author.follower.all().count()
     return render(
         request,
         "posts/post.html",
         {"author": author,
          "form": form,
          "post": post,
-         "post_count": post_count,
+         "post_count": author_stats.posts,
          "comments": comments,
          "following": following,
-         "followers": followers,
-         "followings": followings})
+         "followers": author_stats.followers,
+         "followings": author_stats.followings})
 
 
 @login_required
 def post_edit(request, username, post_id):
     # Запрещаем другим авторам попасть на страницу редактирования
-    editable_post = get_object_or_404(Post, id=post_id)
+    editable_post = shards.get_post_or_404(post_id)
     if request.user != editable_post.author:
         return redirect("posts:post", username=username, post_id=post_id)
     form = PostForm(
@@ -100,7 +131,12 @@ def post_edit(request, username, post_id):
         files=request.FILES or None,
         instance=editable_post)
     if request.method == "POST" and form.is_valid():
-        form.save()
+        post = form.save(commit=False)
+        # Пишем только поля формы: comment_count, прочитанный в начале
+        # запроса, мог устареть, пока обрабатывалась картинка
+        post.save(update_fields=[*form._meta.fields, "modified"])
+        if "image" in form.changed_data:
+            thumbnails.schedule(post)
         return redirect("posts:post", username=username, post_id=post_id)
     return render(
         request,
@@ -116,6 +152,8 @@ def new_post(request):
         new_post = form.save(commit=False)
         new_post.author = request.user
         new_post.save()
+        if new_post.image:
+            thumbnails.schedule(new_post)
         return redirect("posts:index")
     return render(
         request,
@@ -141,7 +179,7 @@ def server_error(request):
 @login_required
 def add_comment(request, username, post_id):
     form = CommentForm(request.POST or None)
-    post = get_object_or_404(Post, id=post_id)
+    post = shards.get_post_or_404(post_id)
     comments = post.comments.all()
     author = post.author
     if request.method == "POST" and form.is_valid():
@@ -160,17 +198,12 @@ def add_comment(request, username, post_id):
 
 @login_required
 def follow_index(request):
-    # информация о текущем пользователе доступна в переменной request.user
-    user = get_object_or_404(User, username=request.user)
-    # фильтруем посты по принадлежности избранным авторам и сортируем
-    post_list = Post.objects.filter(
-        author__following__user=user).order_by("-pub_date")
-    paginator = Paginator(post_list, 10)
-    # Из URL извлекаем номер запрошенной страницы - это значение параметра page
-    page_number = request.GET.get("page")
-    # Получаем набор записей для страницы с запрошенным номером
-    page = paginator.get_page(page_number)
-
+    # Лента подписок: материализованная лента пользователя плюс посты
+    # авторов с большой аудиторией, подмешанные при чтении
+    paginator = FollowFeedPaginator(request.user, POSTS_PER_PAGE)
+    page = paginator.get_page(request.GET.get("after"),
+                              request.GET.get("before"))
+    thumbnails.attach(page)
     return render(request, "posts/follow.html", {"page": page})
 
 
@@ -1,4 +1,14 @@
+import pytest
+
 pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(scope='session', autouse=True)
+def temp_files():
+    """Кэш и метрики тестов - во временном каталоге, а не в BASE_DIR."""
+    from yatube.testing import temp_files
+    with temp_files():
+        yield
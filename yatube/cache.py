@@ -0,0 +1,210 @@
+"""
+Кэш в файле SQLite, общий для всех процессов на одной машине.
+
+LocMemCache живёт внутри процесса: при нескольких воркерах gunicorn каждый
+строит одни и те же фрагменты заново, а сброс ключа в одном воркере не
+доходит до остальных. Здесь все процессы работают с одним файлом в режиме
+WAL: читатели не блокируют писателя, а incr() и add() выполняются одной
+атомарной командой SQL, поэтому годятся для счётчиков и блокировок.
+"""
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .timing import count_cache
+
+# Доля вызовов set(), после которых проверяется переполнение кэша
+CULL_PROBABILITY = 0.01
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+"""
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        options = params.get("OPTIONS", {})
+        self._busy_timeout = float(options.get("BUSY_TIMEOUT", 5))
+        self._local = threading.local()
+
+    def _connection(self):
+        # Соединение своё у каждого потока и каждого процесса: после fork()
+        # унаследованным соединением SQLite пользоваться нельзя
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self._path,
+                                         timeout=self._busy_timeout,
+                                         isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def _encode(value):
+        # Целые числа хранятся как INTEGER, чтобы incr() считал в SQL
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _decode(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        cursor = self._connection().execute(
+            "INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value, "
+            "expires = excluded.expires "
+            "WHERE cache.expires IS NOT NULL AND cache.expires <= ?",
+            (key, self._encode(value), self.get_backend_timeout(timeout),
+             time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        row = self._connection().execute(
+            "SELECT value FROM cache WHERE key = ? "
+            "AND (expires IS NULL OR expires > ?)",
+            (key, time.time()),
+        ).fetchone()
+        if row is None:
+            count_cache(0, 1)
+            return default
+        count_cache(1, 0)
+        return self._decode(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        placeholders = ", ".join("?" * len(keys))
+        rows = self._connection().execute(
+            f"SELECT key, value FROM cache WHERE key IN ({placeholders}) "
+            "AND (expires IS NULL OR expires > ?)",
+            (*keys, time.time()),
+        )
+        found = {keys[key]: self._decode(value) for key, value in rows}
+        count_cache(len(found), len(keys) - len(found))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = [(self._key(key, version), self._encode(value), expires)
+                for key, value in data.items()]
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, expires) "
+                "VALUES (?, ?, ?)", rows)
+        if random.random() < CULL_PROBABILITY:
+            self._cull()
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        cursor = self._connection().execute(
+            "UPDATE cache SET expires = ? WHERE key = ? "
+            "AND (expires IS NULL OR expires > ?)",
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        connection = self._connection()
+        with connection:
+            # BEGIN IMMEDIATE сразу берёт блокировку на запись: между
+            # UPDATE и SELECT значение не изменит другой процесс
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute(
+                "UPDATE cache SET value = value + ? WHERE key = ? "
+                "AND typeof(value) = 'integer' "
+                "AND (expires IS NULL OR expires > ?)",
+                (delta, key, time.time()),
+            )
+            row = connection.execute(
+                "SELECT value FROM cache WHERE key = ? "
+                "AND (expires IS NULL OR expires > ?)",
+                (key, time.time()),
+            ).fetchone()
+        if row is None:
+            raise ValueError("Key '%s' not found" % key)
+        if not isinstance(row[0], int):
+            raise TypeError("Value of key '%s' is not an integer" % key)
+        return row[0]
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        row = self._connection().execute(
+            "SELECT 1 FROM cache WHERE key = ? "
+            "AND (expires IS NULL OR expires > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        if keys:
+            placeholders = ", ".join("?" * len(keys))
+            self._connection().execute(
+                f"DELETE FROM cache WHERE key IN ({placeholders})", keys)
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache")
+
+    def _cull(self):
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("DELETE FROM cache WHERE expires <= ?",
+                               (time.time(),))
+            count = connection.execute(
+                "SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count > self._max_entries and self._cull_frequency:
+                # Как и встроенные бэкенды, удаляем 1/CULL_FREQUENCY
+                # записей - в первую очередь те, что истекут раньше
+                connection.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache "
+                    "ORDER BY expires IS NULL, expires LIMIT ?)",
+                    (count // self._cull_frequency,),
+                )
+
+    def close(self, **kwargs):
+        # Соединения постоянные: Django вызывает close() после каждого
+        # запроса, а переоткрывать файл и заново читать схему дорого
+        pass
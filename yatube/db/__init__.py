@@ -0,0 +1,15 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def separate_alias(alias):
+    """
+    Алиас отдельной от основной базы (реплики, архива) или None, если он
+    не задан, не описан в DATABASES или указывает на тот же файл, что и
+    основная база: так в тестах выглядит зеркало (TEST MIRROR).
+    """
+    if alias is None or alias not in connections.databases:
+        return None
+    if (connections.databases[alias]["NAME"]
+            == connections.databases[DEFAULT_DB_ALIAS]["NAME"]):
+        return None
+    return alias
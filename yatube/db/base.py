@@ -0,0 +1,46 @@
+"""
+Бэкенд SQLite для продакшена: ENGINE "yatube.db".
+
+Это django.db.backends.sqlite3 с настройкой каждого нового соединения.
+- WAL: читатели не ждут писателя, а писатель - читателей; при
+  synchronous=NORMAL fsync делается только на контрольных точках.
+- mmap_size и cache_size держат горячие страницы индексов в памяти
+  процесса, busy_timeout заставляет ждать блокировку, а не падать сразу
+  с "database is locked".
+- Транзакции atomic() начинаются с BEGIN IMMEDIATE: блокировка на запись
+  берётся сразу. С обычным BEGIN транзакция, которая сначала читала, при
+  первой записи может получить SQLITE_BUSY без ожидания busy_timeout.
+
+PRAGMA по умолчанию - в PRAGMAS, их можно переопределить в
+DATABASES[...]["OPTIONS"]["pragmas"]; режим начала транзакции - в
+OPTIONS["transaction_mode"]. Соединения держатся открытыми между
+запросами через CONN_MAX_AGE.
+"""
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "mmap_size": 256 * 1024 * 1024,
+    # Отрицательное значение - в килобайтах: 64 МБ на соединение
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = {**PRAGMAS, **params.pop("pragmas", {})}
+        self.transaction_mode = params.pop("transaction_mode", "IMMEDIATE")
+        return params
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            connection.execute(f"PRAGMA {name} = {value}")
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f"BEGIN {self.transaction_mode}")
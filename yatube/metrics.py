@@ -0,0 +1,227 @@
+"""
+Метрики запросов в формате Prometheus по адресу /metrics.
+
+Для каждого имени URL из settings.METRICS_URLCONFS (остальные адреса
+собираются под именем "other") считаются гистограмма времени ответа,
+ответы по кодам статуса, SQL-запросы и попадания в кэш. Данные снимает
+TimingMiddleware (yatube.timing).
+
+Процессов-воркеров несколько, а внешнего сервиса нет, поэтому счётчики
+складываются в общий файл SQLite (settings.METRICS_PATH), как и кэш в
+yatube.cache. Чтобы не писать в файл на каждый запрос, процесс копит
+приращения в памяти и сбрасывает их не чаще раза в
+METRICS_FLUSH_INTERVAL секунд, а также перед отдачей /metrics. Ошибка
+записи в файл не должна ронять уже обработанный запрос: она пишется в
+лог, а приращения остаются в памяти до следующего сброса.
+
+/metrics открыт только адресам из METRICS_ALLOWED_IPS (по умолчанию -
+никому). Адрес берётся из REMOTE_ADDR: за обратным прокси на той же
+машине у всех посетителей он 127.0.0.1, поэтому локальные адреса можно
+разрешать, только если прокси не пропускает /metrics наружу.
+"""
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from importlib import import_module
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.urls import URLPattern, URLResolver
+
+logger = logging.getLogger(__name__)
+
+# Верхние границы корзин гистограммы времени ответа, с
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+OTHER = "other"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics (
+    name TEXT NOT NULL,
+    view TEXT NOT NULL,
+    label TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, view, label)
+) WITHOUT ROWID;
+"""
+
+HELP = {
+    "yatube_http_request_duration_seconds": (
+        "histogram", "Время ответа по имени URL"),
+    "yatube_http_responses_total": (
+        "counter", "Ответы по имени URL и коду статуса"),
+    "yatube_db_queries_total": (
+        "counter", "SQL-запросы по имени URL"),
+    "yatube_cache_requests_total": (
+        "counter", "Обращения к кэшу по имени URL: hit или miss"),
+}
+
+_lock = threading.Lock()
+_pending = Counter()
+_last_flush = time.monotonic()
+_local = threading.local()
+_views = None
+
+
+def _connection():
+    # Как в yatube.cache: соединение своё у потока и процесса
+    path = settings.METRICS_PATH
+    connection = getattr(_local, "connection", None)
+    if (connection is None or _local.pid != os.getpid()
+            or _local.path != path):
+        connection = sqlite3.connect(path, timeout=5, isolation_level=None,
+                                     check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(SCHEMA)
+        _local.connection = connection
+        _local.pid = os.getpid()
+        _local.path = path
+    return connection
+
+
+def _names(patterns, namespace=""):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            prefix = namespace
+            if pattern.namespace:
+                prefix = f"{namespace}{pattern.namespace}:"
+            yield from _names(pattern.url_patterns, prefix)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield namespace + pattern.name
+
+
+def tracked_views():
+    """Имена URL, у которых метрики свои, например "posts:index"."""
+    global _views
+    if _views is None:
+        views = set()
+        for urlconf in settings.METRICS_URLCONFS:
+            module = import_module(urlconf)
+            app_name = getattr(module, "app_name", None)
+            views.update(_names(module.urlpatterns,
+                                f"{app_name}:" if app_name else ""))
+        _views = frozenset(views)
+    return _views
+
+
+def observe(request, response, duration, timing):
+    """Учитывает завершённый запрос; timing - yatube.timing.RequestTiming."""
+    match = request.resolver_match
+    view = match.view_name if match else None
+    if view not in tracked_views():
+        view = OTHER
+    bucket = bisect_left(LATENCY_BUCKETS, duration)
+    le = (str(LATENCY_BUCKETS[bucket]) if bucket < len(LATENCY_BUCKETS)
+          else "+Inf")
+    duration_name = "yatube_http_request_duration_seconds"
+    with _lock:
+        _pending[(duration_name + "_bucket", view, le)] += 1
+        _pending[(duration_name + "_sum", view, "")] += duration
+        _pending[(duration_name + "_count", view, "")] += 1
+        _pending[("yatube_http_responses_total", view,
+                  str(response.status_code))] += 1
+        _pending[("yatube_db_queries_total", view, "")] += timing.queries
+        _pending[("yatube_cache_requests_total", view, "hit")] += (
+            timing.cache_hits)
+        _pending[("yatube_cache_requests_total", view, "miss")] += (
+            timing.cache_misses)
+        since_flush = time.monotonic() - _last_flush
+    if since_flush >= settings.METRICS_FLUSH_INTERVAL:
+        try:
+            flush()
+        except Exception:
+            # Страница уже готова: метрики не должны превращать её в 500
+            logger.exception("Не удалось записать метрики")
+
+
+def flush():
+    """Дописывает накопленные процессом приращения в общий файл."""
+    global _last_flush
+    with _lock:
+        rows = [(*key, value) for key, value in _pending.items() if value]
+        _pending.clear()
+        _last_flush = time.monotonic()
+    if not rows:
+        return
+    try:
+        connection = _connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany(
+                "INSERT INTO metrics (name, view, label, value) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT (name, view, label) "
+                "DO UPDATE SET value = value + excluded.value", rows)
+    except Exception:
+        # Транзакция откатилась: возвращаем приращения до следующего раза
+        with _lock:
+            for name, view, label, value in rows:
+                _pending[(name, view, label)] += value
+        raise
+
+
+atexit.register(flush)
+
+
+def _format(value):
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def _histogram(view, values):
+    """Корзины хранятся по отдельности; Prometheus ждёт нарастающие."""
+    lines = []
+    total = 0
+    for le in [*map(str, LATENCY_BUCKETS), "+Inf"]:
+        total += values.get(("_bucket", le), 0)
+        lines.append(f"yatube_http_request_duration_seconds_bucket"
+                     f'{{view="{view}",le="{le}"}} {_format(total)}')
+    for suffix in ("_sum", "_count"):
+        value = _format(values.get((suffix, ""), 0))
+        lines.append(f"yatube_http_request_duration_seconds{suffix}"
+                     f'{{view="{view}"}} {value}')
+    return lines
+
+
+def render():
+    """Все метрики в текстовом формате Prometheus."""
+    flush()
+    rows = _connection().execute(
+        "SELECT name, view, label, value FROM metrics "
+        "ORDER BY name, view, label").fetchall()
+    histograms = defaultdict(dict)
+    counters = defaultdict(list)
+    histogram_name = "yatube_http_request_duration_seconds"
+    for name, view, label, value in rows:
+        if name.startswith(histogram_name):
+            suffix = name[len(histogram_name):]
+            histograms[view][(suffix, label)] = value
+        else:
+            counters[name].append((view, label, value))
+    label_names = {"yatube_http_responses_total": "status",
+                   "yatube_cache_requests_total": "result"}
+    lines = []
+    for name, (kind, description) in HELP.items():
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        if kind == "histogram":
+            for view in sorted(histograms):
+                lines += _histogram(view, histograms[view])
+            continue
+        for view, label, value in counters[name]:
+            labels = f'view="{view}"'
+            if name in label_names:
+                labels += f',{label_names[name]}="{label}"'
+            lines.append(f"{name}{{{labels}}} {_format(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    """Отдаёт метрики только адресам из settings.METRICS_ALLOWED_IPS."""
+    if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(render(),
+                        content_type="text/plain; version=0.0.4; "
+                                     "charset=utf-8")
@@ -0,0 +1,132 @@
+"""
+Чтение лент и профилей с реплики базы.
+
+ReplicaRouter отправляет чтения страниц из REPLICA_VIEWS на реплику
+(settings.REPLICA_DATABASE), всё остальное - в основную базу. Реплика -
+копия файла SQLite, которую обновляет команда sync_replica, поэтому она
+отстаёт от основной базы на интервал синхронизации.
+
+Чтобы пользователь не потерял из виду собственную запись, ReplicaMiddleware
+после запроса, который писал в базу (POST в new_post, post_edit,
+add_comment, переход по profile_follow, вход на сайт), ставит cookie на
+REPLICA_PIN_SECONDS: пока она есть, все чтения этого посетителя идут в
+основную базу. Реплику со снимком старше REPLICA_PIN_SECONDS (например,
+sync_replica остановлена) не используем вовсе - так к моменту, когда
+cookie истекает, запись уже есть на реплике.
+
+Вне запросов (команды, воркер jobs) чтения всегда идут в основную базу.
+"""
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .db import separate_alias
+
+# Время снимка основной базы, с которого сделана реплика
+SYNCED_KEY = "replica:synced_at"
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Реплика для чтений текущего запроса (по потокам); вне запроса - None
+_state = threading.local()
+
+
+def replica_alias():
+    """Алиас реплики или None, если реплика не настроена."""
+    return separate_alias(settings.REPLICA_DATABASE)
+
+
+def is_fresh():
+    """Снимок на реплике новее REPLICA_PIN_SECONDS."""
+    synced_at = cache.get(SYNCED_KEY)
+    return (synced_at is not None
+            and time.time() - synced_at < settings.REPLICA_PIN_SECONDS)
+
+
+def sync(alias):
+    """
+    Копирует основную базу в файл реплики через backup API SQLite и
+    запоминает время снимка. Читатели реплики в режиме WAL до конца
+    копирования видят прежний снимок.
+    """
+    source = connections[DEFAULT_DB_ALIAS]
+    source.ensure_connection()
+    target = sqlite3.connect(connections.databases[alias]["NAME"])
+    try:
+        # Снимок начинается после этой отметки и содержит всё, что
+        # записано до неё
+        synced_at = time.time()
+        source.connection.backup(target)
+    finally:
+        target.close()
+    cache.set(SYNCED_KEY, synced_at, None)
+    return synced_at
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = getattr(_state, "replica", None)
+        if alias is None:
+            return None
+        # После записи и внутри транзакции читаем то, что записали
+        if _state.wrote or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        instance = hints.get("instance")
+        if (instance is not None
+                and instance._state.db == settings.REPLICA_DATABASE):
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, settings.REPLICA_DATABASE}
+        if {obj1._state.db, obj2._state.db} <= aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схему реплика получает вместе с копией файла
+        if db == settings.REPLICA_DATABASE:
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    Включает чтение с реплики для безопасных запросов к REPLICA_VIEWS и
+    закрепляет за основной базой посетителя, который только что писал.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.replica = None
+        _state.wrote = False
+        try:
+            response = self.get_response(request)
+            wrote = _state.wrote
+        finally:
+            _state.replica = None
+            _state.wrote = False
+        if wrote or request.method not in SAFE_METHODS:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, "1",
+                max_age=settings.REPLICA_PIN_SECONDS, httponly=True,
+                samesite="Lax")
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (request.method in SAFE_METHODS
+                and request.resolver_match.view_name in settings.REPLICA_VIEWS
+                and settings.REPLICA_PIN_COOKIE not in request.COOKIES):
+            alias = replica_alias()
+            if alias is not None and is_fresh():
+                _state.replica = alias
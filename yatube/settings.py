@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'about',
     'users',
     'posts',
+    'jobs',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -49,6 +50,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'yatube.timing.TimingMiddleware',
+    'yatube.replica.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,6 +59,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'posts.middleware.ThumbnailLookupsMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -64,7 +68,8 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMPLATES_DIR_POSTS_APP = os.path.join(BASE_DIR, "posts/templates/posts")
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с учётом времени отрисовки для Server-Timing
+        'BACKEND': 'yatube.timing.TimedTemplates',
         'DIRS': [TEMPLATES_DIR, TEMPLATES_DIR_POSTS_APP, ],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -85,12 +90,55 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# yatube.db - SQLite с WAL, mmap и BEGIN IMMEDIATE (см. yatube/db/base.py).
+# Соединения постоянные: открыть файл и настроить PRAGMA на каждый запрос
+# дороже самого запроса к ленте
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'yatube.db',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'CONN_MAX_AGE': None,
+    },
+    # Копия основной базы для чтения лент и профилей (yatube.replica);
+    # обновляет её команда sync_replica
+    'replica': {
+        'ENGINE': 'yatube.db',
+        'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+        'CONN_MAX_AGE': None,
+        'TEST': {'MIRROR': 'default'},
+    },
 }
+DATABASE_ROUTERS = [
+    'posts.shards.ShardRouter',
+    'yatube.replica.ReplicaRouter',
+]
+
+# Базы, по которым посты и комментарии распределены по авторам
+# (posts.shards). Первый шард - основная база default, где живут и все
+# остальные таблицы; новые шарды подключаются командами
+# migrate --database <шард> и reshard
+POST_SHARDS = ('default',)
+
+# Архив старых постов (posts.archive): команда archive_posts переносит
+# посты старше POST_ARCHIVE_DAYS дней с комментариями из шардов в базу
+# POST_ARCHIVE_DATABASE. Архив выключен; чтобы включить, добавьте базу в
+# DATABASES, выполните migrate --database <архив> и укажите её здесь
+POST_ARCHIVE_DATABASE = None
+POST_ARCHIVE_DAYS = 365
+
+# Страницы, которые читают с реплики, если посетитель не писал в базу
+# последние REPLICA_PIN_SECONDS (об этом помнит cookie REPLICA_PIN_COOKIE).
+# Реплика со снимком старше REPLICA_PIN_SECONDS не используется
+REPLICA_DATABASE = 'replica'
+REPLICA_VIEWS = (
+    'posts:index',
+    'posts:group-detail',
+    'posts:follow_index',
+    'posts:profile',
+    'posts:post',
+)
+REPLICA_PIN_COOKIE = 'pin_primary'
+REPLICA_PIN_SECONDS = 30
 
 
 # Password validation
@@ -144,8 +192,97 @@ EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 # указываем директорию, в которую будут складываться файлы писем
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
+# Лента подписок (fan-out on write): посты авторов, у которых подписчиков
+# больше порога, не раскладываются по лентам при публикации, а
+# подмешиваются при чтении из кэша последних FEED_RECENT_POSTS постов
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+FEED_RECENT_POSTS = 200
+# Сколько подписчиков обходить прямо в запросе публикации и сколько
+# постов нового автора сразу класть в ленту при подписке; остальное
+# делает фоновая очередь (jobs)
+FEED_FANOUT_INLINE_FOLLOWERS = 500
+FEED_BACKFILL_INLINE_POSTS = 100
+
+# Сколько секунд хранить страницы для анонимных посетителей; изменения
+# постов, комментариев и подписок сбрасывают их раньше
+PAGE_CACHE_TIMEOUT = 600
+
+# Ширины вариантов картинки поста для srcset; каждая строится в WebP и JPEG
+POST_IMAGE_WIDTHS = (320, 640, 960, 1920)
+
+# Загруженные картинки проверяются в пуле процессов: файл не больше
+# POST_IMAGE_MAX_BYTES байт, не больше POST_IMAGE_MAX_PIXELS пикселей, оригинал уменьшается до POST_IMAGE_MAX_SIDE
+# по большей стороне; на задачу - POST_IMAGE_TIMEOUT секунд, на процесс -
+# POST_IMAGE_MEMORY_LIMIT байт адресного пространства
+POST_IMAGE_WORKERS = 2
+POST_IMAGE_MAX_BYTES = 20 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 40_000_000
+POST_IMAGE_MAX_SIDE = 2560
+POST_IMAGE_TIMEOUT = 10
+POST_IMAGE_MEMORY_LIMIT = 1024 * 1024 * 1024
+
+# Общий для всех воркеров кэш в файле SQLite (режим WAL)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'yatube.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
     }
 }
+
+# Тесты переносят файлы кэша и метрик во временный каталог
+TEST_RUNNER = 'yatube.testing.TestRunner'
+
+# Фоновая очередь задач (приложение jobs, команда runworker). JOBS_EAGER
+# выполняет задачи сразу при постановке - для отладки без воркера
+JOBS_EAGER = False
+JOBS_MAX_ATTEMPTS = 5
+# Пауза перед первой повторной попыткой, с; дальше удваивается
+JOBS_RETRY_DELAY = 10
+# Задача, взятая воркером и не завершённая за это время, снова в очереди
+JOBS_LOCK_TIMEOUT = 600
+# Сколько дней хранить выполненные задачи (и их ключи идемпотентности)
+JOBS_KEEP_FINISHED = 7
+
+# Учёт стоимости запросов (yatube.timing): заголовок Server-Timing и строка
+# JSON на каждый запрос в лог "yatube.requests". Запросы медленнее
+# REQUEST_SLOW_MS пишутся с уровнем WARNING, остальные - INFO; какие из них
+# выводить, задаёт переменная окружения REQUEST_LOG_LEVEL
+REQUEST_SLOW_MS = 500
+
+# Метрики Prometheus по адресу /metrics (yatube.metrics): свои ряды у имён
+# URL из METRICS_URLCONFS, счётчики всех процессов копятся в METRICS_PATH
+METRICS_PATH = os.path.join(BASE_DIR, 'metrics.sqlite3')
+METRICS_URLCONFS = ('posts.urls', 'users.urls', 'about.urls')
+# Как часто процесс дописывает накопленное в общий файл, с
+METRICS_FLUSH_INTERVAL = 5
+# С каких адресов можно забирать /metrics; по умолчанию - ни с каких.
+# Проверяется REMOTE_ADDR: за обратным прокси на этой же машине у всех
+# посетителей адрес 127.0.0.1, так что ('127.0.0.1', '::1') можно указать,
+# только если прокси сам закрывает /metrics снаружи
+METRICS_ALLOWED_IPS = ()
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'requests': {
+            'format': '%(asctime)s %(levelname)s %(message)s',
+        },
+    },
+    'handlers': {
+        'requests': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'requests',
+        },
+    },
+    'loggers': {
+        'yatube.requests': {
+            'handlers': ['requests'],
+            'level': os.environ.get('REQUEST_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
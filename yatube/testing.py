@@ -0,0 +1,76 @@
+"""
+Окружение тестов. Кэш (yatube.cache.SQLiteCache) и метрики по умолчанию
+пишут в файлы в BASE_DIR; тесты получают свои копии во временном
+каталоге, чтобы не смешивать данные с запущенным сервером и не оставлять
+за собой файлов. Для manage.py test это делает TestRunner (TEST_RUNNER в
+настройках), для pytest - фикстура в tests/conftest.py.
+
+Там же temp_database - отдельная база SQLite на время теста для реплики,
+шардов и архива: их алиасы в тестах - зеркала основной базы.
+"""
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+from . import metrics
+
+
+@contextmanager
+def temp_files():
+    """Переносит файлы кэша и метрик во временный каталог."""
+    directory = tempfile.mkdtemp(prefix="yatube-test-")
+    caches = {
+        alias: {**options,
+                "LOCATION": os.path.join(directory, f"{alias}.sqlite3")}
+        if options["BACKEND"] == "yatube.cache.SQLiteCache" else options
+        for alias, options in settings.CACHES.items()
+    }
+    # override_settings сбрасывает уже созданные объекты кэша
+    with override_settings(
+            CACHES=caches,
+            METRICS_PATH=os.path.join(directory, "metrics.sqlite3")):
+        try:
+            yield directory
+        finally:
+            # Иначе накопленное сбросит atexit - уже в рабочий файл
+            metrics.flush()
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def temp_database(test, alias, migrate=False, **options):
+    """
+    Описывает на время теста test алиас alias - файл SQLite во временном
+    каталоге (ENGINE "yatube.db", параметры из options) - и возвращает
+    путь к файлу. С migrate=True в базе создаются таблицы.
+    """
+    directory = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+    path = os.path.join(directory, f"{alias}.sqlite3")
+    connections.databases[alias] = {
+        "ENGINE": "yatube.db", "NAME": path, "CONN_MAX_AGE": None,
+        **options}
+    test.addCleanup(connections.databases.pop, alias)
+    # Обёртка соединения запоминается в потоке: забываем её
+    test.addCleanup(connections.__delitem__, alias)
+    test.addCleanup(connections[alias].close)
+    if migrate:
+        call_command("migrate", database=alias, verbosity=0)
+    return path
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._temp_files = temp_files()
+        self._temp_files.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self._temp_files.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
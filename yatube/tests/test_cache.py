@@ -0,0 +1,85 @@
+# yatube/tests/test_cache.py
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from yatube.cache import SQLiteCache
+
+
+def _increment(location, times):
+    cache = SQLiteCache(location, {})
+    for _ in range(times):
+        cache.incr("counter")
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, "cache.sqlite3")
+        self.cache = SQLiteCache(self.location, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_set_get_delete(self):
+        self.cache.set("key", {"value": [1, 2]})
+        self.assertEqual(self.cache.get("key"), {"value": [1, 2]})
+        self.assertTrue(self.cache.has_key("key"))
+        self.cache.delete("key")
+        self.assertIsNone(self.cache.get("key"))
+        self.assertEqual(self.cache.get("key", "default"), "default")
+
+    def test_many(self):
+        self.cache.set_many({"a": 1, "b": "два"})
+        self.assertEqual(self.cache.get_many(["a", "b", "c"]),
+                         {"a": 1, "b": "два"})
+        self.cache.delete_many(["a", "b"])
+        self.assertEqual(self.cache.get_many(["a", "b"]), {})
+
+    def test_expiration(self):
+        self.cache.set("key", "value", 0.1)
+        self.cache.set("forever", "value", None)
+        time.sleep(0.2)
+        self.assertIsNone(self.cache.get("key"))
+        self.assertEqual(self.cache.get("forever"), "value")
+
+    def test_add_only_sets_missing_or_expired_keys(self):
+        self.assertTrue(self.cache.add("lock", "first"))
+        self.assertFalse(self.cache.add("lock", "second"))
+        self.assertEqual(self.cache.get("lock"), "first")
+        self.cache.set("lock", "stale", 0.1)
+        time.sleep(0.2)
+        self.assertTrue(self.cache.add("lock", "third"))
+        self.assertEqual(self.cache.get("lock"), "third")
+
+    def test_incr(self):
+        self.cache.set("counter", 1)
+        self.assertEqual(self.cache.incr("counter", 5), 6)
+        self.assertEqual(self.cache.decr("counter"), 5)
+        with self.assertRaises(ValueError):
+            self.cache.incr("missing")
+
+    def test_values_are_shared_between_processes(self):
+        """incr() атомарен, а значения видны всем процессам"""
+        self.cache.set("counter", 0)
+        processes = [
+            multiprocessing.get_context("fork").Process(
+                target=_increment, args=(self.location, 50))
+            for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(self.cache.get("counter"), 200)
+
+    def test_cull_keeps_cache_under_max_entries(self):
+        cache = SQLiteCache(self.location, {
+            "OPTIONS": {"MAX_ENTRIES": 10, "CULL_FREQUENCY": 2}})
+        cache.set_many({f"key{i}": i for i in range(20)})
+        cache._cull()
+        self.assertEqual(len(cache.get_many([f"key{i}" for i in range(20)])),
+                         10)
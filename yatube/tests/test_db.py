@@ -0,0 +1,44 @@
+# yatube/tests/test_db.py
+import sqlite3
+
+from django.db import connections, transaction
+from django.test import SimpleTestCase
+from yatube.testing import temp_database
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.path = temp_database(
+            self, "tuned", OPTIONS={"pragmas": {"cache_size": -1024}})
+        self.connection = connections["tuned"]
+
+    def pragma(self, name):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_new_connection_is_tuned(self):
+        self.assertEqual(self.pragma("journal_mode"), "wal")
+        # 1 - NORMAL
+        self.assertEqual(self.pragma("synchronous"), 1)
+        self.assertEqual(self.pragma("busy_timeout"), 5000)
+        self.assertEqual(self.pragma("mmap_size"), 256 * 1024 * 1024)
+        self.assertEqual(self.pragma("cache_size"), -1024)
+        self.assertEqual(self.pragma("foreign_keys"), 1)
+
+    def test_atomic_takes_write_lock_at_once(self):
+        self.connection.ensure_connection()
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        with transaction.atomic(using="tuned"):
+            with self.assertRaisesMessage(sqlite3.OperationalError,
+                                          "database is locked"):
+                other.execute("BEGIN IMMEDIATE")
+        other.execute("BEGIN IMMEDIATE")
+        other.rollback()
+
+    def test_connection_is_persistent(self):
+        self.connection.ensure_connection()
+        raw = self.connection.connection
+        self.connection.close_if_unusable_or_obsolete()
+        self.assertIs(self.connection.connection, raw)
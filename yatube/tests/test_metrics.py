@@ -0,0 +1,90 @@
+# yatube/tests/test_metrics.py
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from yatube import metrics
+
+
+def samples():
+    """Строки с числами из /metrics в виде {ряд: значение}."""
+    return {series: float(value)
+            for series, value in (line.rsplit(" ", 1)
+                                  for line in metrics.render().splitlines()
+                                  if not line.startswith("#"))}
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings = override_settings(
+            METRICS_PATH=os.path.join(directory, "metrics.sqlite3"),
+            METRICS_FLUSH_INTERVAL=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.before = samples()
+
+    def delta(self, series):
+        return samples().get(series, 0) - self.before.get(series, 0)
+
+    def test_requests_are_counted_per_view(self):
+        for _ in range(3):
+            self.client.get(reverse("posts:index"))
+        self.client.get(reverse("about:tech"))
+        self.assertEqual(self.delta(
+            'yatube_http_request_duration_seconds_count{view="posts:index"}'),
+            3)
+        self.assertEqual(self.delta(
+            'yatube_http_request_duration_seconds_bucket'
+            '{view="posts:index",le="+Inf"}'), 3)
+        self.assertEqual(self.delta(
+            'yatube_http_responses_total{view="about:tech",status="200"}'), 1)
+        self.assertGreater(self.delta(
+            'yatube_db_queries_total{view="posts:index"}'), 0)
+
+    def test_cache_hits_and_misses(self):
+        url = reverse("posts:index")
+        self.client.get(url)
+        hits = self.delta(
+            'yatube_cache_requests_total{view="posts:index",result="hit"}')
+        self.client.get(url)
+        # Вторую страницу анонимный посетитель получает из кэша
+        self.assertGreater(self.delta(
+            'yatube_cache_requests_total{view="posts:index",result="hit"}'),
+            hits)
+        self.assertGreater(self.delta(
+            'yatube_cache_requests_total{view="posts:index",result="miss"}'),
+            0)
+
+    def test_untracked_urls_are_grouped(self):
+        self.client.get("/no-such-user/no-such-post/")
+        self.assertEqual(self.delta(
+            'yatube_http_responses_total{view="other",status="404"}'), 1)
+
+    def test_closed_by_default(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+
+    @override_settings(METRICS_ALLOWED_IPS=("127.0.0.1",))
+    def test_only_allowed_addresses(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+        response = self.client.get("/metrics", REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 403)
+
+    def test_failed_write_keeps_counts(self):
+        url = reverse("about:tech")
+        series = 'yatube_http_responses_total{view="about:tech",status="200"}'
+        locked = sqlite3.OperationalError("database is locked")
+        with mock.patch.object(metrics, "_connection", side_effect=locked):
+            with self.assertLogs("yatube.metrics", "ERROR"):
+                response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # Приращение не потеряно: оно уходит в файл со следующим сбросом
+        self.client.get(url)
+        self.assertEqual(self.delta(series), 2)
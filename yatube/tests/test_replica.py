@@ -0,0 +1,74 @@
+# yatube/tests/test_replica.py
+import time
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+from posts.models import Follow, Post
+from yatube import replica
+from yatube.testing import temp_database
+
+User = get_user_model()
+
+
+@override_settings(REPLICA_DATABASE="replica_file")
+class ReplicaRouterTests(TransactionTestCase):
+    """
+    Реплика - отдельный файл; в тестах алиас replica только зеркало
+    основной базы, поэтому заводим свой.
+    """
+
+    def setUp(self):
+        temp_database(self, "replica_file")
+        cache.clear()
+        self.author = User.objects.create_user(username="author")
+        self.client = Client()
+        self.client.force_login(self.author)
+        self.url = reverse("posts:profile", args=["author"])
+        replica.sync("replica_file")
+        # Запись, которой на реплике ещё нет
+        self.post = Post.objects.create(text="Свежий пост",
+                                        author=self.author)
+
+    def test_feed_reads_go_to_replica(self):
+        response = self.client.get(self.url)
+        self.assertNotContains(response, "Свежий пост")
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        self.assertFalse(
+            Post.objects.using("replica_file").filter(pk=self.post.pk)
+            .exists())
+
+    def test_reads_outside_views_go_to_primary(self):
+        self.assertTrue(Post.objects.filter(pk=self.post.pk).exists())
+        # Страница не из REPLICA_VIEWS читает основную базу
+        response = self.client.get(
+            reverse("posts:post-edit", args=["author", self.post.pk]))
+        self.assertContains(response, "Свежий пост")
+
+    def test_write_pins_reads_to_primary(self):
+        response = self.client.post(reverse("posts:new-post"),
+                                    {"text": "Только что написал"})
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        response = self.client.get(self.url)
+        self.assertContains(response, "Только что написал")
+        self.assertContains(response, "Свежий пост")
+
+    def test_follow_link_pins_reads_to_primary(self):
+        User.objects.create_user(username="reader")
+        response = self.client.get(
+            reverse("posts:profile_follow", args=["reader"]))
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        self.assertTrue(Follow.objects.filter(author__username="reader")
+                        .exists())
+
+    def test_stale_replica_is_not_used(self):
+        cache.set(replica.SYNCED_KEY, time.time() - 60, None)
+        self.assertContains(self.client.get(self.url), "Свежий пост")
+
+    def test_sync_replica_command(self):
+        call_command("sync_replica", stdout=StringIO())
+        self.assertContains(self.client.get(self.url), "Свежий пост")
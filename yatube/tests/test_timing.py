@@ -0,0 +1,65 @@
+# yatube/tests/test_timing.py
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from posts.models import Post
+
+User = get_user_model()
+
+
+def server_timing(response):
+    """Заголовок Server-Timing в виде {метрика: (dur, desc)}."""
+    metrics = {}
+    for metric in response["Server-Timing"].split(", "):
+        name, *params = metric.split(";")
+        params = dict(param.split("=", 1) for param in params)
+        metrics[name] = (float(params.get("dur", 0)), params.get("desc"))
+    return metrics
+
+
+class TimingMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="author")
+        for number in range(3):
+            Post.objects.create(text=f"Пост {number}", author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("posts:profile", args=["author"])
+
+    def test_header_reports_queries_and_templates(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        metrics = server_timing(response)
+        self.assertEqual(metrics["db"][1], f'"{len(queries)} SQL"')
+        self.assertGreater(metrics["tpl"][0], 0)
+        self.assertGreaterEqual(metrics["db"][0], metrics["db-slowest"][0])
+        self.assertGreaterEqual(metrics["total"][0], metrics["tpl"][0])
+
+    def test_cached_page_skips_templates(self):
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertEqual(server_timing(response)["tpl"][0], 0)
+
+    def test_log_line_is_tagged_with_url_name(self):
+        client = Client()
+        client.force_login(self.author)
+        with self.assertLogs("yatube.requests", "INFO") as logs:
+            client.get(self.url)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["url"], "posts:profile")
+        self.assertEqual(record["status"], 200)
+        self.assertGreater(record["queries"], 0)
+        self.assertIn("SELECT", record["slowest_sql"])
+
+    @override_settings(REQUEST_SLOW_MS=0)
+    def test_slow_request_is_a_warning(self):
+        with self.assertLogs("yatube.requests", "INFO") as logs:
+            self.client.get(reverse("posts:index"))
+        self.assertEqual(logs.records[0].levelname, "WARNING")
@@ -0,0 +1,151 @@
+"""
+Сколько стоит запрос: SQL-запросы и отрисовка шаблонов.
+
+TimingMiddleware считает для каждого запроса число SQL-запросов, их общее
+время, самый медленный запрос, время отрисовки шаблонов и обращения к
+кэшу. Итог уходит в заголовок Server-Timing (его показывают инструменты
+разработчика браузера), строкой JSON в лог "yatube.requests" с именем URL
+вида "posts:profile" и в метрики /metrics (yatube.metrics). Учёт - это
+пара вызовов perf_counter() на запрос к БД и на шаблон, поэтому
+middleware можно держать включённым в продакшене.
+
+Время шаблонов считает бэкенд TimedTemplates из settings.TEMPLATES:
+сигнал template_rendered Django отправляет только в тестах.
+"""
+import json
+import logging
+import threading
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+from django.template.backends.django import Template as DjangoTemplate
+
+from . import metrics
+
+logger = logging.getLogger("yatube.requests")
+
+# Сколько символов самого медленного запроса писать в лог
+SQL_PREVIEW = 300
+
+# Учёт текущего запроса (по потокам); вне запроса - None
+_current = threading.local()
+
+
+class RequestTiming:
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_sql = ""
+        self.template_time = 0.0
+        self.rendering = False
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Обёртка connection.execute_wrapper вокруг каждого запроса к БД
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = perf_counter() - started
+            self.queries += 1
+            self.sql_time += duration
+            if duration > self.slowest_time:
+                self.slowest_time = duration
+                self.slowest_sql = sql
+
+    def header(self, total):
+        metrics = [
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.queries} SQL"',
+            f"db-slowest;dur={self.slowest_time * 1000:.1f}",
+            f"tpl;dur={self.template_time * 1000:.1f}",
+            f'cache;desc="{self.cache_hits} hit/{self.cache_misses} miss"',
+            f"total;dur={total * 1000:.1f}",
+        ]
+        return ", ".join(metrics)
+
+    def record(self, request, response, total):
+        match = request.resolver_match
+        return {
+            "url": match.view_name if match else None,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": round(total * 1000, 1),
+            "queries": self.queries,
+            "sql_ms": round(self.sql_time * 1000, 1),
+            "slowest_ms": round(self.slowest_time * 1000, 1),
+            "slowest_sql": self.slowest_sql[:SQL_PREVIEW],
+            "template_ms": round(self.template_time * 1000, 1),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+        }
+
+
+def count_cache(hits, misses):
+    """Учитывает обращения к кэшу; вызывается бэкендом yatube.cache."""
+    timing = getattr(_current, "timing", None)
+    if timing is not None:
+        timing.cache_hits += hits
+        timing.cache_misses += misses
+
+
+class Template(DjangoTemplate):
+    def render(self, context=None, request=None):
+        timing = getattr(_current, "timing", None)
+        # Вложенные render_to_string уже входят во время внешнего шаблона
+        if timing is None or timing.rendering:
+            return super().render(context, request)
+        timing.rendering = True
+        started = perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timing.template_time += perf_counter() - started
+            timing.rendering = False
+
+
+class TimedTemplates(DjangoTemplates):
+    """Бэкенд шаблонов Django, который учитывает время отрисовки."""
+
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
+
+
+class TimingMiddleware:
+    """
+    Добавляет к ответу заголовок Server-Timing и пишет строку в лог
+    "yatube.requests": уровень INFO, для запросов медленнее
+    REQUEST_SLOW_MS - WARNING.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = RequestTiming()
+        _current.timing = timing
+        started = perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timing))
+                response = self.get_response(request)
+        finally:
+            _current.timing = None
+        total = perf_counter() - started
+        response["Server-Timing"] = timing.header(total)
+        level = (logging.WARNING if total * 1000 >= settings.REQUEST_SLOW_MS
+                 else logging.INFO)
+        metrics.observe(request, response, total, timing)
+        if logger.isEnabledFor(level):
+            logger.log(level, json.dumps(
+                timing.record(request, response, total), ensure_ascii=False))
+        return response
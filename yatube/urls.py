@@ -20,6 +20,7 @@ from django.contrib import admin
 from django.urls import include, path
 
 from posts import views
+from yatube.metrics import metrics_view
 
 handler404 = "posts.views.page_not_found"
 handler500 = "posts.views.server_error"
@@ -27,6 +28,7 @@ handler500 = "posts.views.server_error"
 urlpatterns = [
     path("404", views.page_not_found),
     path("500", views.server_error),
+    path("metrics", metrics_view, name="metrics"),
     #  регистрация и авторизация
     path("auth/", include("users.urls")),
     path("admin/", admin.site.urls),